@@ -1,18 +1,17 @@
 # app.py (Versão Final com Novo Layout de Abas)
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import base64
+import time
 import pandas as pd
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import nltk
-from nltk.corpus import stopwords
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 from dotenv import load_dotenv
 from jose import jwt, JWTError
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 # --- CARREGAMENTO DE VARIÁVEIS DE AMBIENTE ---
 load_dotenv()
@@ -20,6 +19,11 @@ API_INTERNAL_URL = os.getenv("API_INTERNAL_URL", "http://localhost:8000")
 API_PUBLIC_URL   = os.getenv("API_PUBLIC_URL",   API_INTERNAL_URL)
 JWT_SECRET = os.getenv('JWT_SECRET', 'uma-chave-secreta-padrao-mude-isso')
 login_url = f"{API_PUBLIC_URL}/auth/login"
+ANALYSIS_TIMEOUT_S = 120
+# prazo pedido ao backend: termina (ou devolve o parcial) antes do timeout do cliente
+ANALYSIS_DEADLINE_S = ANALYSIS_TIMEOUT_S - 10
+# Resultados iguais (usuário, tópico, pergunta, modelo, filtros) são reaproveitados por este tempo
+RESULT_CACHE_TTL_S = int(os.getenv("RESULT_CACHE_TTL_S", "900"))
 
 # estado inicial p/ cota (uma única vez)
 if "rate_limit" not in st.session_state:
@@ -33,6 +37,137 @@ def _fmt_reset(reset_ts: int) -> str:
     except Exception:
         return "-"
 
+def _rate_limit_from_headers(headers) -> dict:
+    limit = headers.get("X-RateLimit-Limit")
+    remaining = headers.get("X-RateLimit-Remaining")
+    reset = headers.get("X-RateLimit-Reset")
+    return {
+        "limit": int(limit) if str(limit).isdigit() else None,
+        "remaining": int(remaining) if str(remaining).isdigit() else None,
+        "reset": int(reset) if str(reset).isdigit() else None,
+    }
+
+class AnalysisHTTPError(requests.HTTPError):
+    """Resposta de erro do /analyze, com os headers de cota já extraídos."""
+    def __init__(self, response: requests.Response):
+        super().__init__(f"{response.status_code} {response.reason}", response=response)
+        self.status_code = response.status_code
+        self.rate_limit = _rate_limit_from_headers(response.headers)
+
+class PartialAnalysis(Exception):
+    """Análise que estourou o prazo (fontes sem resposta): levantada para não entrar no cache."""
+    def __init__(self, out: dict):
+        super().__init__("análise parcial")
+        self.out = out
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Sessão HTTP única por processo: keep-alive e pool de conexões com o backend."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Workers para as análises em segundo plano (o script do Streamlit não fica bloqueado)."""
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix="analyze")
+
+@st.cache_data(ttl=RESULT_CACHE_TTL_S, max_entries=256, show_spinner=False)
+def fetch_analysis(user_id: str, topic: str, question: str, llm_model: str,
+                   post_limit: int, period_days: int, lang: str, min_engagement: int,
+                   _token: str) -> dict:
+    """
+    Chama o /analyze. Cacheado por usuário + parâmetros (o token fica fora da chave);
+    erros e resultados parciais levantam exceção e por isso nunca são cacheados.
+    """
+    payload = {
+        "topic": topic,
+        "question": question,
+        "llm_model": llm_model,
+        "post_limit": post_limit,
+        "min_engagement": min_engagement,
+        "lang": lang or None,
+        "since": (
+            (datetime.now(timezone.utc) - timedelta(days=period_days)).isoformat()
+            if period_days else None
+        ),
+        "deadline_s": ANALYSIS_DEADLINE_S,
+    }
+    headers = {"Authorization": f"Bearer {_token}"}
+    # ⚠️ use json=payload (não data=json.dumps), pois seu backend espera JSON
+    r = get_http_session().post(f"{API_INTERNAL_URL}/analyze", headers=headers, json=payload, timeout=ANALYSIS_TIMEOUT_S)
+    if not r.ok:
+        raise AnalysisHTTPError(r)
+    out = {"result": r.json(), "rate_limit": _rate_limit_from_headers(r.headers)}
+    if out["result"].get("partial"):
+        raise PartialAnalysis(out)
+    return out
+
+@st.cache_resource
+def get_snapshot_cache() -> dict:
+    """snapshot_id -> (etag, análise) já baixados por este processo."""
+    return {}
+
+def fetch_snapshot(snapshot_id: str) -> dict:
+    """
+    Carrega uma análise salva (`GET /analyses/{id}`), revalidando com If-None-Match:
+    se o snapshot já está no cache local, o backend responde 304 sem corpo.
+    """
+    cache = get_snapshot_cache()
+    cached = cache.get(snapshot_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    r = get_http_session().get(f"{API_INTERNAL_URL}/analyses/{snapshot_id}", headers=headers, timeout=30)
+    if r.status_code == 304 and cached:
+        return cached[1]
+    r.raise_for_status()
+    data = r.json()
+    if r.headers.get("ETag"):
+        cache[snapshot_id] = (r.headers["ETag"], data)
+    return data
+
+@st.fragment(run_every=1.0)
+def render_analysis_job():
+    """Acompanha a análise em andamento sem bloquear a página; ao terminar, rerun completo."""
+    job = st.session_state.get("analysis_job")
+    if not job:
+        return
+    future = job["future"]
+    if not future.done():
+        elapsed = time.time() - job["started"]
+        st.progress(
+            min(elapsed / ANALYSIS_TIMEOUT_S, 0.99),
+            text=f"🔄 Coletando e analisando posts... {elapsed:.0f}s (pode levar alguns minutos)",
+        )
+        return
+
+    st.session_state.analysis_job = None
+    try:
+        try:
+            out = future.result()
+        except PartialAnalysis as e:
+            out = e.out
+        st.session_state.rate_limit = out["rate_limit"]
+        st.session_state.analysis_result = out["result"]
+        if out["result"].get("snapshot_id"):
+            # link compartilhável/recarregável da análise
+            st.query_params["analysis"] = out["result"]["snapshot_id"]
+    except AnalysisHTTPError as e:
+        # ✅ salve SEMPRE os headers de cota (sucesso ou erro)
+        st.session_state.rate_limit = e.rate_limit
+        if e.status_code == 429:
+            msg = "Você atingiu o limite diário de perguntas."
+            reset = e.rate_limit.get("reset")
+            if reset:
+                msg += f" Tente novamente após {_fmt_reset(reset)}."
+            st.session_state.analysis_error = msg
+        else:
+            st.session_state.analysis_error = f"Falha ao consultar o servidor: {e}"
+    except requests.RequestException as e:
+        st.session_state.analysis_error = f"Falha ao consultar o servidor: {e}"
+    st.rerun()
+
 def render_quota_badge():
     """Exibe um badge compacto com cota restante/limite e hora de reset."""
     q = st.session_state.get("rate_limit") or {}
@@ -134,8 +269,26 @@ def apply_background_styles():
     css_code += 'img[data-testid="stImage"] { border-radius: 50%; }'
     st.markdown(f"<style>{css_code}</style>", unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner="Configurando recursos de idioma...")
+def load_stopwords():
+    # nltk só é importado (e o corpus baixado) na primeira nuvem de palavras, não a cada rerun
+    import nltk
+    from nltk.corpus import stopwords
+    try:
+        stopwords.words('portuguese')
+    except LookupError:
+        nltk.download('stopwords', quiet=True)
+    return stopwords
+
 @st.cache_data
 def generate_word_cloud(texts, topic):
+    # wordcloud/matplotlib só carregam quando a aba exploratória é renderizada
+    from wordcloud import WordCloud
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    stopwords = load_stopwords()
     stopwords_languages = ['portuguese', 'english', 'spanish', 'french', 'german']
     combined_stopwords = set(s for lang in stopwords_languages for s in stopwords.words(lang))
     if topic:
@@ -176,20 +329,14 @@ def display_top_posts(posts: list, top_n: int = 3):
                 metric_cols[0].metric(label="❤️ Curtidas", value=f"{post.get('like_count', 0):,}")
                 metric_cols[1].metric(label="🔁 Reposts", value=f"{post.get('repost_count', 0):,}")
 
-# --- CONFIGURAÇÃO DA PÁGINA E NLTK ---
+# --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(page_title="AskTheSky", page_icon="🚀", layout="wide")
-try:
-    stopwords.words('portuguese')
-except LookupError:
-    with st.spinner("Configurando recursos de idioma..."):
-        nltk.download('stopwords')
-    st.rerun()
 apply_background_styles()
 
 # --- LÓGICA DE AUTENTICAÇÃO ---
 if "token" in st.query_params:
     st.session_state["token"] = st.query_params["token"]
-    st.query_params.clear()
+    del st.query_params["token"]  # mantém ?analysis=<id> de um link compartilhado
     st.rerun()
 
 if "token" in st.session_state:
@@ -216,6 +363,28 @@ if st.session_state.get("authentication_status"):
         st.session_state.llm_model = "gpt-4o-mini"
     if 'submitted' not in st.session_state:
         st.session_state.submitted = False
+    if 'post_limit' not in st.session_state:
+        st.session_state.post_limit = 1000
+    if 'period_days' not in st.session_state:
+        st.session_state.period_days = 0          # 0 = sem filtro de data
+    if 'lang' not in st.session_state:
+        st.session_state.lang = ""
+    if 'min_engagement' not in st.session_state:
+        st.session_state.min_engagement = 0
+
+    # análise salva (?analysis=<id>): um lookup no backend em vez de rodar o pipeline de novo
+    shared_id = st.query_params.get("analysis")
+    current = st.session_state.analysis_result or {}
+    if shared_id and current.get("snapshot_id") != shared_id and not st.session_state.get("analysis_job"):
+        try:
+            snapshot = fetch_snapshot(shared_id)
+            st.session_state.analysis_result = snapshot
+            req = snapshot.get("request") or {}
+            st.session_state.topic = req.get("topic", st.session_state.topic)
+            st.session_state.question = req.get("question", st.session_state.question)
+        except requests.RequestException as e:
+            st.session_state.analysis_error = f"Não foi possível carregar a análise salva: {e}"
+            del st.query_params["analysis"]
 
     def handle_submission():
         st.session_state.submitted = True
@@ -263,8 +432,8 @@ if st.session_state.get("authentication_status"):
         with form_cols[2]:
             st.markdown("**Modelo de IA**")
             st.session_state.llm_model = st.selectbox(
-                "", ("gpt-4o-mini", "gemini-1.5-flash-latest"),
-                index=("gpt-4o-mini", "gemini-1.5-flash-latest").index(st.session_state.llm_model),
+                "", ("gpt-4o-mini", "gemini-1.5-flash-latest", "auto"),
+                index=("gpt-4o-mini", "gemini-1.5-flash-latest", "auto").index(st.session_state.llm_model),
                 label_visibility="collapsed"
             )
 
@@ -272,67 +441,60 @@ if st.session_state.get("authentication_status"):
             # “label” vazio para manter a mesma altura das outras colunas
             st.markdown("&nbsp;")
             submitted = st.button(
-                "Analisar 1000 Posts ✨",
+                f"Analisar {st.session_state.post_limit} Posts ✨",
                 use_container_width=True,
                 type="primary",
              on_click=handle_submission
             )
 
+        # Filtros aplicados na busca do Bluesky (menos posts, mais relevantes, análise mais rápida)
+        with st.expander("Filtros avançados"):
+            filter_cols = st.columns(4)
+            periods = {0: "Qualquer data", 1: "Últimas 24h", 7: "Últimos 7 dias", 30: "Últimos 30 dias"}
+            st.session_state.period_days = filter_cols[0].selectbox(
+                "Período", list(periods), format_func=periods.get,
+                index=list(periods).index(st.session_state.period_days),
+            )
+            langs = {"": "Todos", "pt": "Português", "en": "Inglês", "es": "Espanhol"}
+            st.session_state.lang = filter_cols[1].selectbox(
+                "Idioma", list(langs), format_func=langs.get,
+                index=list(langs).index(st.session_state.lang),
+            )
+            st.session_state.min_engagement = filter_cols[2].number_input(
+                "Engajamento mínimo", min_value=0, step=1, value=st.session_state.min_engagement,
+                help="Curtidas + reposts.",
+            )
+            st.session_state.post_limit = filter_cols[3].slider(
+                "Posts a buscar", min_value=100, max_value=1000, step=100, value=st.session_state.post_limit,
+            )
+
     render_quota_badge()
 
 
     # --- LÓGICA DE SUBMISSÃO E EXIBIÇÃO DE RESULTADOS ---
     if st.session_state.submitted:
+        st.session_state.submitted = False
         if not st.session_state.topic or not st.session_state.question:
             st.error("Por favor, preencha o Tópico e a Pergunta.")
-            st.session_state.submitted = False
-        else:
-            with st.spinner("🔄 Coletando e analisando posts... Isso pode levar alguns minutos..."):
-                new_result_this_run = False
-                try:
-                    headers = {"Authorization": f"Bearer {st.session_state['token']}"}
-                    payload = {
-                        "topic": st.session_state.topic,
-                        "question": st.session_state.question,
-                        "llm_model": st.session_state.llm_model,
-                        # se você tiver esses controles na UI, pode enviar também:
-                        # "top_k": st.session_state.get("top_k", 6),
-                        # "economy_mode": st.session_state.get("economy_mode", False),
-                    }
-
-                    # ⚠️ use json=payload (não data=json.dumps), pois seu backend espera JSON
-                    r = requests.post(f"{API_INTERNAL_URL}/analyze", headers=headers, json=payload, timeout=120)
-
-                    # ✅ salve SEMPRE os headers de cota (sucesso ou erro)
-                    limit = r.headers.get("X-RateLimit-Limit")
-                    remaining = r.headers.get("X-RateLimit-Remaining")
-                    reset = r.headers.get("X-RateLimit-Reset")
-                    st.session_state.rate_limit = {
-                        "limit": int(limit) if str(limit).isdigit() else None,
-                        "remaining": int(remaining) if str(remaining).isdigit() else None,
-                        "reset": int(reset) if str(reset).isdigit() else None,
-                    }
-
-                    # ✅ trate explicitamente cota estourada ANTES de raise_for_status
-                    if r.status_code == 429:
-                        msg = "Você atingiu o limite diário de perguntas."
-                        if reset:
-                            msg += f" Tente novamente após {_fmt_reset(reset)}."
-                        st.error(msg)
-                        # não mexa no analysis_result anterior; apenas saia do try
-                    else:
-                        r.raise_for_status()
-                        st.session_state.analysis_result = r.json()
-                        new_result_this_run = True
-
-                except requests.RequestException as e:
-                    st.error(f"Falha ao consultar o servidor: {e}")
-
-                finally:
-                    st.session_state.submitted = False
-                    # ✅ só rerun se tivemos novo resultado (evita apagar a mensagem 429 imediatamente)
-                    if new_result_this_run:
-                        st.rerun()
+        elif not st.session_state.get("analysis_job"):
+            user_info = st.session_state.get("user_info", {})
+            future = get_executor().submit(
+                fetch_analysis,
+                user_info.get("sub") or user_info.get("email") or "anon",
+                st.session_state.topic,
+                st.session_state.question,
+                st.session_state.llm_model,
+                st.session_state.post_limit,
+                st.session_state.period_days,
+                st.session_state.lang,
+                st.session_state.min_engagement,
+                st.session_state["token"],
+            )
+            st.session_state.analysis_job = {"future": future, "started": time.time()}
+
+    render_analysis_job()
+    if st.session_state.get("analysis_error"):
+        st.error(st.session_state.pop("analysis_error"))
 
     # --- NOVO LAYOUT COM ABAS PARA OS RESULTADOS ---
     if st.session_state.analysis_result:
@@ -349,10 +511,12 @@ if st.session_state.get("authentication_status"):
         # Resumo da resposta e KPIs
         with st.container(border=True):
             st.markdown("#### Resposta da Análise")
-            st.info(answer)
+            # parcial: o prazo acabou antes da resposta do modelo; as fontes seguem abaixo
+            (st.warning if data.get("partial") else st.info)(answer)
 
             kpi_cols = st.columns(4)
-            total_time = sum(timings.values()) if timings else 0.0
+            # fetch e embed rodam sobrepostos; "total" é o tempo de parede real
+            total_time = timings.get("total", sum(timings.values())) if timings else 0.0
             kpi_cols[0].metric("Tempo Total (s)", f"{total_time:.2f}")
             kpi_cols[1].metric("Fontes Encontradas", len(sources))
             kpi_cols[2].metric("Total de Tokens", tokens.get("total_tokens", "N/A"))
@@ -387,9 +551,14 @@ if st.session_state.get("authentication_status"):
                 st.markdown("##### Tempos por estágio (s)")
                 if timings: st.dataframe(pd.DataFrame.from_dict(timings, orient='index', columns=['Segundos']), use_container_width=True)
                 else: st.caption("Métricas de tempo não disponíveis.")
+                stats = data.get("stats") or {}
+                if stats:
+                    st.markdown("##### Contagens do pipeline")
+                    st.dataframe(pd.DataFrame.from_dict(stats, orient='index', columns=['Valor']), use_container_width=True)
             with col2:
-                st.markdown("##### Tokens / Custo (OpenAI)")
+                st.markdown("##### Tokens / Custo")
                 token_data = {
+                    "Modelo": tokens.get("model", "N/A") + (" (hedge)" if tokens.get("hedged") else ""),
                     "Prompt Tokens": tokens.get("prompt_tokens"),
                     "Completion Tokens": tokens.get("completion_tokens"),
                     "Total Tokens": tokens.get("total_tokens"),
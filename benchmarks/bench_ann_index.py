@@ -0,0 +1,149 @@
+# benchmarks/bench_ann_index.py
+"""
+Recall@k x latência dos índices FAISS (flat, hnsw, ivfpq) contra o flat exato.
+
+Dados:
+- sintéticos: vetores 384-d normalizados em clusters (imitando MiniLM em tópicos);
+- gravados: `--embeddings arquivo.npy` com embeddings reais de posts (N x 384).
+  Para gerar: `np.save("posts.npy", np.array(get_embeddings().embed_documents(textos)))`.
+
+Com `--corpus N` monta um `RollingCorpus` com N posts de um mesmo tópico e
+confere (saída != 0 se falhar) que o `auto` escolhe o ANN pelo tamanho do
+corpus (HNSW a partir de RAG_INDEX_AUTO_HNSW_MIN, IVF-PQ a partir de
+RAG_INDEX_AUTO_IVFPQ_MIN; ou o RAG_INDEX_KIND forçado), que ele fica pronto e
+que a busca do tópico passa por ele com recall@k contra a busca exata.
+
+Uso:
+    python benchmarks/bench_ann_index.py [--sizes 10000 100000] [--k 6] [--queries 200]
+    python benchmarks/bench_ann_index.py --embeddings posts.npy
+    python benchmarks/bench_ann_index.py --corpus 120000 [--min-recall 0.9]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.services.corpus import RollingCorpus  # noqa: E402
+from src.services.vector_index import IndexParams, choose_index_kind, make_faiss_index  # noqa: E402
+
+DIM = 384
+
+
+def synthetic(n: int, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, DIM)).astype(np.float32)
+    x = centers[rng.integers(0, n_clusters, n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def bench(name: str, data: np.ndarray, k: int, n_queries: int, params: IndexParams):
+    rng = np.random.default_rng(1)
+    q_idx = rng.choice(len(data), size=min(n_queries, len(data)), replace=False)
+    # consultas = posts perturbados (perguntas próximas de alguns posts, não idênticas)
+    queries = data[q_idx] + 0.05 * rng.normal(size=(len(q_idx), data.shape[1])).astype(np.float32)
+    queries = queries.astype(np.float32)
+
+    exact = faiss.IndexFlatL2(data.shape[1])
+    exact.add(data)
+    _, truth = exact.search(queries, k)
+
+    print(f"\n== {name}: {len(data):,} vetores, k={k}, {len(queries)} consultas ==")
+    print(f"{'índice':<8} {'build (s)':>10} {'memória (MB)':>13} {'p50 (ms)':>9} {'p95 (ms)':>9} {'recall@k':>9}")
+    for kind in ("flat", "hnsw", "ivfpq"):
+        t0 = time.perf_counter()
+        index = make_faiss_index(kind, data.shape[1], len(data), params)
+        if not index.is_trained:
+            index.train(data)
+        index.add(data)
+        build = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        lat, hits = [], 0
+        for i in range(len(queries)):
+            t = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], k)
+            lat.append((time.perf_counter() - t) * 1e3)
+            hits += len(set(found[0]) & set(truth[i]))
+        lat = np.array(lat)
+        recall = hits / (k * len(queries))
+        print(f"{kind:<8} {build:>10.2f} {size_mb:>13.1f} {np.percentile(lat, 50):>9.3f} {np.percentile(lat, 95):>9.3f} {recall:>9.3f}")
+
+
+def corpus_check(n: int, k: int, n_queries: int, params: IndexParams, min_recall: float) -> bool:
+    """ANN do `RollingCorpus` num corpus grande: tipo escolhido, montagem em segundo plano, recall."""
+    params.exact_max = 0  # todo tópico passa pelo ANN
+    expected = choose_index_kind(n, params)
+    data = synthetic(n)
+    corpus = RollingCorpus(DIM, max_posts=n, max_age_seconds=float("inf"), index_params=params)
+    now = time.time()
+    t0 = time.perf_counter()
+    for start in range(0, n, 4096):
+        stop = min(start + 4096, n)
+        items = [
+            {"uri": f"at://bench/{i}", "handle": "bench", "display_name": None, "avatar": None,
+             "text": f"tópico post {i}", "created_at": None, "langs": None, "ts": now}
+            for i in range(start, stop)
+        ]
+        corpus.add(items, data[start:stop], now=now)
+    ingest = time.perf_counter() - t0
+    while corpus.stats()["index_building"]:
+        time.sleep(0.1)
+    build = time.perf_counter() - t0 - ingest
+    stats = corpus.stats()
+    print(f"\n== corpus: {n:,} posts, auto -> {expected}; índice pronto: {stats['index_kind']} "
+          f"({stats['index_vectors']:,} vetores), ingestão {ingest:.1f}s, montagem +{build:.1f}s ==")
+    if expected == "flat" or stats["index_kind"] != expected:
+        print(f"FALHOU: esperava índice {expected} != flat, montado: {stats['index_kind']}")
+        return False
+
+    rng = np.random.default_rng(1)
+    q_idx = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = (data[q_idx] + 0.05 * rng.normal(size=(len(q_idx), DIM))).astype(np.float32)
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(data)
+    _, truth = exact.search(queries, k)
+
+    batch, nearest = corpus.search("tópico", 100)
+    lat, hits = [], 0
+    for i, q in enumerate(queries):
+        t = time.perf_counter()
+        found = nearest(q, k)
+        lat.append((time.perf_counter() - t) * 1e3)
+        uris = {batch.uris[row] for row, _ in found}
+        hits += len(uris & {f"at://bench/{j}" for j in truth[i]})
+    recall = hits / (k * len(queries))
+    print(f"busca no tópico: p50 {np.percentile(lat, 50):.2f} ms, p95 {np.percentile(lat, 95):.2f} ms, recall@{k} {recall:.3f}")
+    if recall < min_recall:
+        print(f"FALHOU: recall@{k} {recall:.3f} < {min_recall}")
+        return False
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--embeddings", help="arquivo .npy com embeddings gravados de posts")
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--corpus", type=int, help="confere o ANN de um RollingCorpus com N posts")
+    ap.add_argument("--min-recall", type=float, default=0.9)
+    args = ap.parse_args()
+
+    faiss.omp_set_num_threads(1)  # latência por consulta, como numa requisição
+    params = IndexParams.from_env()
+    if args.corpus:
+        sys.exit(0 if corpus_check(args.corpus, args.k, args.queries, params, args.min_recall) else 1)
+    if args.embeddings:
+        data = np.load(args.embeddings).astype(np.float32)
+        bench(f"gravados ({args.embeddings})", data, args.k, args.queries, params)
+    for n in args.sizes:
+        bench("sintéticos", synthetic(n), args.k, args.queries, params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_compact_vectors.py
+"""
+Memória por 100k posts e perda de qualidade do armazenamento compacto de vetores
+(float16 / int8 / PCA) contra o caminho float32 atual.
+
+Qualidade = recall@k contra o top-k exato em float32, só com os vetores compactos
+e com re-pontuação em precisão total dos k*fator melhores candidatos (lidos dos
+originais guardados no arquivo mapeado em memória, fora do heap).
+
+Uso:
+    python benchmarks/bench_compact_vectors.py [--n 100000] [--k 6] [--queries 200]
+    python benchmarks/bench_compact_vectors.py --embeddings posts.npy
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.services.compact_vectors import CompactParams, CompactVectors  # noqa: E402
+
+DIM = 384
+CONFIGS = [
+    ("float32", 0),
+    ("float16", 0),
+    ("int8", 0),
+    ("float16", 128),
+    ("int8", 128),
+    ("int8", 64),
+]
+
+
+def synthetic(n: int, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, DIM)).astype(np.float32)
+    x = centers[rng.integers(0, n_clusters, n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--embeddings", help="arquivo .npy com embeddings gravados de posts")
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--rescore-factor", type=int, default=4)
+    args = ap.parse_args()
+
+    data = np.load(args.embeddings).astype(np.float32) if args.embeddings else synthetic(args.n)
+    rng = np.random.default_rng(1)
+    q_idx = rng.choice(len(data), size=min(args.queries, len(data)), replace=False)
+    queries = (data[q_idx] + 0.05 * rng.normal(size=(len(q_idx), data.shape[1]))).astype(np.float32)
+
+    # top-k exato em float32 (referência)
+    sq = np.einsum("ij,ij->i", data, data)
+    truth = [set(np.argsort(sq - 2.0 * data @ q)[:args.k]) for q in queries]
+
+    print(f"{len(data):,} vetores de {data.shape[1]} dims, k={args.k}, {len(queries)} consultas")
+    print(
+        f"{'armazenamento':<16} {'MB/100k posts':>14} {'disco MB/100k':>14} {'recall compacto':>16} "
+        f"{'recall c/ rescore':>18} {'busca p50 (ms)':>15}"
+    )
+    for dtype, pca_dim in CONFIGS:
+        params = CompactParams(dtype=dtype, pca_dim=pca_dim, calibration_size=min(4096, len(data)),
+                               rescore_factor=args.rescore_factor)
+        store = CompactVectors(data.shape[1], params)
+        for start in range(0, len(data), 1000):
+            store.append(data[start:start + 1000])
+        per_100k = store.nbytes / len(store) * 100_000 / 1e6
+        disk_100k = store.full_nbytes / len(store) * 100_000 / 1e6
+
+        hits = hits_rescored = 0
+        lat = []
+        for q, want in zip(queries, truth):
+            t0 = time.perf_counter()
+            got = store.search(q, args.k, rescore=False)
+            lat.append((time.perf_counter() - t0) * 1e3)
+            hits += len(want & {i for i, _ in got})
+            got_r = store.search(q, args.k, rescore=True)
+            hits_rescored += len(want & {i for i, _ in got_r})
+        total = args.k * len(queries)
+        name = dtype + (f"+pca{pca_dim}" if pca_dim else "")
+        print(
+            f"{name:<16} {per_100k:>14.1f} {disk_100k:>14.1f} {hits / total:>16.3f} "
+            f"{hits_rescored / total:>18.3f} {np.median(lat):>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# benchmarks/bench_lexical_cascade.py
+"""
+Cascata lexical (BM25 -> embedding só dos candidatos) contra o embedding de
+todos os posts buscados.
+
+Para cada pergunta, a referência é o top-k denso sobre todos os posts (o
+caminho atual); a cascata embeda apenas os `cascade_size(k)` melhores do BM25
+e reordena esses. Mede recall@k contra a referência (acerto = candidato tão
+próximo quanto o k-ésimo da referência, para empates não pesarem), a fração de
+perguntas que caem no fallback (sem termos em comum -> embeda tudo) e o tempo
+de `embed_index` economizado (embedding dos candidatos + BM25 vs. embedding de tudo).
+
+Posts e perguntas sintéticos por padrão (tópico com vários aspectos); para
+números reais grave os textos de uma busca (um JSON com "text" ou um texto por
+linha) e passe perguntas de verdade:
+
+    python benchmarks/bench_lexical_cascade.py [--posts 1000] [--k 3 6 12] [--questions 30]
+    python benchmarks/bench_lexical_cascade.py --posts-file posts.jsonl --questions-file perguntas.txt
+    python benchmarks/bench_lexical_cascade.py --hash-embeddings   # sem baixar o MiniLM (só recall aproximado)
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.services.lexical import STOPWORDS, BM25Scorer, query_terms, tokenize  # noqa: E402
+from src.services.rag_service import cascade_size  # noqa: E402
+
+TOPIC = "rtx"
+ASPECTS = {
+    "preço": ["preço", "caro", "barato", "dólar", "promoção", "custo"],
+    "desempenho": ["desempenho", "fps", "benchmark", "performance", "4k", "rápida"],
+    "consumo": ["consumo", "energia", "watts", "fonte", "temperatura", "calor"],
+    "drivers": ["driver", "drivers", "atualização", "bug", "travando", "crash"],
+    "dlss": ["dlss", "upscaling", "frame generation", "ray tracing", "rtx on"],
+    "estoque": ["estoque", "esgotada", "lançamento", "pré-venda", "loja", "fila"],
+}
+FILLER = (
+    "hoje galera acho que nova placa vi gente falando sobre isso muito bom ruim demais "
+    "sinceramente comprei minha amigo jogo jogar pc setup mano vale pena ainda esperar"
+).split()
+QUESTION_TEMPLATES = [
+    "O que as pessoas acham do {w} das novas placas?",
+    "Qual a percepção sobre {w}?",
+    "Como estão falando de {w} na {t}?",
+    "Reclamações sobre {w}",
+]
+
+
+def synthetic_posts(n: int, rng: random.Random):
+    posts = []
+    for _ in range(n):
+        aspect = rng.choice(list(ASPECTS))
+        words = rng.choices(FILLER, k=rng.randint(6, 25))
+        words += rng.sample(ASPECTS[aspect], k=rng.randint(1, 2))
+        if rng.random() < 0.2:  # posts que tocam em dois aspectos
+            words += [rng.choice(ASPECTS[rng.choice(list(ASPECTS))])]
+        words.append(TOPIC)
+        rng.shuffle(words)
+        posts.append(" ".join(words))
+    return posts
+
+
+def synthetic_questions(n: int, rng: random.Random):
+    out = [
+        rng.choice(QUESTION_TEMPLATES).format(w=rng.choice(ASPECTS[rng.choice(list(ASPECTS))]), t=TOPIC)
+        for _ in range(n - 2)
+    ]
+    # perguntas vagas, sem termos discriminantes: exercitam o fallback
+    return out + ["Qual o sentimento geral?", "O que as pessoas estão dizendo?"]
+
+
+def load_lines(path: str):
+    out = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        out.append(json.loads(line)["text"] if line.startswith("{") else line)
+    return out
+
+
+class HashEmbeddings:
+    """
+    Saco de palavras com hashing (dim 384, sem stopwords): sem modelo, só para
+    rodar o script rápido. Favorece o BM25; recall de verdade só com o MiniLM.
+    """
+
+    def _vec(self, text):
+        v = np.zeros(384, dtype=np.float32)
+        for t in tokenize(text):
+            if t in STOPWORDS:
+                continue
+            v[int.from_bytes(hashlib.blake2b(t.encode(), digest_size=4).digest(), "little") % 384] += 1.0
+        return (v / (np.linalg.norm(v) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+def l2(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    # L2, como o índice flat do pipeline
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--posts", type=int, default=1000)
+    ap.add_argument("--posts-file")
+    ap.add_argument("--questions", type=int, default=30)
+    ap.add_argument("--questions-file")
+    ap.add_argument("--k", type=int, nargs="+", default=[3, 6, 12])
+    ap.add_argument("--hash-embeddings", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = load_lines(args.posts_file) if args.posts_file else synthetic_posts(args.posts, rng)
+    questions = load_lines(args.questions_file) if args.questions_file else synthetic_questions(args.questions, rng)
+
+    if args.hash_embeddings:
+        embeddings = HashEmbeddings()
+    else:
+        from src.services.rag_service import get_embeddings
+
+        embeddings = get_embeddings()
+        embeddings.embed_documents(["aquecimento"])
+
+    t0 = time.perf_counter()
+    all_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    full_embed_s = time.perf_counter() - t0
+    print(f"{len(texts)} posts, {len(questions)} perguntas; embedding de todos: {full_embed_s * 1000:.0f} ms\n")
+
+    print(f"{'k':>3} {'N':>5} {'recall@k':>9} {'fallback':>9} {'bm25 ms':>8} {'embed ms':>9} {'vs. tudo':>9} {'economia':>9}")
+    report = []
+    for k in args.k:
+        n_candidates = cascade_size(k)
+        recalls, lexical_s, embed_s, fallbacks = [], [], [], 0
+        for question in questions:
+            query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+            dist = l2(all_vectors, query)
+            kth = np.partition(dist, k - 1)[k - 1]
+
+            t0 = time.perf_counter()
+            scorer = BM25Scorer(query_terms(question))
+            scorer.add(texts)
+            rows, _ = scorer.top(n_candidates, min_matches=k) if len(texts) > n_candidates else (None, 0)
+            lexical_s.append(time.perf_counter() - t0)
+            if rows is None:
+                fallbacks += 1
+                rows = list(range(len(texts)))
+                embed_s.append(full_embed_s)
+            else:
+                t0 = time.perf_counter()
+                embeddings.embed_documents([texts[i] for i in rows])
+                embed_s.append(time.perf_counter() - t0)
+
+            # acerto = tão perto quanto o k-ésimo da referência (empates contam)
+            found = np.sort(dist[np.asarray(rows)])[:k]
+            recalls.append(float((found <= kth + 1e-6).sum()) / k)
+
+        lex_ms, emb_ms = 1000 * np.mean(lexical_s), 1000 * np.mean(embed_s)
+        saved = 1 - (lex_ms + emb_ms) / (1000 * full_embed_s)
+        row = {
+            "k": k, "candidates": n_candidates, "recall": float(np.mean(recalls)),
+            "fallback_rate": fallbacks / len(questions), "bm25_ms": lex_ms, "embed_ms": emb_ms,
+            "full_embed_ms": 1000 * full_embed_s, "saved": saved,
+        }
+        report.append(row)
+        print(
+            f"{k:>3} {n_candidates:>5} {row['recall']:>9.3f} {row['fallback_rate']:>9.1%} {lex_ms:>8.1f} "
+            f"{emb_ms:>9.0f} {1000 * full_embed_s:>9.0f} {saved:>9.1%}"
+        )
+    return report
+
+
+if __name__ == "__main__":
+    main()
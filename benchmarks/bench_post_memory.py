@@ -0,0 +1,102 @@
+# benchmarks/bench_post_memory.py
+"""
+Memória retida/pico por requisição: formato legado (PostView + post_texts +
+raw_posts) vs. PostBatch colunar, com posts sintéticos no formato do atproto.
+
+Uso:
+    python benchmarks/bench_post_memory.py [--sizes 1000 10000 50000]
+"""
+import argparse
+import gc
+import random
+import string
+import sys
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.core.post_batch import PostBatch  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def _fake_page(start: int, n_authors: int, rng: random.Random) -> list:
+    """Uma página de objetos com a mesma forma de `PostView` (author/record/counts)."""
+    page = []
+    for i in range(start, start + PAGE_SIZE):
+        a = rng.randrange(n_authors)
+        words = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(rng.randint(8, 45)))
+        page.append(SimpleNamespace(
+            uri=f"at://did:plc:{a:024d}/app.bsky.feed.post/{i:013d}",
+            cid=f"bafyrei{i:052d}",
+            author=SimpleNamespace(
+                did=f"did:plc:{a:024d}",
+                handle=f"user{a}.bsky.social",
+                display_name=f"User {a}",
+                avatar=f"https://cdn.bsky.app/img/avatar/plain/did:plc:{a:024d}/bafkrei{a:050d}@jpeg",
+                labels=[],
+            ),
+            record=SimpleNamespace(text=words, created_at="2025-09-30T12:00:00.000Z", langs=["pt"], facets=None),
+            like_count=rng.randrange(500),
+            repost_count=rng.randrange(100),
+            reply_count=rng.randrange(50),
+            indexed_at="2025-09-30T12:00:01.000Z",
+            labels=[],
+        ))
+    return page
+
+
+def _legacy(n: int, seed: int):
+    rng = random.Random(seed)
+    posts = []
+    for start in range(0, n, PAGE_SIZE):
+        posts.extend(_fake_page(start, max(1, n // 4), rng))
+    post_texts = [p.record.text for p in posts if p.record.text]
+    raw_posts = [{
+        "uri": p.uri,
+        "author": {"handle": p.author.handle, "display_name": p.author.display_name, "avatar": p.author.avatar},
+        "record": {"text": p.record.text},
+        "like_count": p.like_count,
+        "repost_count": p.repost_count,
+    } for p in posts]
+    return posts, post_texts, raw_posts
+
+
+def _columnar(n: int, seed: int):
+    rng = random.Random(seed)
+    batch = PostBatch()
+    for start in range(0, n, PAGE_SIZE):
+        page = _fake_page(start, max(1, n // 4), rng)
+        batch.extend_from_posts(page)
+        del page
+    return batch
+
+
+def measure(builder, n: int, seed: int = 42):
+    gc.collect()
+    tracemalloc.start()
+    kept = builder(n, seed)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    gc.collect()
+    return retained, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    args = ap.parse_args()
+
+    mb = 1024 * 1024
+    print(f"{'posts':>8} | {'legado retido':>14} | {'legado pico':>12} | {'colunar retido':>15} | {'colunar pico':>13} | {'redução':>8}")
+    for n in args.sizes:
+        l_ret, l_peak = measure(_legacy, n)
+        c_ret, c_peak = measure(_columnar, n)
+        print(f"{n:>8} | {l_ret / mb:>11.1f} MB | {l_peak / mb:>9.1f} MB | {c_ret / mb:>12.1f} MB | {c_peak / mb:>10.1f} MB | {l_ret / max(c_ret, 1):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
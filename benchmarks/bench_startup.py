@@ -0,0 +1,48 @@
+# benchmarks/bench_startup.py
+"""
+Orçamento de cold start do backend. Sai com código 1 se alguma regressão passar do limite:
+- tempo de `import src.main` (STARTUP_IMPORT_BUDGET_S, padrão 2.0s);
+- tempo até a primeira requisição pronta (STARTUP_READY_BUDGET_S, padrão 5.0s);
+- nenhum módulo pesado (torch, LangChain, SDKs de LLM, FAISS...) carregado no import.
+
+Uso (com o .env do backend configurado):
+    python benchmarks/bench_startup.py [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+from src.core.startup_profile import heavy_modules_loaded, import_times, time_to_first_ready  # noqa: E402
+
+IMPORT_BUDGET_S = float(os.getenv("STARTUP_IMPORT_BUDGET_S", "2.0"))
+READY_BUDGET_S = float(os.getenv("STARTUP_READY_BUDGET_S", "5.0"))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=3, help="repetições (usa a mediana)")
+    args = ap.parse_args()
+
+    imports = [import_times()[0] for _ in range(args.runs)]
+    ready = [time_to_first_ready() for _ in range(args.runs)]
+    heavy = heavy_modules_loaded()
+
+    import_s, ready_s = statistics.median(imports), statistics.median(ready)
+    checks = [
+        ("import src.main", f"{import_s:.3f}s", f"<= {IMPORT_BUDGET_S:.1f}s", import_s <= IMPORT_BUDGET_S),
+        ("primeira requisição pronta", f"{ready_s:.3f}s", f"<= {READY_BUDGET_S:.1f}s", ready_s <= READY_BUDGET_S),
+        ("módulos pesados no import", ", ".join(heavy) or "nenhum", "nenhum", not heavy),
+    ]
+    for name, value, budget, ok in checks:
+        print(f"[{'OK' if ok else 'FALHOU'}] {name}: {value} (orçamento {budget})")
+    return 0 if all(ok for *_, ok in checks) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+# benchmarks/loadtest.py
+"""
+Teste de carga do caminho autenticado `POST /analyze`.
+
+Gera JWTs válidos com `create_app_token` (mesmo JWT_SECRET do backend), dispara
+requisições em degraus de concorrência (loop fechado) ou de taxa de chegada
+(loop aberto, chegadas de Poisson) e reporta por degrau: vazão, latência
+p50/p90/p95/p99, taxa de erros, de 429, de 503 e de respostas parciais (prazo), e o detalhamento por etapa
+vindo de `timings`. Marca o ponto de saturação: o último degrau que ainda
+aumentou a vazão em >= 10% dentro do SLO de p95 e da taxa de erro máxima.
+
+Backend: `benchmarks/loadtest_app.py` (app real com Bluesky/LLM simulados).
+Com `--spawn-workers 1 4` o script sobe o servidor com 1 e depois 4 workers
+(uvicorn, ou `--server gunicorn` para o modo de produção com preload), roda a
+mesma rampa em cada um e compara saturação e memória (RSS/PSS) do servidor.
+Cada servidor iniciado tem usuários novos e cota/snapshots em SQLite
+temporários (RATE_LIMIT_DB/SNAPSHOT_DB), apagados ao fim: um teste não herda a
+cota gasta pelo anterior.
+(O backend só expõe `/analyze` síncrono; não há variantes streaming/lote.)
+
+Uso (com o .env do backend configurado; o cliente precisa do mesmo JWT_SECRET):
+    python benchmarks/loadtest.py --spawn-workers 1 4 --concurrency 1 2 4 8 16 32
+    python benchmarks/loadtest.py --url http://127.0.0.1:8001 --rate 0.5 1 2 4 --duration 60
+    python benchmarks/loadtest.py --spawn-workers 2 --users 3 --quota 5     # exercita os 429
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+from src.main import create_app_token  # noqa: E402
+
+UNLIMITED_QUOTA = 1_000_000_000  # DAILY_QUESTION_LIMIT dos servidores iniciados sem --quota
+
+STAGES = ("queue_wait", "embed_wait", "corpus_lookup", "fetch_posts", "lexical", "embed_index", "fetch_embed_wall", "retrieve", "llm", "total")
+
+
+@dataclass
+class Sample:
+    status: int          # 0 = timeout/erro de conexão
+    latency: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    partial: bool = False  # 200 sem resposta do LLM (prazo da análise esgotado)
+
+
+@dataclass
+class StepResult:
+    label: str
+    elapsed: float
+    samples: List[Sample]
+
+    def _count(self, pred) -> int:
+        return sum(1 for s in self.samples if pred(s))
+
+    @property
+    def ok(self) -> List[Sample]:
+        return [s for s in self.samples if s.status == 200]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.ok) / self.elapsed if self.elapsed else 0.0
+
+    def rate(self, pred) -> float:
+        return self._count(pred) / len(self.samples) if self.samples else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.rate(lambda s: s.status != 200)
+
+    def latency(self, q: float) -> float:
+        return percentile([s.latency for s in self.ok], q)
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        values = defaultdict(list)
+        for s in self.ok:
+            for name, value in s.timings.items():
+                values[name].append(value)
+        return {
+            name: {"mean": sum(v) / len(v), "p95": percentile(v, 95)}
+            for name, v in values.items() if name in STAGES
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "step": self.label,
+            "requests": len(self.samples),
+            "throughput_rps": round(self.throughput, 3),
+            "latency_s": {f"p{q}": round(self.latency(q), 3) for q in (50, 90, 95, 99)},
+            "error_rate": round(self.error_rate, 4),
+            "rate_429": round(self.rate(lambda s: s.status == 429), 4),
+            "rate_503": round(self.rate(lambda s: s.status == 503), 4),
+            "rate_partial": round(self.rate(lambda s: s.partial), 4),
+            "timeouts": self._count(lambda s: s.status == 0),
+            "stages": {k: {m: round(x, 3) for m, x in v.items()} for k, v in self.stage_stats().items()},
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)  # nearest-rank
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class Driver:
+    def __init__(self, base_url: str, tokens: List[str], payload: dict, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.tokens = tokens
+        self.payload = payload
+        self.timeout = timeout
+
+    async def one(self, client: httpx.AsyncClient, started: Optional[float] = None) -> Sample:
+        # no loop aberto a latência conta do instante agendado (evita "coordinated omission")
+        t0 = started if started is not None else time.perf_counter()
+        headers = {"Authorization": f"Bearer {random.choice(self.tokens)}"}
+        try:
+            r = await client.post(f"{self.base_url}/analyze", json=self.payload, headers=headers)
+        except httpx.HTTPError:
+            return Sample(0, time.perf_counter() - t0)
+        body = r.json() if r.status_code == 200 else {}
+        return Sample(r.status_code, time.perf_counter() - t0, body.get("timings", {}), bool(body.get("partial")))
+
+    def _client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        return httpx.AsyncClient(timeout=self.timeout, limits=limits)
+
+    async def closed_loop(self, concurrency: int, duration: float) -> StepResult:
+        samples: List[Sample] = []
+        deadline = time.perf_counter() + duration
+
+        async def user(client):
+            while time.perf_counter() < deadline:
+                samples.append(await self.one(client))
+
+        async with self._client() as client:
+            t0 = time.perf_counter()
+            await asyncio.gather(*(user(client) for _ in range(concurrency)))
+            return StepResult(f"c={concurrency}", time.perf_counter() - t0, samples)
+
+    async def open_loop(self, rate: float, duration: float, max_inflight: int) -> StepResult:
+        samples: List[Sample] = []
+        inflight = asyncio.Semaphore(max_inflight)
+        tasks = []
+
+        async def fire(client, scheduled):
+            async with inflight:
+                samples.append(await self.one(client, started=scheduled))
+
+        async with self._client() as client:
+            t0 = time.perf_counter()
+            next_at = t0
+            while next_at < t0 + duration:
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                tasks.append(asyncio.create_task(fire(client, next_at)))
+                next_at += random.expovariate(rate)
+            await asyncio.gather(*tasks)
+            return StepResult(f"λ={rate:g}/s", time.perf_counter() - t0, samples)
+
+
+def saturation(results: List[StepResult], slo_p95: float, max_error_rate: float) -> Optional[StepResult]:
+    """Último degrau que ainda ganhou >= 10% de vazão, dentro do SLO e da taxa de erro."""
+    best = None
+    for r in results:
+        healthy = r.latency(95) <= slo_p95 and r.error_rate <= max_error_rate
+        if not healthy:
+            break
+        if best is None or r.throughput >= 1.1 * best.throughput:
+            best = r
+    return best
+
+
+def print_report(title: str, results: List[StepResult], sat: Optional[StepResult]) -> None:
+    print(f"\n== {title} ==")
+    print(f"{'degrau':<10} {'reqs':>6} {'ok/s':>7} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'erro%':>6} {'429%':>6} {'503%':>6} {'parc%':>6}")
+    for r in results:
+        print(
+            f"{r.label:<10} {len(r.samples):>6} {r.throughput:>7.2f} "
+            + " ".join(f"{r.latency(q):>7.2f}" for q in (50, 90, 95, 99))
+            + f" {100 * r.error_rate:>6.1f} {100 * r.rate(lambda s: s.status == 429):>6.1f}"
+            + f" {100 * r.rate(lambda s: s.status == 503):>6.1f} {100 * r.rate(lambda s: s.partial):>6.1f}"
+        )
+    print("\nmédia por etapa (s), respostas 200:")
+    print(f"{'degrau':<10} " + " ".join(f"{s:>16}" for s in STAGES))
+    for r in results:
+        stats = r.stage_stats()
+        print(f"{r.label:<10} " + " ".join(
+            f"{stats[s]['mean']:>16.3f}" if s in stats else f"{'-':>16}" for s in STAGES
+        ))
+    if sat:
+        print(f"\nsaturação: ~{sat.throughput:.2f} req/s em {sat.label} (p95 {sat.latency(95):.2f}s)")
+    else:
+        print("\nsaturação: nenhum degrau dentro do SLO")
+
+
+def make_tokens(prefix: str, users: int) -> List[str]:
+    return [
+        create_app_token({"sub": f"{prefix}-{i}", "email": f"loadtest{i}@example.com", "name": f"Load {i}"})
+        for i in range(users)
+    ]
+
+
+def spawn_server(
+    workers: int, port: int, quota: Optional[int], server: str = "uvicorn", state_dir: Optional[str] = None
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    # sem --quota explícito a cota não entra na medida: o .env (carregado pelo
+    # src.main) costuma ter DAILY_QUESTION_LIMIT=5, e a rampa viraria só 429
+    env["DAILY_QUESTION_LIMIT"] = str(quota if quota is not None else UNLIMITED_QUOTA)
+    if state_dir:
+        # cota e snapshots próprios deste servidor: nada herdado de um teste anterior
+        env["RATE_LIMIT_DB"] = str(Path(state_dir) / "ratelimit.db")
+        env["SNAPSHOT_DB"] = str(Path(state_dir) / "snapshots.db")
+    if server == "gunicorn":
+        # modo de produção (gunicorn.conf.py): modelo carregado antes do fork
+        env.update(WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}")
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+               "benchmarks.loadtest_app:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "benchmarks.loadtest_app:app",
+               "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+def _process_tree(pid: int) -> List[int]:
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        for task in Path(f"/proc/{p}/task").glob("*"):
+            try:
+                stack.extend(int(c) for c in (task / "children").read_text().split())
+            except OSError:
+                pass
+    return pids
+
+
+def server_memory_mb(pid: int) -> Dict[str, float]:
+    """
+    RSS e PSS somados do servidor (master + workers), via /proc (Linux).
+    RSS conta páginas compartilhadas uma vez por processo; PSS as divide entre
+    eles, então a diferença mostra o quanto o copy-on-write está economizando.
+    """
+    rss = pss = 0
+    for p in _process_tree(pid):
+        try:
+            for line in Path(f"/proc/{p}/smaps_rollup").read_text().splitlines():
+                if line.startswith("Rss:"):
+                    rss += int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss += int(line.split()[1])
+        except OSError:
+            continue
+    return {"rss_mb": round(rss / 1024, 1), "pss_mb": round(pss / 1024, 1)}
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 180.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"servidor terminou com código {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("servidor não ficou pronto a tempo")
+
+
+async def run_ramp(driver: Driver, args) -> List[StepResult]:
+    results = []
+    if args.warmup:
+        # paga o carregamento do modelo/SDKs em cada worker antes de medir
+        await driver.closed_loop(args.warmup, min(args.duration, 10.0))
+    steps = [("rate", r) for r in args.rate] if args.rate else [("conc", c) for c in args.concurrency]
+    for kind, value in steps:
+        if kind == "rate":
+            res = await driver.open_loop(value, args.duration, args.max_inflight)
+        else:
+            res = await driver.closed_loop(int(value), args.duration)
+        print(f"  {res.label}: {len(res.samples)} reqs, {res.throughput:.2f} ok/s, p95 {res.latency(95):.2f}s", flush=True)
+        results.append(res)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8001", help="backend já rodando (ignorado com --spawn-workers)")
+    ap.add_argument("--spawn-workers", type=int, nargs="+", help="sobe loadtest_app com N workers (um teste por valor)")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn",
+                    help="com --spawn-workers: uvicorn --workers ou o modo de produção (gunicorn.conf.py)")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    ap.add_argument("--rate", type=float, nargs="+", help="taxas de chegada (req/s); substitui --concurrency")
+    ap.add_argument("--duration", type=float, default=30.0, help="segundos por degrau")
+    ap.add_argument("--max-inflight", type=int, default=512)
+    ap.add_argument("--warmup", type=int, default=2, help="concorrência do aquecimento (0 = sem)")
+    ap.add_argument("--users", type=int, default=50, help="usuários distintos (a cota diária é por usuário)")
+    ap.add_argument("--quota", type=int,
+                    help="DAILY_QUESTION_LIMIT do servidor iniciado pelo script (padrão: sem limite prático)")
+    ap.add_argument("--topic", default="NVIDIA")
+    ap.add_argument("--question", default="Qual a percepção sobre as novas placas?")
+    ap.add_argument("--post-limit", type=int, default=300)
+    ap.add_argument("--llm-model", default="stub")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--slo-p95", type=float, default=10.0, help="p95 máximo aceito (s)")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--json", help="grava os resultados em JSON")
+    args = ap.parse_args()
+
+    run_id = int(time.time())
+    payload = {"topic": args.topic, "question": args.question, "llm_model": args.llm_model, "post_limit": args.post_limit}
+
+    report = {}
+    targets = [(f"{args.server}, {n} worker(s)", n) for n in args.spawn_workers] if args.spawn_workers else [(args.url, None)]
+    for n_target, (title, workers) in enumerate(targets):
+        proc = None
+        memory = None
+        base_url = f"http://127.0.0.1:{args.port}" if workers else args.url
+        # usuários novos a cada alvo: a cota gasta num teste não vira 429 no seguinte
+        tokens = make_tokens(f"loadtest-{run_id}-{n_target}", args.users)
+        state_dir = tempfile.TemporaryDirectory(prefix="loadtest-") if workers else None
+        try:
+            if workers:
+                proc = spawn_server(workers, args.port, args.quota, args.server, state_dir.name)
+                wait_ready(base_url, proc)
+            print(f"\n>> {title}", flush=True)
+            results = asyncio.run(run_ramp(Driver(base_url, tokens, payload, args.timeout), args))
+            if proc and sys.platform.startswith("linux"):
+                memory = server_memory_mb(proc.pid)
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait(timeout=30)
+            if state_dir:
+                state_dir.cleanup()  # apaga os SQLite (e -wal/-shm) deste servidor
+        sat = saturation(results, args.slo_p95, args.max_error_rate)
+        print_report(title, results, sat)
+        if memory:
+            print(f"memória do servidor: RSS {memory['rss_mb']:.0f} MB, PSS {memory['pss_mb']:.0f} MB")
+        report[title] = {
+            "workers": workers,
+            "server": args.server if workers else None,
+            "memory": memory,
+            "steps": [r.to_dict() for r in results],
+            "saturation": sat.to_dict() if sat else None,
+        }
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nresultados em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
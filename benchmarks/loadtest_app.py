@@ -0,0 +1,131 @@
+# benchmarks/loadtest_app.py
+"""
+Backend real (`src.main:app`) com provedores externos trocados por stubs locais,
+para teste de carga sem rede, sem custo de LLM e sem esbarrar no rate limit do Bluesky.
+
+- Bluesky: páginas sintéticas de até 100 posts com latência por página configurável;
+- LLM: chat model local que só dorme (`STUB_LLM_LATENCY_MS`) e devolve um texto fixo;
+- embeddings: o MiniLM real (padrão, é o custo de CPU que importa) ou vetores por
+  hash (`STUB_EMBEDDINGS=1`) para isolar o overhead do resto do pipeline;
+- limiter: o do app (Redis com `REDIS_URL`; sem ele, `RATE_LIMIT_DB` compartilhado
+  pelos workers, que `loadtest.py --spawn-workers` aponta para um arquivo temporário).
+
+Subir:
+    uvicorn benchmarks.loadtest_app:app --port 8001 --workers 4
+(ou deixe `benchmarks/loadtest.py --spawn-workers 1 4` subir e derrubar o servidor).
+
+Variáveis:
+    STUB_BSKY_PAGE_LATENCY_MS=150  STUB_BSKY_ERROR_RATE=0  STUB_LLM_LATENCY_MS=800
+    STUB_EMBEDDINGS=0
+"""
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import src.main as backend  # noqa: E402
+from src.clients.bluesky_client import BlueskyUnavailableError  # noqa: E402
+from src.core.post_batch import PostBatch  # noqa: E402
+from src.services import rag_service  # noqa: E402
+
+PAGE_LATENCY_S = float(os.getenv("STUB_BSKY_PAGE_LATENCY_MS", "150")) / 1000
+BSKY_ERROR_RATE = float(os.getenv("STUB_BSKY_ERROR_RATE", "0"))
+LLM_LATENCY_S = float(os.getenv("STUB_LLM_LATENCY_MS", "800")) / 1000
+FAKE_EMBEDDINGS = os.getenv("STUB_EMBEDDINGS", "0").lower() in ("1", "true", "yes")
+
+_WORDS = (
+    "gpu placa preço lançamento desempenho jogo energia driver review fila estoque "
+    "benchmark consumo temperatura software atualização comunidade crítica elogio"
+).split()
+
+
+class StubBlueskyClient:
+    """Mesma interface usada pelo pipeline (`search_posts` paginado em `PostBatch`)."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start_refresh(self, interval: float) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def search_posts(self, query: str, limit: int = 50, filters=None):
+        rng = random.Random(f"{query}:{limit}")
+        now = datetime.now(timezone.utc)
+        fetched = 0
+        while fetched < limit:
+            time.sleep(PAGE_LATENCY_S)
+            if BSKY_ERROR_RATE and rng.random() < BSKY_ERROR_RATE:
+                raise BlueskyUnavailableError("stub: falha simulada do Bluesky", retry_after=1.0)
+            page = PostBatch()
+            for i in range(fetched, min(limit, fetched + 100)):
+                text = f"{query} " + " ".join(rng.choices(_WORDS, k=rng.randint(8, 40)))
+                page.append(
+                    uri=f"at://did:plc:stub{i}/app.bsky.feed.post/{i}",
+                    handle=f"user{i % 500}.bsky.social",
+                    display_name=f"Usuário {i % 500}",
+                    avatar=None,
+                    text=text,
+                    like_count=rng.randint(0, 200),
+                    repost_count=rng.randint(0, 50),
+                    created_at=(now - timedelta(minutes=i)).isoformat(),
+                    langs=rng.choice(("pt", "en")),
+                )
+            fetched += len(page)
+            if filters is not None:
+                page = page.filter(filters)
+            yield page
+
+
+def _stub_llm(llm_model: str, timeout=None):
+    from langchain_core.language_models.chat_models import SimpleChatModel
+
+    class SleepyChatModel(SimpleChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "stub-sleepy"
+
+        def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+            time.sleep(LLM_LATENCY_S)
+            return "Resposta simulada do teste de carga [1]."
+
+    return SleepyChatModel()
+
+
+@lru_cache(maxsize=1)
+def _hash_embeddings():
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+
+    dim = rag_service.EMBEDDING_DIM
+
+    class HashEmbeddings(Embeddings):
+        def _vec(self, text: str):
+            seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+            v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+            return (v / np.linalg.norm(v)).tolist()
+
+        def embed_documents(self, texts):
+            return [self._vec(t) for t in texts]
+
+        def embed_query(self, text):
+            return self._vec(text)
+
+    return HashEmbeddings()
+
+
+backend.BlueskyClient = StubBlueskyClient
+rag_service._build_llm = _stub_llm
+if FAKE_EMBEDDINGS:
+    rag_service.get_embeddings = _hash_embeddings
+
+app = backend.app
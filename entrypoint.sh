@@ -5,7 +5,11 @@ sed -i 's/\r$//' /entrypoint.sh || true
 if [ "$ROLE" = "frontend" ]; then
   echo "Starting Streamlit (frontend) on :8501"
   exec poetry run streamlit run app.py --server.port=8501 --server.address=0.0.0.0
+elif [ "$SERVE_MODE" = "dev" ]; then
+  echo "Starting FastAPI (backend, dev/reload) on :8000"
+  exec poetry run uvicorn src.main:app --host 0.0.0.0 --port 8000 --reload
 else
-  echo "Starting FastAPI (backend) on :8000"
-  exec poetry run uvicorn src.main:app --host 0.0.0.0 --port 8000
+  # produção: gunicorn + N workers uvicorn, modelo carregado antes do fork (ver gunicorn.conf.py)
+  echo "Starting FastAPI (backend) on :8000 with ${WEB_CONCURRENCY:-auto} workers"
+  exec poetry run gunicorn -c gunicorn.conf.py src.main:app
 fi
@@ -0,0 +1,57 @@
+# gunicorn.conf.py
+"""
+Modo de produção do backend: vários workers uvicorn sob o gunicorn.
+
+    gunicorn -c gunicorn.conf.py src.main:app
+
+- `preload_app`: o master importa o app e carrega o modelo de embeddings
+  (`warmup(exercise=False)`) antes do fork; os workers herdam os pesos
+  copy-on-write em vez de cada um carregar sua cópia. `gc.freeze()` evita que
+  o coletor de lixo dos workers toque (e copie) essas páginas.
+- Cada worker limita as threads do torch a CPUs / workers (sem oversubscription).
+- Estado compartilhado: cota e snapshots no Redis (REDIS_URL) ou em SQLite no
+  disco local; a sessão do Bluesky tem um único dono que a renova.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))   # análises longas (busca + embedding + LLM)
+graceful_timeout = 30
+keepalive = 5
+
+# master: carrega os pesos antes do fork; workers: aquecem (inferência) no próprio lifespan
+os.environ.setdefault("PRELOAD_MODELS", "true")
+
+# a cota precisa de um armazenamento visto por todos os workers: com REDIS_URL o
+# RateLimiter usa o Redis (e falha se o pacote faltar); sem ele, este SQLite
+os.environ.setdefault("RATE_LIMIT_DB", "ratelimit.db")
+
+if os.getenv("INGEST_SOURCE") and workers > 1:
+    print(
+        "Aviso: com INGEST_SOURCE cada worker mantém o próprio corpus e a própria conexão de ingestão; "
+        "use WEB_CONCURRENCY=1 (ou uma réplica dedicada) para a ingestão contínua."
+    )
+
+
+def when_ready(server):
+    # roda no master, depois do preload do app e antes do fork dos workers
+    if os.environ["PRELOAD_MODELS"].lower() in ("1", "true", "yes"):
+        from src.services.rag_service import warmup
+
+        server.log.info("Carregando o modelo de embeddings antes do fork...")
+        warmup(exercise=False)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import sys
+
+    if "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
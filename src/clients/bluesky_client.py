@@ -1,84 +1,273 @@
 # src/clients/bluesky_client.py
-from atproto import Client, models
+import os
+import random
+import socket
+import threading
+import time
+from typing import Callable, Iterator, Optional, TypeVar
+from atproto import Client, SessionEvent, models
 from src.core.config import settings
+from src.core.post_batch import PostBatch, PostFilters
+from src.clients.session_store import SessionStore
+
+T = TypeVar("T")
+
+# 429 e 5xx são transitórios; o resto (400/401/403/404) não melhora com retry
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class BlueskyUnavailableError(Exception):
+    """O Bluesky continuou indisponível (429/5xx/rede) após todas as tentativas."""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _status_of(exc: Exception) -> Optional[int]:
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+def _retry_after_of(exc: Exception) -> Optional[float]:
+    """Lê Retry-After / RateLimit-Reset da resposta de erro, se houver."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+    try:
+        if "retry-after" in headers:
+            return max(0.0, float(headers["retry-after"]))
+        if "ratelimit-reset" in headers:
+            return max(0.0, float(headers["ratelimit-reset"]) - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
 
 class BlueskyClient:
-    def __init__(self):
+    """
+    Cliente do Bluesky com sessão persistida e login preguiçoso.
+
+    - A session string do atproto fica no `SessionStore` (Redis ou arquivo) e é
+      reaproveitada entre reinícios e entre workers; login com senha só quando
+      não há sessão válida.
+    - O login acontece no primeiro uso, não no startup da API.
+    - Uma thread renova os tokens em segundo plano (`start_refresh`). Com vários
+      workers, só o dono da sessão (`SessionStore.try_lease`) renova; os demais
+      adotam a sessão gravada por ele quando ela muda.
+    """
+    def __init__(
+        self,
+        session_store: Optional[SessionStore] = None,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+    ):
         self.client = Client()
         self._profile = None
+        self._store = session_store
+        self._login_lock = threading.Lock()
+        self._refresh_stop = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._session_string: Optional[str] = None
+        self.client.on_session_change(self._on_session_change)
+
+    def _on_session_change(self, event: SessionEvent, session) -> None:
+        # chamado pelo SDK no login e a cada refresh de token
+        if self._store and event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            try:
+                self._session_string = session.export()
+                self._store.save(self._session_string)
+            except Exception as e:
+                print(f"Não foi possível salvar a sessão do Bluesky: {e}")
 
-    def login(self):
-        """Realiza o login na API do Bluesky usando as credenciais das configurações."""
-        if self._profile:
+    def login(self, force: bool = False):
+        """
+        Garante uma sessão válida: reaproveita a sessão persistida e só faz
+        login com as credenciais das configurações se ela não existir ou expirou.
+        """
+        if self._profile and not force:
             return self._profile
+        with self._login_lock:
+            if self._profile and not force:
+                return self._profile
+            if self._store is None:
+                self._profile = self._password_login()
+                return self._profile
+            with self._store.lock():
+                # outro worker pode ter acabado de logar enquanto esperávamos o lock
+                session_string = self._store.load()
+                if session_string:
+                    try:
+                        self._profile = self.client.login(session_string=session_string)
+                        self._session_string = session_string
+                        print(f"Sessão do Bluesky reaproveitada: {self._profile.handle}")
+                        return self._profile
+                    except Exception as e:
+                        print(f"Sessão salva inválida, refazendo login: {e}")
+                        self._store.clear()
+                self._profile = self._password_login()
+                return self._profile
+
+    def _password_login(self):
         try:
-            self._profile = self.client.login(
+            profile = self.client.login(
                 settings.BSKY_HANDLE, settings.BSKY_APP_PASSWORD
             )
-            print(f"Login bem-sucedido como: {self._profile.display_name}")
-            return self._profile
+            print(f"Login bem-sucedido como: {profile.display_name}")
+            return profile
         except Exception as e:
             print(f"Erro no login: {e}")
             raise
 
+    def start_refresh(self, interval: float = 15 * 60) -> None:
+        """Renova os tokens periodicamente em segundo plano (o SDK faz o refresh antes do JWT expirar)."""
+        if self._refresh_thread is not None:
+            return
+
+        def _loop():
+            while not self._refresh_stop.wait(interval):
+                if not self._profile:
+                    continue
+                try:
+                    if self._store is None or self._store.try_lease(self.owner_id, ttl=3 * interval):
+                        self.client.com.atproto.server.get_session()
+                    else:
+                        self._adopt_stored_session()
+                except Exception as e:
+                    print(f"Falha ao renovar a sessão do Bluesky: {e}")
+
+        self._refresh_thread = threading.Thread(target=_loop, name="bsky-session-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def _adopt_stored_session(self) -> None:
+        """Worker que não é dono: passa a usar a sessão que o dono renovou e gravou."""
+        with self._login_lock:
+            session_string = self._store.load()
+            if session_string and session_string != self._session_string:
+                self._profile = self.client.login(session_string=session_string)
+                self._session_string = session_string
+
+    def close(self) -> None:
+        self._refresh_stop.set()
+
+    def _call(self, fn: Callable[[], T], what: str) -> T:
+        """
+        Executa uma chamada à API com login preguiçoso e retry com backoff
+        exponencial + jitter para 429/5xx/erros de rede. Respeita Retry-After.
+        O login (createSession ou retomada da sessão) fica dentro do mesmo
+        retry: Bluesky fora do ar no primeiro uso também vira
+        `BlueskyUnavailableError` (503), não um erro cru do SDK.
+        """
+        relogged = False
+        force_login = False
+        attempt = 0
+        while True:
+            try:
+                self.login(force=force_login)
+                force_login = False
+                return fn()
+            except Exception as e:
+                status = _status_of(e)
+                expired = status == 401 or (status == 400 and "ExpiredToken" in str(e))
+                if expired and not relogged:
+                    # sessão revogada/expirada fora do nosso controle
+                    relogged = True
+                    force_login = True
+                    continue
+                network_error = status is None and getattr(e, "response", "absent") is None
+                if status not in RETRYABLE_STATUS and not network_error:
+                    raise
+                retry_after = _retry_after_of(e)
+                if attempt >= self.max_retries:
+                    raise BlueskyUnavailableError(
+                        f"Bluesky indisponível ao {what} (status {status}): {e}", retry_after
+                    ) from e
+                # "full jitter": espera aleatória até o teto exponencial
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.backoff_cap))
+                print(f"Bluesky respondeu {status or 'erro de rede'} ao {what}; nova tentativa em {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
     def fetch_posts_from_feed(self, feed_uri: str, limit: int = 10) -> list[models.AppBskyFeedDefs.FeedViewPost]:
         """Busca posts de um feed específico (pode ser instável se o feed mudar)."""
-        if not self._profile:
-            self.login()
-        
         try:
-            response = self.client.app.bsky.feed.get_feed(
-                params=models.AppBskyFeedGetFeed.Params(feed=feed_uri, limit=limit)
+            response = self._call(
+                lambda: self.client.app.bsky.feed.get_feed(
+                    params=models.AppBskyFeedGetFeed.Params(feed=feed_uri, limit=limit)
+                ),
+                "buscar o feed",
             )
             return response.feed
         except Exception as e:
             print(f"Erro ao buscar o feed: {e}")
             return []
 
-    def search_posts(self, query: str, limit: int = 50) -> list[models.AppBskyFeedDefs.PostView]:
+    def search_posts(
+        self, query: str, limit: int = 50, filters: Optional[PostFilters] = None
+    ) -> Iterator[PostBatch]:
         """
-        Busca posts que contenham um termo de busca (query),
-        lidando com paginação para buscar mais de 100 posts.
+        Busca posts que contenham um termo de busca (query), página a página.
+        Gera um `PostBatch` por página (até 100 posts) assim que ela chega, para
+        que o consumidor processe uma página enquanto a próxima é baixada.
+        Os objetos do SDK são descartados logo após o parse de cada página.
+
+        `since`/`until`/`lang` dos `filters` vão para a própria busca; o restante
+        (engajamento mínimo) é aplicado no parse, antes de qualquer embedding.
+
+        429/5xx são re-tentados com backoff; se persistirem, levanta
+        `BlueskyUnavailableError` (em vez de terminar a busca em silêncio).
         """
-        if not self._profile:
-            self.login()
-        
-        all_posts = []
+        fetched = 0
         cursor = None
+        search_filters = {}
+        if filters is not None:
+            if filters.since:
+                search_filters["since"] = filters.since.isoformat()
+            if filters.until:
+                search_filters["until"] = filters.until.isoformat()
+            if filters.lang:
+                search_filters["lang"] = filters.lang
         
         # O limite da API é 100 por chamada. Vamos fazer chamadas em loop.
         api_limit_per_call = 100
 
-        try:
-            while len(all_posts) < limit:
-                remaining_needed = limit - len(all_posts)
-                current_limit = min(remaining_needed, api_limit_per_call)
-
-                if current_limit <= 0:
-                    break
-
-                response = self.client.app.bsky.feed.search_posts(
-                    params=models.AppBskyFeedSearchPosts.Params(
-                        q=query, 
-                        limit=current_limit, 
-                        cursor=cursor
-                    )
-                )
-                
-                if not response.posts:
-                    # Não há mais posts para buscar
-                    break
-                
-                all_posts.extend(response.posts)
-                cursor = response.cursor
-
-                if not cursor:
-                    # Chegamos ao fim dos resultados
-                    break
+        while fetched < limit:
+            remaining_needed = limit - fetched
+            current_limit = min(remaining_needed, api_limit_per_call)
+
+            if current_limit <= 0:
+                break
+
+            params = models.AppBskyFeedSearchPosts.Params(
+                q=query, 
+                limit=current_limit, 
+                cursor=cursor,
+                **search_filters,
+            )
+            response = self._call(
+                lambda: self.client.app.bsky.feed.search_posts(params=params),
+                f"buscar posts com o termo '{query}'",
+            )
+            
+            if not response.posts:
+                # Não há mais posts para buscar
+                break
             
-            # Retorna a quantidade exata de posts solicitada no limite
-            return all_posts[:limit]
+            page = PostBatch()
+            posts = response.posts[:remaining_needed]
+            fetched += len(posts)
+            page.extend_from_posts(posts, filters)
+            cursor = response.cursor
+            # libera os PostView desta página antes de entregá-la
+            del posts, response
 
-        except Exception as e:
-            print(f"Erro ao buscar posts com o termo '{query}': {e}")
-            return []
\ No newline at end of file
+            if len(page):
+                yield page
+
+            if not cursor:
+                # Chegamos ao fim dos resultados
+                break
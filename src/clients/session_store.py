@@ -0,0 +1,118 @@
+# src/clients/session_store.py
+from __future__ import annotations
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import redis  # type: ignore
+except Exception:
+    redis = None  # fallback se não estiver instalado
+
+try:
+    import fcntl  # POSIX
+except Exception:
+    fcntl = None
+
+
+class SessionStore:
+    """
+    Guarda a session string do atproto para reaproveitar entre processos.
+    - Redis em produção (compartilhado entre workers/réplicas); arquivo local em dev.
+    - `lock()` serializa o login: só um processo faz login com senha por vez,
+      os demais esperam e reutilizam a sessão gravada.
+    - `try_lease()` elege um dono da sessão entre os workers (quem renova os tokens).
+    """
+    def __init__(self, redis_url: Optional[str] = None, path: str = ".bsky_session", key: str = "bsky:session"):
+        self.client = None
+        if redis_url and redis is None:
+            # o arquivo local não é visto pelas outras réplicas: lease e sessão deixariam de ser únicos
+            raise RuntimeError("REDIS_URL definido, mas o pacote 'redis' não está instalado.")
+        if redis_url:
+            self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.path = path
+        self.key = key
+        self._lease_file = None
+
+    def load(self) -> Optional[str]:
+        if self.client:
+            return self.client.get(self.key)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, session_string: str) -> None:
+        if self.client:
+            self.client.set(self.key, session_string)
+            return
+        tmp = f"{self.path}.tmp"
+        # escrita atômica e legível só pelo dono (contém tokens)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(session_string)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if self.client:
+            self.client.delete(self.key)
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, timeout: float = 30.0) -> Iterator[None]:
+        if self.client:
+            with self.client.lock(f"{self.key}:lock", timeout=timeout, blocking_timeout=timeout):
+                yield
+            return
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "w") as f:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError("Timeout aguardando o lock da sessão do Bluesky.")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_lease(self, owner: str, ttl: float) -> bool:
+        """
+        Posse da sessão entre workers: só o dono renova os tokens em segundo plano.
+        Redis: chave com TTL (renovada pelo dono a cada chamada). Arquivo: flock
+        não bloqueante mantido aberto pelo processo dono (liberado se ele morrer).
+        """
+        if self.client:
+            key = f"{self.key}:owner"
+            if self.client.set(key, owner, nx=True, ex=max(1, int(ttl))):
+                return True
+            if self.client.get(key) == owner:
+                self.client.expire(key, max(1, int(ttl)))
+                return True
+            return False
+        if fcntl is None:
+            return True
+        if self._lease_file is not None:
+            return True
+        f = open(f"{self.path}.owner", "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        f.write(owner)
+        f.flush()
+        self._lease_file = f
+        return True
@@ -0,0 +1,214 @@
+# src/core/post_batch.py
+from __future__ import annotations
+import sys
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # handles/avatares se repetem muito (mesmo autor, vários posts)
+    return sys.intern(value) if value else value
+
+
+def parse_ts(value: Optional[str]) -> Optional[datetime]:
+    """ISO 8601 do atproto ("...Z") -> datetime com fuso (UTC se vier sem)."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class PostFilters:
+    """
+    Filtros da análise. `since`/`until`/`lang` também vão como parâmetros da
+    busca; aqui eles valem como pré-filtro barato (antes do embedding) para
+    fontes que não os aplicam, como o corpus local.
+    """
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    lang: Optional[str] = None
+    min_engagement: int = 0
+
+    def __post_init__(self):
+        # datas sem fuso são tratadas como UTC
+        if self.since and not self.since.tzinfo:
+            self.since = self.since.replace(tzinfo=timezone.utc)
+        if self.until and not self.until.tzinfo:
+            self.until = self.until.replace(tzinfo=timezone.utc)
+        self.lang = (self.lang or "").lower() or None
+
+    def accepts(self, created_at: Optional[str], langs: Optional[str], engagement: int) -> bool:
+        if engagement < self.min_engagement:
+            return False
+        # posts sem idioma declarado passam; "pt" aceita "pt" e "pt-BR"
+        if self.lang and langs is not None and not any(
+            code.lower() == self.lang or code.lower().startswith(self.lang + "-") for code in langs.split(",")
+        ):
+            return False
+        if self.since or self.until:
+            ts = parse_ts(created_at)
+            if ts is None:
+                return False
+            if self.since and ts < self.since:
+                return False
+            if self.until and ts >= self.until:
+                return False
+        return True
+
+
+class PostBatch:
+    """
+    Lote colunar de posts (arrays paralelos, um índice por post).
+
+    Substitui a lista de `PostView` do SDK + `post_texts` + `raw_posts`:
+    cada campo vive uma única vez, e os objetos do atproto podem ser
+    descartados logo após o parse de cada página.
+    """
+    __slots__ = (
+        "uris", "handles", "display_names", "avatars", "texts",
+        "like_counts", "repost_counts", "created_ats", "langs",
+    )
+
+    def __init__(self):
+        self.uris: List[str] = []
+        self.handles: List[Optional[str]] = []
+        self.display_names: List[Optional[str]] = []
+        self.avatars: List[Optional[str]] = []
+        self.texts: List[str] = []
+        self.like_counts = array("L")
+        self.repost_counts = array("L")
+        self.created_ats: List[Optional[str]] = []
+        self.langs: List[Optional[str]] = []  # códigos separados por vírgula ("pt,en")
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def append(
+        self,
+        uri: str,
+        handle: Optional[str],
+        display_name: Optional[str],
+        avatar: Optional[str],
+        text: str,
+        like_count: int = 0,
+        repost_count: int = 0,
+        created_at: Optional[str] = None,
+        langs: Optional[str] = None,
+    ) -> None:
+        self.uris.append(uri)
+        self.handles.append(_intern(handle))
+        self.display_names.append(_intern(display_name))
+        self.avatars.append(_intern(avatar))
+        self.texts.append(text)
+        self.like_counts.append(like_count or 0)
+        self.repost_counts.append(repost_count or 0)
+        self.created_ats.append(created_at)
+        self.langs.append(_intern(langs))
+
+    def extend(self, other: "PostBatch") -> None:
+        """Concatena outro lote (ex.: uma página) a este."""
+        self.uris.extend(other.uris)
+        self.handles.extend(other.handles)
+        self.display_names.extend(other.display_names)
+        self.avatars.extend(other.avatars)
+        self.texts.extend(other.texts)
+        self.like_counts.extend(other.like_counts)
+        self.repost_counts.extend(other.repost_counts)
+        self.created_ats.extend(other.created_ats)
+        self.langs.extend(other.langs)
+
+    def take(self, rows: Iterable[int]) -> "PostBatch":
+        """Novo lote apenas com as linhas indicadas (na ordem dada)."""
+        out = PostBatch()
+        for i in rows:
+            out.append(
+                self.uris[i], self.handles[i], self.display_names[i], self.avatars[i],
+                self.texts[i], self.like_counts[i], self.repost_counts[i], self.created_ats[i],
+                self.langs[i],
+            )
+        return out
+
+    def filter(self, filters: Optional[PostFilters]) -> "PostBatch":
+        """Aplica os pré-filtros; devolve o próprio lote se não houver filtros."""
+        if filters is None:
+            return self
+        return self.take(i for i in range(len(self)) if self.accepts(i, filters))
+
+    def accepts(self, i: int, filters: PostFilters) -> bool:
+        return filters.accepts(
+            self.created_ats[i], self.langs[i], self.like_counts[i] + self.repost_counts[i]
+        )
+
+    def drop_head(self, n: int) -> None:
+        """Remove as `n` primeiras linhas (usado na compactação do corpus rolante)."""
+        for name in self.__slots__:
+            del getattr(self, name)[:n]
+
+    def extend_from_posts(self, posts: Iterable[Any], filters: Optional[PostFilters] = None) -> int:
+        """
+        Faz o parse de `PostView`s (resposta do search_posts) direto para as colunas.
+        Posts sem texto ou recusados pelos `filters` são ignorados.
+        Retorna quantos posts foram adicionados.
+        """
+        added = 0
+        for post in posts:
+            record = getattr(post, "record", None)
+            text = getattr(record, "text", "")
+            if not text:
+                continue
+            created_at = getattr(record, "created_at", None)
+            langs = ",".join(getattr(record, "langs", None) or []) or None
+            like_count = getattr(post, "like_count", 0) or 0
+            repost_count = getattr(post, "repost_count", 0) or 0
+            if filters is not None and not filters.accepts(created_at, langs, like_count + repost_count):
+                continue
+            author = getattr(post, "author", None)
+            self.append(
+                uri=getattr(post, "uri", ""),
+                handle=getattr(author, "handle", "N/A"),
+                display_name=getattr(author, "display_name", "N/A"),
+                avatar=getattr(author, "avatar", None),
+                text=text,
+                like_count=like_count,
+                repost_count=repost_count,
+                created_at=created_at,
+                langs=langs,
+            )
+            added += 1
+        return added
+
+    # --- Visões no formato legado da API -----------------------------------
+    def raw_post(self, i: int) -> Dict[str, Any]:
+        """Monta o dict de um post no formato de `raw_posts` (cards da UI)."""
+        return {
+            "uri": self.uris[i],
+            "author": {
+                "handle": self.handles[i],
+                "display_name": self.display_names[i],
+                "avatar": self.avatars[i],
+            },
+            "record": {"text": self.texts[i]},
+            "like_count": self.like_counts[i],
+            "repost_count": self.repost_counts[i],
+            "created_at": self.created_ats[i],
+        }
+
+    def raw_posts(self) -> List[Dict[str, Any]]:
+        return [self.raw_post(i) for i in range(len(self))]
+
+    def source(self, i: int, score: float) -> Dict[str, Any]:
+        """Monta o dict de uma fonte recuperada (top-k) com score."""
+        return {
+            "uri": self.uris[i],
+            "author": self.handles[i],
+            "avatar": self.avatars[i],
+            "text": self.texts[i],
+            "score": float(score),
+            "created_at": self.created_ats[i],
+        }
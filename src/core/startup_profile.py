@@ -0,0 +1,117 @@
+# src/core/startup_profile.py
+"""
+Perfil de cold start do backend.
+
+- Tempo de import por módulo (`python -X importtime`, em processo limpo).
+- Quais módulos pesados (torch, LangChain, SDKs de LLM...) o import já puxa.
+- Tempo até a primeira requisição pronta (sobe o uvicorn e faz polling em `/`).
+
+Uso:
+    python -m src.main --profile-startup
+"""
+from __future__ import annotations
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+# Devem carregar só sob demanda (ou no warmup), nunca no import da API
+HEAVY_MODULES = (
+    "torch", "sentence_transformers", "transformers", "faiss",
+    "langchain", "langchain_community", "langchain_openai", "langchain_google_genai",
+    "openai", "google.generativeai", "matplotlib", "wordcloud", "nltk",
+)
+
+
+def import_times(module: str = "src.main") -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    Importa `module` em um interpretador novo com `-X importtime`.
+    Retorna (total_s, [(pacote_raiz, self_s, cumulativo_s), ...]) ordenado pelo cumulativo.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{proc.stderr[-2000:]}")
+    roots: Dict[str, List[float]] = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth > 1:
+            continue
+        # nível 1 = import feito direto pelo interpretador (inclui a raiz de cada pacote)
+        root = name.split(".")[0]
+        agg = roots.setdefault(root, [0.0, 0.0])
+        agg[0] += int(self_us) / 1e6
+        agg[1] += int(cumulative_us) / 1e6
+        total_us += int(cumulative_us)
+    rows = sorted(((k, v[0], v[1]) for k, v in roots.items()), key=lambda r: r[2], reverse=True)
+    return total_us / 1e6, rows
+
+
+def heavy_modules_loaded(module: str = "src.main") -> List[str]:
+    """Módulos de `HEAVY_MODULES` presentes em sys.modules após importar `module`."""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=os.environ.copy())
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{proc.stderr[-2000:]}")
+    out = proc.stdout.strip().splitlines()
+    return [m for m in (out[-1].split(",") if out else []) if m]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_ready(app: str = "src.main:app", timeout: float = 120.0, env: Optional[dict] = None) -> float:
+    """Sobe o uvicorn em uma porta livre e mede até `GET /` responder 200."""
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, **(env or {})},
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn terminou com código {proc.returncode} antes de ficar pronto")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - t0
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"API não ficou pronta em {timeout:.0f}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run(top: int = 15) -> Dict[str, float]:
+    """Imprime o relatório de cold start e retorna os números principais."""
+    total, rows = import_times()
+    print(f"Import de src.main: {total:.3f}s")
+    print(f"{'módulo':<28} {'self (s)':>9} {'cumul. (s)':>11}")
+    for name, self_s, cum_s in rows[:top]:
+        print(f"{name:<28} {self_s:>9.3f} {cum_s:>11.3f}")
+    heavy = heavy_modules_loaded()
+    print(f"Módulos pesados carregados no import: {', '.join(heavy) or 'nenhum'}")
+    ready = time_to_first_ready()
+    print(f"Tempo até a primeira requisição pronta: {ready:.3f}s")
+    return {"import_s": total, "ready_s": ready, "heavy_modules": float(len(heavy))}
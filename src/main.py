@@ -1,32 +1,45 @@
 # src/main.py
+import asyncio
 import os
+import sys
+import time
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request, Depends, Response
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel, Field
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, nullcontext, suppress
 from typing import List, Dict, Any
 from typing import Optional
 
+# antes de qualquer src.*: vários módulos leem o ambiente ao serem importados
+# (admissão, prazos, cascata, tracing, roteador de LLM)
+from dotenv import load_dotenv
+load_dotenv()  # ensure .env is loaded into os.environ
+
 # --- IMPORTAÇÕES ADICIONAIS ---
 from starlette.middleware.sessions import SessionMiddleware
 # Adicione a importação do CORSMiddleware aqui
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.services.rag_service import perform_rag_analysis
-from src.clients.bluesky_client import BlueskyClient
+from fastapi.concurrency import run_in_threadpool
+from src.services.rag_service import perform_rag_analysis, get_embeddings, warmup, EMBEDDING_DIM
+from src.services.profiler import SamplingProfiler
+from src.services.tracing import span, trace_spans
+from src.services.llm_router import STATS as LLM_STATS
+from src.services.snapshots import SnapshotStore, new_snapshot_id
+from src.services.admission import AdmissionController, AdmissionRejected, STAGE_GATES, request_priority, set_priority
+from src.services.deadline import DEADLINE_STATS, Aborted, Deadline, use_deadline
+from src.core.post_batch import PostFilters
+from src.clients.bluesky_client import BlueskyClient, BlueskyUnavailableError
+from src.clients.session_store import SessionStore
 
 from authlib.integrations.starlette_client import OAuth
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
 from fastapi.security import OAuth2PasswordBearer
-from dotenv import load_dotenv
 from src.services.rate_limit import RateLimiter
 from src.core.config import settings
 
-
-load_dotenv()  # ensure .env is loaded into os.environ
-
 # --- CONFIGURAÇÃO DE AUTENTICAÇÃO ---
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
@@ -37,20 +50,84 @@ SESSION_COOKIE_SECRET = os.environ.get('SESSION_COOKIE_SECRET', 'outra-chave-sec
 
 DAILY_QUESTION_LIMIT = int(os.getenv("DAILY_QUESTION_LIMIT", "50"))
 REDIS_URL = os.getenv("REDIS_URL", "")
+# Sem Redis: contadores de cota num SQLite compartilhado pelos workers (vazio = memória, por processo)
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "")
+# Sessão do Bluesky persistida (Redis se REDIS_URL, senão este arquivo) e renovada em segundo plano
+BSKY_SESSION_FILE = os.getenv("BSKY_SESSION_FILE", ".bsky_session")
+BSKY_SESSION_REFRESH_SECONDS = float(os.getenv("BSKY_SESSION_REFRESH_SECONDS", "900"))
+
+# Ingestão contínua (opcional): "jetstream" | "replay" | "" (desligada -> busca na API a cada pergunta)
+INGEST_SOURCE = os.getenv("INGEST_SOURCE", "").lower()
+INGEST_REPLAY_FILE = os.getenv("INGEST_REPLAY_FILE", "")
+JETSTREAM_URL = os.getenv("JETSTREAM_URL", "")
+CORPUS_MAX_POSTS = int(os.getenv("CORPUS_MAX_POSTS", "200000"))
+CORPUS_MAX_AGE_HOURS = float(os.getenv("CORPUS_MAX_AGE_HOURS", "24"))
+
+
+# Snapshots imutáveis das análises: SQLite local (padrão) ou Redis (SNAPSHOT_STORE=redis)
+SNAPSHOT_STORE = os.getenv("SNAPSHOT_STORE", "sqlite").lower()
+SNAPSHOT_DB = os.getenv("SNAPSHOT_DB", "snapshots.db")
+SNAPSHOT_TTL_DAYS = float(os.getenv("SNAPSHOT_TTL_DAYS", "0"))  # 0 = sem expiração
+SNAPSHOT_CACHE_CONTROL = os.getenv("SNAPSHOT_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+# E-mails autorizados a pedir `POST /analyze?profile=1` (trace + flamegraph da requisição)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# Prazo de cada análise (da chegada da requisição): o cliente pode pedir menos, nunca mais que o teto
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "110"))
+REQUEST_DEADLINE_MAX_S = float(os.getenv("REQUEST_DEADLINE_MAX_S", "170"))
+DISCONNECT_POLL_S = 0.5
+
+# Carrega LangChain/torch/modelo de embeddings no startup em vez de na primeira pergunta
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+
+
+def _start_ingestion(app: FastAPI) -> None:
+    # importados aqui: numpy/websockets só entram quando a ingestão está ligada
+    from src.services.corpus import RollingCorpus
+    from src.services.ingest import IngestionService, JetstreamSource, ReplaySource
+
+    if INGEST_SOURCE == "jetstream":
+        source = JetstreamSource(JETSTREAM_URL) if JETSTREAM_URL else JetstreamSource()
+    elif INGEST_SOURCE == "replay":
+        source = ReplaySource(INGEST_REPLAY_FILE)
+    else:
+        raise ValueError(f"INGEST_SOURCE inválido: {INGEST_SOURCE}")
+    corpus = RollingCorpus(EMBEDDING_DIM, max_posts=CORPUS_MAX_POSTS, max_age_seconds=CORPUS_MAX_AGE_HOURS * 3600)
+    app.state.corpus = corpus
+    app.state.ingestion = IngestionService(source, corpus, get_embeddings()).start()
+    print(f"Ingestão contínua ativa ({INGEST_SOURCE}).")
 
 
 # mantém seu lifespan e inicializa tudo lá dentro
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Iniciando a API...")
-    bsky_client = BlueskyClient()
-    bsky_client.login()
+    # login preguiçoso: a sessão é carregada/criada na primeira busca, não no startup
+    bsky_client = BlueskyClient(session_store=SessionStore(REDIS_URL, path=BSKY_SESSION_FILE))
+    bsky_client.start_refresh(BSKY_SESSION_REFRESH_SECONDS)
     app.state.bsky_client = bsky_client
 
     # inicializa o rate limiter aqui
-    app.state.limiter = RateLimiter(REDIS_URL)
+    app.state.limiter = RateLimiter(REDIS_URL, db_path=RATE_LIMIT_DB or None)
+    app.state.snapshots = SnapshotStore(
+        REDIS_URL, path=SNAPSHOT_DB, use_redis=SNAPSHOT_STORE == "redis", ttl_days=SNAPSHOT_TTL_DAYS
+    )
+    # limite de análises simultâneas por worker, com fila por prioridade (ADMISSION_*)
+    app.state.admission = AdmissionController.from_env()
+
+    if PRELOAD_MODELS:
+        await run_in_threadpool(warmup)
+
+    app.state.corpus = None
+    if INGEST_SOURCE:
+        _start_ingestion(app)
 
     yield
+    if getattr(app.state, "ingestion", None):
+        app.state.ingestion.stop()
+    bsky_client.close()
     print("Encerrando a API.")
 
 # crie o app DEPOIS de definir lifespan
@@ -97,6 +174,8 @@ def create_app_token(user_info: dict) -> str:
         'email': user_info.get('email'),
         'name': user_info.get('name'),
         'picture': user_info.get('picture'),
+        # tier define a prioridade na fila de admissão ("admin" > "pro" > demais)
+        'tier': 'admin' if (user_info.get('email') or '').lower() in ADMIN_EMAILS else user_info.get('tier'),
         'exp': expiration
     }
     return jwt.encode(jwt_payload, JWT_SECRET, algorithm='HS256')
@@ -126,7 +205,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 def _startup():
     # Isso pode ser redundante se já estiver no lifespan, mas não causa problemas.
     if not hasattr(app.state, "limiter"):
-      app.state.limiter = RateLimiter(REDIS_URL)
+      app.state.limiter = RateLimiter(REDIS_URL, db_path=RATE_LIMIT_DB or None)
+
+def authorize_profile(profile: bool = False, user: dict = Depends(get_current_user)) -> bool:
+    """`?profile=1` só para admins; roda antes de `enforce_quota`, então o 403 não gasta cota."""
+    if profile and (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Profiling disponível apenas para administradores.")
+    return profile
+
+def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    """Endpoints de estatísticas internas (`/*/stats`): só para `ADMIN_EMAILS`."""
+    if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Disponível apenas para administradores.")
+    return user
 
 def enforce_quota(request: Request, user: dict = Depends(get_current_user)):
     # fallback defensivo
@@ -148,17 +239,48 @@ def enforce_quota(request: Request, user: dict = Depends(get_current_user)):
 class AnalysisRequest(BaseModel):
     topic: str = Field(..., examples=["NVIDIA"])
     question: str = Field(..., examples=["Qual a percepção sobre as novas placas RTX?"])
-    llm_model: str = Field(default="gpt-4o-mini", description="O modelo de IA a ser usado.")
+    llm_model: str = Field(
+        default="gpt-4o-mini",
+        description='O modelo de IA a ser usado; "auto" escolhe pelo p95 recente dentro do teto de custo.',
+    )
+    max_cost_usd: Optional[float] = Field(default=None, gt=0, description='Teto de custo estimado para "auto" (USD).')
     top_k: int = Field(default=6, ge=1, le=12)
     economy_mode: bool = Field(default=False)
+    cascade: Optional[bool] = Field(
+        default=None, description="BM25 pré-seleciona os posts e só os candidatos são embedados (padrão: RAG_CASCADE)."
+    )
+    # Filtros: since/until/lang vão para a busca do Bluesky; min_engagement é pré-filtro antes do embedding
+    post_limit: int = Field(default=1000, ge=1, le=1000, description="Máximo de posts buscados.")
+    since: Optional[datetime] = Field(default=None, description="Apenas posts a partir deste instante (ISO 8601).")
+    until: Optional[datetime] = Field(default=None, description="Apenas posts antes deste instante (ISO 8601).")
+    lang: Optional[str] = Field(default=None, examples=["pt"], description="Código de idioma (ISO 639-1).")
+    min_engagement: int = Field(default=0, ge=0, description="Mínimo de curtidas + reposts.")
+    deadline_s: Optional[float] = Field(
+        default=None, gt=0, description="Prazo da análise em segundos (limitado por REQUEST_DEADLINE_MAX_S)."
+    )
+
+    def filters(self) -> Optional[PostFilters]:
+        if not (self.since or self.until or self.lang or self.min_engagement):
+            return None
+        return PostFilters(since=self.since, until=self.until, lang=self.lang, min_engagement=self.min_engagement)
 
 class AnalysisResponse(BaseModel):
     answer: str
     source_posts: List[str]
     raw_posts: List[Dict[str, Any]]
     sources: List[Dict[str, Any]]
-    timings: Dict[str, float]
+    timings: Dict[str, float]  # segundos por etapa
+    # contagens e proporções do pipeline (ex.: candidatos da cascata), fora de `timings`
+    stats: Dict[str, float] = Field(default_factory=dict)
     tokens: Dict[str, Any]
+    # prazo esgotado antes da resposta do LLM: `sources` sem `answer` de verdade
+    partial: bool = False
+    deadline: Optional[Dict[str, Any]] = None
+    # id do snapshot imutável: GET /analyses/{snapshot_id} devolve esta análise sem reprocessar
+    snapshot_id: Optional[str] = None
+    # só com ?profile=1 (admins): spans aninhados e pilhas "collapsed" para flamegraph
+    trace: Optional[List[Dict[str, Any]]] = None
+    profile: Optional[Dict[str, Any]] = None
 
 # --- Endpoints de Autenticação ---
 @app.get("/auth/login")
@@ -184,30 +306,201 @@ async def get_user(current_user: dict = Depends(get_current_user)):
 def read_root():
     return {"message": "Bem-vindo à API de Análise AskTheSky!"}
 
+async def _watch_disconnect(request: Request, deadline: Deadline) -> None:
+    """Cancela o prazo quando o cliente vai embora (timeout do Streamlit, aba fechada)."""
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
+
+async def _admit(admission: AdmissionController, priority, deadline: Deadline, watcher: asyncio.Task) -> float:
+    """Espera na fila de admissão, desistindo se o cliente desconectar ou o prazo acabar."""
+    acquiring = asyncio.ensure_future(admission.acquire(priority, timeout=deadline.remaining()))
+    await asyncio.wait({acquiring, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    if not acquiring.done() and deadline.cancelled:
+        acquiring.cancel()
+        with suppress(asyncio.CancelledError, AdmissionRejected):
+            await acquiring
+            admission.release()  # a vaga chegou junto com a desconexão: devolve
+        deadline.aborted_stage = "queue"
+        raise Aborted(deadline.reason, "queue")
+    return await acquiring
+
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_topic(
     request: AnalysisRequest,
     fastapi_request: Request,
     response: Response,
+    profile: bool = Depends(authorize_profile),  # antes da cota: dependências rodam na ordem declarada
     _quota_ok = Depends(enforce_quota),
     user: dict = Depends(get_current_user),
 ):
-    bsky_client = fastapi_request.app.state.bsky_client
-    result = perform_rag_analysis(
-        topic=request.topic,
-        question=request.question,
-        post_limit=1000,
-        llm_model=request.llm_model,
-        bsky_client=fastapi_request.app.state.bsky_client,
-        top_k=getattr(request, "top_k", 6),
-        economy_mode=getattr(request, "economy_mode", False),
-    )
+    # prioridade na fila: tier do JWT, depois quem tem mais cota restante
+    priority = request_priority(user.get("tier"), getattr(fastapi_request.state, "rate_remaining", 0))
+    set_priority(priority)  # herdada pelo threadpool: ordena também as filas de cada etapa
+    admission: AdmissionController = fastapi_request.app.state.admission
+    deadline = Deadline(min(request.deadline_s or REQUEST_DEADLINE_S, REQUEST_DEADLINE_MAX_S))
+    watcher = asyncio.create_task(_watch_disconnect(fastapi_request, deadline))
+    try:
+        return await _run_analysis(request, fastapi_request, response, user, profile, priority, admission, deadline, watcher)
+    finally:
+        watcher.cancel()
+
+async def _run_analysis(
+    request: AnalysisRequest,
+    fastapi_request: Request,
+    response: Response,
+    user: dict,
+    profile: bool,
+    priority,
+    admission: AdmissionController,
+    deadline: Deadline,
+    watcher: asyncio.Task,
+):
+    user_id = user.get("sub") or user.get("email") or "anon"
+    try:
+        queue_wait = await _admit(admission, priority, deadline, watcher)
+    except (AdmissionRejected, Aborted) as e:
+        # recusada (ou abandonada) antes de rodar: não conta na cota do dia
+        fastapi_request.app.state.limiter.refund(user_id)
+        if isinstance(e, Aborted):
+            DEADLINE_STATS.record(deadline)
+            raise HTTPException(status_code=499, detail="Cliente desconectou antes do início da análise.")
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+    profiler = SamplingProfiler(interval=PROFILE_INTERVAL_MS / 1000) if profile else None
+    started = time.perf_counter()
+    try:
+        with use_deadline(deadline), span(
+            "POST /analyze", llm_model=request.llm_model, profiled=profile, deadline_s=deadline.total_s
+        ) as root, (profiler or nullcontext()):
+            root.set_attribute("queue_wait", round(queue_wait, 3))
+            # o pipeline é bloqueante: roda no threadpool para o event loop continuar
+            # atendendo (e enfileirando) as outras requisições
+            result = await run_in_threadpool(
+                perform_rag_analysis,
+                topic=request.topic,
+                question=request.question,
+                post_limit=request.post_limit,
+                llm_model=request.llm_model,
+                bsky_client=fastapi_request.app.state.bsky_client,
+                top_k=getattr(request, "top_k", 6),
+                economy_mode=getattr(request, "economy_mode", False),
+                corpus=getattr(fastapi_request.app.state, "corpus", None),
+                filters=request.filters(),
+                max_cost_usd=request.max_cost_usd,
+                cascade=request.cascade,
+            )
+    except Aborted as e:
+        # o prazo vira resultado parcial dentro do pipeline; aqui só chega o cancelamento
+        print(f"Análise cancelada ({e}).")
+        raise HTTPException(status_code=499, detail="Cliente desconectou; análise cancelada.")
+    except BlueskyUnavailableError as e:
+        print(e)
+        raise HTTPException(
+            status_code=503,
+            detail="O Bluesky está indisponível no momento. Tente novamente em instantes.",
+            headers={"Retry-After": str(int(e.retry_after or 30))},
+        )
+    finally:
+        admission.release(time.perf_counter() - started)
+    result["timings"]["queue_wait"] = round(queue_wait, 3)
+    result["deadline"] = deadline.summary()
     # Rate limit headers
     response.headers["X-RateLimit-Limit"] = str(DAILY_QUESTION_LIMIT)
     response.headers["X-RateLimit-Remaining"] = str(getattr(fastapi_request.state, "rate_remaining", 0))
     response.headers["X-RateLimit-Reset"] = str(getattr(fastapi_request.state, "rate_reset", 0))
+    response.headers["X-Trace-Id"] = root.trace_id
+
+    if result.get("partial"):
+        # resposta cortada pelo prazo: não vira snapshot imutável (repetir a pergunta pode completá-la)
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        await _save_snapshot(fastapi_request, response, request, result, user)
+    if profile:
+        result["trace"] = trace_spans(root)
+        result["profile"] = profiler.to_dict()
     return AnalysisResponse(**result)
 
+async def _save_snapshot(
+    fastapi_request: Request, response: Response, request: AnalysisRequest, result: Dict[str, Any], user: dict
+) -> None:
+    snapshot_id = new_snapshot_id()
+    snapshot_payload = {
+        **AnalysisResponse(**result).model_dump(mode="json", exclude={"trace", "profile"}),
+        "snapshot_id": snapshot_id,
+        "request": request.model_dump(mode="json"),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        await run_in_threadpool(
+            fastapi_request.app.state.snapshots.save, snapshot_payload, user.get("sub") or user.get("email")
+        )
+        result["snapshot_id"] = snapshot_id
+        response.headers["Location"] = f"/analyses/{snapshot_id}"
+    except Exception as e:  # a análise já está pronta: sem snapshot, mas não falha a requisição
+        print(f"Falha ao gravar snapshot: {e}")
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+@app.get("/analyses/{snapshot_id}")
+def get_analysis_snapshot(snapshot_id: str, request: Request):
+    """Snapshot imutável de uma análise (busca por chave primária), com ETag e 304."""
+    store: SnapshotStore = request.app.state.snapshots
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = store.etag(snapshot_id)
+        if etag is not None and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": SNAPSHOT_CACHE_CONTROL})
+    snapshot = store.get(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Análise não encontrada.")
+    return Response(
+        content=snapshot.body,
+        media_type="application/json",
+        headers={"ETag": snapshot.etag, "Cache-Control": SNAPSHOT_CACHE_CONTROL},
+    )
+
+@app.get("/admission/stats")
+async def admission_stats(request: Request, current_user: dict = Depends(require_admin)):
+    """Fila de admissão (profundidade, espera p50/p95, recusas) e vagas por etapa neste worker."""
+    return {
+        "admission": request.app.state.admission.snapshot(),
+        "stages": {name: gate.snapshot() for name, gate in STAGE_GATES.items()},
+    }
+
+@app.get("/deadline/stats")
+async def deadline_stats(current_user: dict = Depends(require_admin)):
+    """Cortes por prazo, cancelamentos por desconexão e CPU/tokens economizados neste worker."""
+    return DEADLINE_STATS.snapshot()
+
+@app.get("/corpus/stats")
+async def corpus_stats(request: Request, current_user: dict = Depends(require_admin)):
+    """Corpus da ingestão contínua (posts, memória dos vetores) e estado da ingestão neste worker."""
+    corpus = getattr(request.app.state, "corpus", None)
+    if corpus is None:
+        return {"enabled": False}
+    ingestion = getattr(request.app.state, "ingestion", None)
+    return {"enabled": True, "corpus": corpus.stats(), "ingestion": ingestion.status() if ingestion else None}
+
+@app.get("/llm/stats")
+async def llm_stats(current_user: dict = Depends(require_admin)):
+    """Telemetria por modelo neste processo: p95/erros na janela recente e tokens/custo acumulados."""
+    return LLM_STATS.snapshot()
+
 # --- Execução da API ---
 if __name__ == "__main__":
-    uvicorn.run("src.main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    if "--profile-startup" in sys.argv:
+        from src.core.startup_profile import run as profile_startup
+
+        profile_startup()
+    else:
+        uvicorn.run("src.main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,242 @@
+# src/services/admission.py
+"""
+Controle de admissão e descarte de carga para o /analyze.
+
+- `AdmissionController` (no event loop): no máximo `max_active` análises em
+  andamento por worker; as demais esperam numa fila com prioridade, limitada a
+  `queue_size`. Fila cheia -> 503 imediato com Retry-After (ou, se a nova
+  requisição tem prioridade maior que a pior da fila, esta é descartada no lugar).
+  Esperar mais que `max_wait_s` também vira 503.
+- `StageGate` (threads do pipeline): limite de concorrência por etapa (busca,
+  embedding, LLM), liberando primeiro quem tem maior prioridade. Evita que
+  muitos embeddings em paralelo disputem a CPU até todos estourarem o timeout.
+  A espera respeita o prazo da requisição: cliente desconectado -> `Aborted`,
+  orçamento da etapa esgotado -> `DeadlineExceeded`, sem pegar a vaga.
+
+Prioridade = (tier do JWT, -cota restante): admins/pro antes, e quem ainda tem
+mais cota (usou menos hoje) antes de quem já usou muito. Menor tupla = maior prioridade.
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from src.services.deadline import current_deadline
+
+Priority = Tuple[int, int]
+
+TIER_RANK = {"admin": 0, "pro": 1}
+DEFAULT_TIER_RANK = 2
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("admission_priority", default=(DEFAULT_TIER_RANK, 0))
+
+
+def request_priority(tier: Optional[str], remaining_quota: Optional[int]) -> Priority:
+    return (TIER_RANK.get((tier or "").lower(), DEFAULT_TIER_RANK), -(remaining_quota or 0))
+
+
+# quem espera vaga numa etapa acorda a cada tanto para checar prazo e desconexão
+STAGE_WAIT_SLICE_S = 0.1
+
+
+def set_priority(priority: Priority) -> None:
+    """Prioridade da requisição corrente (herdada pelas threads com contexto copiado)."""
+    _priority.set(priority)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)], 3)
+
+
+class AdmissionRejected(Exception):
+    """Fila cheia, descartada por prioridade ou espera longa demais: responder 503."""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_active: int = 8, queue_size: int = 32, max_wait_s: float = 60.0):
+        self.max_active = max_active
+        self.queue_size = queue_size
+        self.max_wait_s = max_wait_s
+        self._active = 0
+        self._queue: List[Tuple[Priority, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._service_s = 10.0  # média móvel da duração de uma análise (para o Retry-After)
+        self.counters = {"admitted": 0, "rejected_full": 0, "shed": 0, "timed_out": 0, "max_queue_depth": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_active=int(os.getenv("ADMISSION_MAX_ACTIVE", "8")),
+            queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "32")),
+            max_wait_s=float(os.getenv("ADMISSION_MAX_WAIT_S", "60")),
+        )
+
+    def retry_after(self) -> float:
+        """Estimativa de quando abre vaga: fila à frente x duração média / vagas."""
+        ahead = len(self._queue) + 1
+        return max(1.0, min(120.0, math.ceil(ahead * self._service_s / max(1, self.max_active))))
+
+    async def acquire(self, priority: Priority, timeout: Optional[float] = None) -> float:
+        """
+        Espera uma vaga; retorna o tempo de fila (s) ou levanta `AdmissionRejected`.
+        `timeout` encurta a espera máxima (ex.: o que resta do prazo da requisição).
+        """
+        if self._active < self.max_active and not self._queue:
+            self._active += 1
+            self.counters["admitted"] += 1
+            self._waits.append(0.0)
+            return 0.0
+
+        if len(self._queue) >= self.queue_size:
+            worst = max(self._queue)
+            if priority >= worst[0]:
+                self.counters["rejected_full"] += 1
+                raise AdmissionRejected("fila cheia", self.retry_after())
+            # a nova requisição tem prioridade maior: descarta a pior da fila
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[2].set_exception(AdmissionRejected("descartada por prioridade", self.retry_after()))
+            self.counters["shed"] += 1
+
+        t0 = perf_counter()
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, entry)
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], len(self._queue))
+        try:
+            max_wait = self.max_wait_s if timeout is None else min(self.max_wait_s, timeout)
+            await asyncio.wait_for(asyncio.shield(entry[2]), timeout=max_wait)
+        except asyncio.TimeoutError:
+            self._drop(entry)
+            self.counters["timed_out"] += 1
+            raise AdmissionRejected("tempo de espera esgotado", self.retry_after())
+        except asyncio.CancelledError:  # cliente desconectou enquanto esperava
+            self._drop(entry)
+            raise
+        waited = perf_counter() - t0
+        self._waits.append(waited)
+        self.counters["admitted"] += 1
+        return waited
+
+    def _drop(self, entry) -> None:
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        elif entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+            self.release()  # a vaga chegou junto com o timeout/cancelamento: devolve
+
+    def release(self, service_s: Optional[float] = None) -> None:
+        if service_s is not None:
+            self._service_s = 0.8 * self._service_s + 0.2 * service_s
+        self._active -= 1
+        while self._queue and self._active < self.max_active:
+            _, _, fut = heapq.heappop(self._queue)
+            if not fut.done():
+                self._active += 1
+                fut.set_result(None)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "active": self._active,
+            "max_active": self.max_active,
+            "queue_depth": len(self._queue),
+            "queue_size": self.queue_size,
+            "wait_p50_s": _percentile(self._waits, 50),
+            "wait_p95_s": _percentile(self._waits, 95),
+            "avg_service_s": round(self._service_s, 3),
+            **self.counters,
+        }
+
+
+class StageGate:
+    """Semáforo com fila por prioridade para uma etapa do pipeline (threads)."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit        # 0 = sem limite
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiters: List[Tuple[Priority, int]] = []
+        self._seq = itertools.count()
+        self._waits: Deque[float] = deque(maxlen=1000)
+
+    @contextmanager
+    def slot(self, timings: Optional[dict] = None) -> Iterator[float]:
+        if self.limit <= 0:
+            yield 0.0
+            return
+        t0 = perf_counter()
+        deadline = current_deadline()
+        with self._cond:
+            entry = (_priority.get(), next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while self._active >= self.limit or self._waiters[0] != entry:
+                    deadline.check(self.name)
+                    self._cond.wait(STAGE_WAIT_SLICE_S)
+            except BaseException:
+                # desiste da fila: quem estava atrás pode ser o próximo
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            self._active += 1
+            self._cond.notify_all()  # o próximo da fila pode ter vaga também
+        waited = perf_counter() - t0
+        self._waits.append(waited)
+        if timings is not None:
+            key = f"{self.name}_wait"
+            timings[key] = round(timings.get(key, 0.0) + waited, 3)
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._cond:
+            active, waiting = self._active, len(self._waiters)
+        return {
+            "limit": self.limit,
+            "active": active,
+            "waiting": waiting,
+            "wait_p50_s": _percentile(self._waits, 50),
+            "wait_p95_s": _percentile(self._waits, 95),
+        }
+
+
+def _stage_limit(name: str, default: int) -> int:
+    return int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", str(default)))
+
+
+# embeddings disputam a CPU (e o torch já paraleliza cada lote): poucos por vez; busca e LLM são I/O
+STAGE_GATES: Dict[str, StageGate] = {
+    "fetch": StageGate("fetch", _stage_limit("fetch", 16)),
+    "embed": StageGate("embed", _stage_limit("embed", 2)),
+    "llm": StageGate("llm", _stage_limit("llm", 16)),
+}
+
+
+def stage_slot(name: str, timings: Optional[dict] = None):
+    """
+    Vaga na etapa `name`; o tempo de espera soma em `timings['<name>_wait']`.
+    Levanta `Aborted`/`DeadlineExceeded` se o prazo da etapa acabar na fila.
+    """
+    return STAGE_GATES[name].slot(timings)
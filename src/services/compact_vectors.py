@@ -0,0 +1,369 @@
+# src/services/compact_vectors.py
+"""
+Armazenamento compacto de embeddings para o corpus local.
+
+- `float32` (referência, 4 B/dim), `float16` (2 B/dim) ou `int8` (1 B/dim,
+  quantização escalar afim por dimensão: x ≈ code·scale + offset).
+- PCA opcional (`pca_dim`), ajustada no próprio corpus, reduz a dimensão antes
+  da quantização.
+- Busca vetorizada sobre os arrays compactos (em blocos, sem descompactar tudo);
+  só os melhores candidatos são re-pontuados em precisão total.
+- Precisão total: com armazenamento com perda, os originais float32 ficam num
+  arquivo temporário mapeado em memória (`VECTOR_FULL_DIR`), em anel. Fica no
+  disco/page cache, não no heap; a re-pontuação lê só as linhas candidatas,
+  sem re-embedar os posts.
+
+Enquanto não há vetores suficientes para calibrar (PCA/escala do int8), os
+vetores ficam em float32; ao atingir `min(calibration_size, capacity)` tudo é
+convertido. A calibração é refeita a cada `refit_rows` vetores novos, numa
+amostra da janela atual lida em precisão total, para acompanhar a deriva do corpus.
+Com `background_refit`, quem chama `refit` é o dono (o corpus, numa thread), e o
+ajuste e a recodificação rodam fora do lock dele.
+"""
+from __future__ import annotations
+import os
+import tempfile
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+_CHUNK = 65_536
+
+
+@dataclass
+class CompactParams:
+    dtype: str = "float16"
+    pca_dim: int = 0              # 0 = sem PCA
+    calibration_size: int = 2048
+    refit_rows: int = 0           # recalibra a cada N vetores novos; 0 = a cada `capacity` (janela inteira)
+    rescore_factor: int = 4       # candidatos re-pontuados = k * fator; 0 = sem re-pontuação
+    full_dir: str = ""            # diretório do arquivo em precisão total ("" = temporário do sistema)
+
+    @classmethod
+    def from_env(cls) -> "CompactParams":
+        params = cls(
+            dtype=os.getenv("VECTOR_DTYPE", "float16").lower(),
+            pca_dim=int(os.getenv("VECTOR_PCA_DIM", "0")),
+            calibration_size=int(os.getenv("VECTOR_CALIBRATION_SIZE", "2048")),
+            refit_rows=int(os.getenv("VECTOR_REFIT_ROWS", "0")),
+            rescore_factor=int(os.getenv("VECTOR_RESCORE_FACTOR", "4")),
+            full_dir=os.getenv("VECTOR_FULL_DIR", ""),
+        )
+        if params.dtype not in DTYPES:
+            raise ValueError(f"VECTOR_DTYPE inválido: {params.dtype}")
+        return params
+
+
+class _Codec:
+    """Parâmetros de calibração (PCA + quantização), compartilhados entre subconjuntos."""
+    __slots__ = ("dtype", "mean", "components", "scale", "offset")
+
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None  # (pca_dim, dim)
+        self.scale: Optional[np.ndarray] = None
+        self.offset: Optional[np.ndarray] = None
+
+    @classmethod
+    def fit(cls, sample: np.ndarray, dtype: str, pca_dim: int) -> "_Codec":
+        codec = cls(dtype)
+        if pca_dim and pca_dim < sample.shape[1]:
+            codec.mean = sample.mean(axis=0)
+            # SVD da amostra centrada: linhas de vt são as direções principais
+            _, _, vt = np.linalg.svd(sample - codec.mean, full_matrices=False)
+            codec.components = np.ascontiguousarray(vt[:pca_dim], dtype=np.float32)
+        if dtype == "int8":
+            projected = codec.project(sample)
+            lo, hi = projected.min(axis=0), projected.max(axis=0)
+            # margem para vetores futuros fora da faixa da amostra (o resto é saturado)
+            pad = 0.1 * (hi - lo) + 1e-6
+            lo, hi = lo - pad, hi + pad
+            codec.scale = ((hi - lo) / 255.0).astype(np.float32)
+            codec.offset = (lo + 128.0 * codec.scale).astype(np.float32)
+        return codec
+
+    def project(self, x: np.ndarray) -> np.ndarray:
+        if self.components is None:
+            return x
+        return (x - self.mean) @ self.components.T
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        x = self.project(np.asarray(x, dtype=np.float32))
+        if self.dtype == "float16":
+            return x.astype(np.float16)
+        if self.dtype == "int8":
+            return np.clip(np.rint((x - self.offset) / self.scale), -128, 127).astype(np.int8)
+        return x.astype(np.float32)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            return codes.astype(np.float32) * self.scale + self.offset
+        return codes.astype(np.float32)
+
+
+class _FullPrecision:
+    """
+    Originais float32 num arquivo temporário mapeado em memória, em anel: a
+    posição absoluta `p` (linhas já descartadas + linha) fica no slot `p % cap`.
+    O anel cresce (arquivo novo) quando as linhas vivas não cabem mais.
+    """
+
+    def __init__(self, dim: int, directory: str = ""):
+        self.dim = dim
+        self.directory = directory or None
+        self._file = None
+        self._mm: Optional[np.ndarray] = None
+        self._cap = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._cap * self.dim * 4
+
+    def _alloc(self, cap: int):
+        f = tempfile.TemporaryFile(dir=self.directory)
+        f.truncate(cap * self.dim * 4)
+        return f, np.memmap(f, dtype=np.float32, mode="r+", shape=(cap, self.dim))
+
+    def write(self, start: int, rows: np.ndarray, live_start: int) -> None:
+        """Grava `rows` a partir da posição `start`; posições < `live_start` podem ser sobrescritas."""
+        end = start + len(rows)
+        if end - live_start > self._cap:
+            cap = max(1024, 2 * self._cap, end - live_start)
+            f, mm = self._alloc(cap)
+            for lo in range(live_start, start, _CHUNK):
+                pos = np.arange(lo, min(lo + _CHUNK, start))
+                mm[pos % cap] = self._mm[pos % self._cap]
+            if self._file is not None:
+                self._file.close()
+            self._file, self._mm, self._cap = f, mm, cap
+        self._mm[np.arange(start, end) % self._cap] = rows
+
+    def read(self, positions) -> np.ndarray:
+        return np.asarray(self._mm[np.asarray(positions, dtype=np.int64) % self._cap])
+
+
+class CompactVectors:
+    """Matriz de embeddings compacta, com append, descarte do início e busca top-k."""
+
+    def __init__(
+        self, dim: int, params: Optional[CompactParams] = None, capacity: int = 0, background_refit: bool = False
+    ):
+        self.dim = dim
+        self.params = params or CompactParams.from_env()
+        self.capacity = capacity  # linhas vivas esperadas (ex.: CORPUS_MAX_POSTS); 0 = desconhecido
+        self.background_refit = background_refit  # o dono chama `refit` fora do seu lock
+        self._codec: Optional[_Codec] = None
+        self._data = np.empty((1024, dim), dtype=np.float32)
+        self._sq_norms = np.empty(1024, dtype=np.float32)  # ||x̂||² no espaço armazenado
+        self._n = 0
+        self._dropped = 0  # linhas já descartadas do início (posição absoluta = _dropped + linha)
+        self._since_fit = 0
+        self.fits = 0
+        # originais em precisão total: só quando o armazenamento perde informação
+        self._full: Optional[_FullPrecision] = _FullPrecision(dim, self.params.full_dir) if self.lossy else None
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def calibrated(self) -> bool:
+        return self._codec is not None or (self.params.dtype == "float32" and not self.params.pca_dim)
+
+    @property
+    def lossy(self) -> bool:
+        """Se os vetores armazenados diferem dos originais (quantização ou PCA)."""
+        return self.params.dtype != "float32" or bool(self.params.pca_dim)
+
+    @property
+    def row_nbytes(self) -> int:
+        """Bytes de memória por vetor armazenado (código + norma)."""
+        return self._data.shape[1] * self._data.itemsize + self._sq_norms.itemsize
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes efetivamente usados pelos vetores (sem a folga de capacidade)."""
+        return self._n * self.row_nbytes
+
+    @property
+    def full_nbytes(self) -> int:
+        """Bytes do arquivo em precisão total (disco/page cache, fora do heap)."""
+        return self._full.nbytes if self._full is not None else 0
+
+    @property
+    def calibration_threshold(self) -> int:
+        # janela menor que a amostra de calibração: calibra com a janela cheia
+        return min(self.params.calibration_size, self.capacity) if self.capacity else self.params.calibration_size
+
+    @property
+    def refit_interval(self) -> int:
+        return self.params.refit_rows or self.capacity or 25 * self.params.calibration_size
+
+    @property
+    def _refits(self) -> bool:
+        # float16/float32 sem PCA não têm parâmetros ajustados ao corpus
+        return self.params.dtype == "int8" or bool(self.params.pca_dim)
+
+    # --- Escrita -------------------------------------------------------------
+    @property
+    def refit_due(self) -> bool:
+        """Se já há vetores para a primeira calibração ou vetores novos para recalibrar."""
+        if self._codec is None:
+            return not self.calibrated and self._n >= self.calibration_threshold
+        return self._refits and self._since_fit >= self.refit_interval
+
+    def append(self, vectors) -> None:
+        """
+        Acrescenta vetores (codificados com o codec atual; float32 antes da
+        calibração). Com `background_refit`, a (re)calibração devida fica para
+        o dono chamar `refit` (ver `refit_due`); senão roda aqui mesmo.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self._full is not None:
+            self._full.write(self._dropped + self._n, vectors, self._dropped)
+        if self._codec is None and self.calibrated:
+            self._codec = _Codec("float32")
+        if self._codec is not None:
+            self._write(self._codec.encode(vectors))
+            self._since_fit += len(vectors)
+        else:
+            self._write(vectors)
+        if not self.background_refit and self.refit_due:
+            self.refit()
+
+    def _write(self, rows: np.ndarray) -> None:
+        need = self._n + len(rows)
+        if need > len(self._data):
+            cap = max(need, 2 * len(self._data))
+            grown = np.empty((cap, self._data.shape[1]), dtype=self._data.dtype)
+            grown[:self._n] = self._data[:self._n]
+            self._data = grown
+            norms = np.empty(cap, dtype=np.float32)
+            norms[:self._n] = self._sq_norms[:self._n]
+            self._sq_norms = norms
+        self._data[self._n:need] = rows
+        self._sq_norms[self._n:need] = self._sq_norm_of(rows)
+        self._n = need
+
+    def _sq_norm_of(self, codes: np.ndarray) -> np.ndarray:
+        x = self._codec.decode(codes) if self._codec is not None else codes
+        return np.einsum("ij,ij->i", x, x)
+
+    def refit(self, lock=None) -> None:
+        """
+        (Re)ajusta PCA/escalas numa amostra da janela recente e recodifica tudo a
+        partir dos originais. Com `lock` (o do dono), só as leituras dos originais
+        e a troca final o seguram: o ajuste e a recodificação rodam fora dele, e
+        a busca segue com o codec antigo até a troca do codec e dos códigos.
+        """
+        lock = lock if lock is not None else nullcontext()
+        with lock:
+            # posições absolutas: linhas podem ser descartadas/acrescentadas no meio
+            lo, hi = self._dropped, self._dropped + self._n
+            window = min(self._n, self.capacity or self._n)
+            positions = np.arange(hi - window, hi)
+            if window > self.params.calibration_size:
+                rng = np.random.default_rng(self.fits)
+                positions = np.sort(rng.choice(positions, size=self.params.calibration_size, replace=False))
+            sample = self._read_full(positions)
+        codec = _Codec.fit(sample, self.params.dtype, self.params.pca_dim)
+        probe = codec.encode(np.zeros((1, self.dim), dtype=np.float32))
+        codes = np.empty((hi - lo, probe.shape[1]), dtype=probe.dtype)
+        for start in range(lo, hi, _CHUNK):
+            stop = min(start + _CHUNK, hi)
+            with lock:
+                if stop <= self._dropped:
+                    continue  # já descartadas: o slot no anel pode ter sido reutilizado
+                block = self._read_full(np.arange(start, stop))
+            codes[start - lo:stop - lo] = codec.encode(block)
+        with lock:
+            live_lo, live_hi = self._dropped, self._dropped + self._n
+            kept = max(0, hi - live_lo)  # linhas do instantâneo ainda vivas
+            data = np.empty((max(len(self._data), self._n), probe.shape[1]), dtype=probe.dtype)
+            data[:kept] = codes[len(codes) - kept:]
+            # vetores que chegaram durante o ajuste (gravados com o codec antigo)
+            new_lo = max(hi, live_lo)
+            data[kept:self._n] = codec.encode(self._read_full(np.arange(new_lo, live_hi)))
+            self._codec, self._data = codec, data
+            self._sq_norms[:self._n] = self._sq_norm_of(data[:self._n])
+            self.fits += 1
+            self._since_fit = live_hi - new_lo
+
+    def _read_full(self, positions: np.ndarray) -> np.ndarray:
+        """Originais por posição absoluta (sem `_full`, o armazenado é o original)."""
+        if self._full is not None:
+            return self._full.read(positions)
+        return self.decode(positions - self._dropped)
+
+    def drop_head(self, n: int) -> None:
+        n = min(n, self._n)
+        self._data[:self._n - n] = self._data[n:self._n]
+        self._sq_norms[:self._n - n] = self._sq_norms[n:self._n]
+        self._n -= n
+        self._dropped += n
+
+    # --- Leitura -------------------------------------------------------------
+    def full(self, rows: Sequence[int]) -> np.ndarray:
+        """Vetores originais (float32, dimensão cheia) das linhas."""
+        return self._read_full(self._dropped + np.asarray(rows, dtype=np.int64))
+
+    def decode(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Vetores aproximados em float32 (no espaço armazenado, com PCA se houver)."""
+        codes = self._data[:self._n] if rows is None else self._data[np.asarray(rows, dtype=np.int64)]
+        return self._codec.decode(codes) if self._codec is not None else codes.astype(np.float32)
+
+    def approx_distances(self, query, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """L2² aproximada da consulta para todas as linhas (ou só `rows`), vetorizada em blocos."""
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        n = self._n if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        if self._codec is not None:
+            q = self._codec.project(q[None, :])[0]
+        if self._codec is not None and self._codec.dtype == "int8":
+            # x·q = code·(scale∘q) + offset·q  -> um matmul direto sobre os códigos
+            qs = (self._codec.scale * q).astype(np.float32)
+            bias = float(self._codec.offset @ q)
+        else:
+            qs, bias = q, 0.0
+        q_sq = float(q @ q)
+        for start in range(0, n, _CHUNK):
+            stop = min(start + _CHUNK, n)
+            sel = slice(start, stop) if rows is None else rows[start:stop]
+            dots = self._data[sel].astype(np.float32) @ qs + bias
+            out[start:stop] = self._sq_norms[sel] - 2.0 * dots + q_sq
+        return out
+
+    def search(
+        self, query, k: int, rescore: Optional[bool] = None, rows: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k por L2² entre todas as linhas (ou só `rows`). Com `rescore`
+        (padrão: se o armazenamento tem perda e `rescore_factor` > 0), os
+        `k * rescore_factor` melhores candidatos aproximados são re-pontuados
+        exatamente contra a consulta, com os vetores originais guardados (sem re-embedar).
+        """
+        rows = np.arange(self._n) if rows is None else np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return []
+        if rescore is None:
+            rescore = self.lossy and self.params.rescore_factor > 0
+        dist = self.approx_distances(query, rows)
+        n_cand = min(len(rows), k * max(1, self.params.rescore_factor) if rescore else k)
+        cand = np.argpartition(dist, n_cand - 1)[:n_cand] if n_cand < len(rows) else np.arange(len(rows))
+        if rescore:
+            return self.rescore(query, rows[cand], k)
+        order = cand[np.argsort(dist[cand])][:k]
+        return [(int(rows[i]), float(dist[i])) for i in order]
+
+    def rescore(self, query, rows: Sequence[int], k: int) -> List[Tuple[int, float]]:
+        """Top-k de `rows` por L2² exata, contra os vetores originais."""
+        rows = np.asarray(rows, dtype=np.int64)
+        full = self.full(rows)
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        exact = np.einsum("ij,ij->i", full - q, full - q)
+        order = np.argsort(exact)[:k]
+        return [(int(rows[i]), float(exact[i])) for i in order]
@@ -0,0 +1,295 @@
+# src/services/corpus.py
+from __future__ import annotations
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.core.post_batch import PostBatch, PostFilters
+from src.services.compact_vectors import CompactParams, CompactVectors
+from src.services.lexical import tokenize
+from src.services.vector_index import CorpusIndex, IndexParams, choose_index_kind, min_train_size
+
+_BUILD_CHUNK = 16_384
+
+# nearest(vetor da pergunta, k) -> [(linha do lote, distância L2²)]
+Nearest = Callable[[Any, int], List[Tuple[int, float]]]
+
+
+class RollingCorpus:
+    """
+    Corpus local em janela de tempo, alimentado pela ingestão contínua.
+
+    - Posts em colunas (`PostBatch`) + embeddings compactos (`CompactVectors`:
+      float16/int8, PCA opcional) na mesma ordem.
+    - Calibração dos vetores (PCA/int8) refeita numa thread à parte: o ajuste
+      e a recodificação não seguram o lock, e a busca usa o codec antigo até a troca.
+    - Índice invertido termo -> ids para achar posts de um tópico sem a API de busca.
+    - Índice ANN (`CorpusIndex`) sobre o corpus inteiro quando o tamanho dele
+      pede (RAG_INDEX_KIND / `choose_index_kind` pelo número de posts vivos):
+      montado e reconstruído numa thread à parte, sem segurar o lock.
+    - Expira por idade (`max_age_seconds`) e por tamanho (`max_posts`), sempre
+      dos mais antigos para os mais novos (a ingestão chega em ordem de tempo).
+
+    Ids são sequenciais e nunca reutilizados; linha = id - base.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        max_posts: int = 100_000,
+        max_age_seconds: float = 24 * 3600,
+        vector_params: Optional[CompactParams] = None,
+        index_params: Optional[IndexParams] = None,
+    ):
+        self.dim = dim
+        self.max_posts = max_posts
+        self.max_age_seconds = max_age_seconds
+        self.index_params = index_params or IndexParams.from_env()
+        self._lock = threading.RLock()
+        self._posts = PostBatch()
+        self._ts = array("d")
+        self._vectors = CompactVectors(dim, vector_params, capacity=max_posts, background_refit=True)
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._base = 0  # id da linha 0
+        self._head = 0  # linhas < head já foram expiradas
+        self._ann: Optional[CorpusIndex] = None
+        self._ann_building = False
+        self._refitting = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._posts) - self._head
+
+    @property
+    def index_kind(self) -> str:
+        ann = self._ann
+        return ann.kind if ann is not None else "flat"
+
+    # --- Escrita -------------------------------------------------------------
+    def add(self, items: Sequence[Dict[str, Any]], vectors, now: Optional[float] = None) -> int:
+        """
+        Adiciona posts já embedados. `items` são dicts com os campos de
+        `PostBatch.append` + `ts` (epoch s); `vectors` tem uma linha por item.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            n = len(self._posts)
+            self._vectors.append(vectors)
+            for j, item in enumerate(items):
+                doc_id = self._base + n + j
+                self._ts.append(item["ts"])
+                self._posts.append(**{k: v for k, v in item.items() if k != "ts"})
+                for term in set(tokenize(item["text"])):
+                    self._postings[term].add(doc_id)
+            if self._ann is not None:
+                self._ann.add(vectors, np.arange(self._base + n, self._base + n + len(items)))
+            self.evict(now)
+            self._maybe_refit()
+            self._maybe_build_index()
+        return len(items)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Expira os posts mais antigos por idade e por tamanho. Retorna quantos saíram."""
+        cutoff = (now or time.time()) - self.max_age_seconds
+        evicted = 0
+        with self._lock:
+            n = len(self._posts)
+            while self._head < n and (self._ts[self._head] < cutoff or n - self._head > self.max_posts):
+                doc_id = self._base + self._head
+                for term in set(tokenize(self._posts.texts[self._head])):
+                    ids = self._postings.get(term)
+                    if ids is not None:
+                        ids.discard(doc_id)
+                        if not ids:
+                            del self._postings[term]
+                self._head += 1
+                evicted += 1
+            # folga de até 10% (mín. 1024) de linhas expiradas: memória ~1,1× max_posts, não 2×
+            if self._head > max(1024, n // 10):
+                self._compact()
+        return evicted
+
+    def _compact(self) -> None:
+        head = self._head
+        self._posts.drop_head(head)
+        del self._ts[:head]
+        self._vectors.drop_head(head)
+        self._base += head
+        self._head = 0
+
+    # --- Calibração dos vetores compactos -----------------------------------
+    def _maybe_refit(self) -> None:
+        """Dispara a (re)calibração dos vetores numa thread quando devida. Chamado com o lock."""
+        if self._refitting or not self._vectors.refit_due:
+            return
+        self._refitting = True
+        threading.Thread(target=self._refit, name="corpus-refit", daemon=True).start()
+
+    def _refit(self) -> None:
+        try:
+            # ajuste e recodificação fora do lock; só leituras e a troca o seguram
+            self._vectors.refit(self._lock)
+        except Exception as e:  # segue com o codec atual; tenta de novo no próximo add
+            print(f"Falha ao recalibrar os vetores do corpus: {e}")
+        finally:
+            with self._lock:
+                self._refitting = False
+
+    # --- Índice ANN ----------------------------------------------------------
+    def _maybe_build_index(self) -> None:
+        """
+        (Re)monta o ANN quando o tamanho do corpus pede outro tipo, ou quando
+        metade do índice já é de posts expirados. Chamado com o lock.
+        """
+        if self._ann_building:
+            return
+        live = len(self._posts) - self._head
+        kind = choose_index_kind(live, self.index_params)
+        ann = self._ann
+        if kind == "flat":
+            if ann is not None and ann.ntotal > 2 * live:
+                self._ann = None  # o corpus encolheu: a varredura exata volta a bastar
+            return
+        if kind == "ivfpq" and live < min_train_size(live, self.index_params):
+            return
+        if ann is not None and ann.kind == kind and ann.ntotal <= 2 * live:
+            return
+        self._ann_building = True
+        threading.Thread(target=self._build_index, args=(kind,), name="corpus-ann", daemon=True).start()
+
+    def _live_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids ainda vivos e seus vetores originais (com o lock, só por um bloco)."""
+        with self._lock:
+            ids = ids[ids >= self._base + self._head]
+            return ids, self._vectors.full(ids - self._base)
+
+    def _build_index(self, kind: str) -> None:
+        built = False
+        try:
+            with self._lock:
+                lo, hi = self._base + self._head, self._base + len(self._posts)
+            index = CorpusIndex(kind, self.dim, hi - lo, self.index_params)
+            if not index.is_trained:
+                n_train = min(hi - lo, 2 * min_train_size(hi - lo, self.index_params))
+                sample = np.sort(np.random.default_rng(0).choice(np.arange(lo, hi), size=n_train, replace=False))
+                index.train(self._live_vectors(sample)[1])
+            for start in range(lo, hi, _BUILD_CHUNK):
+                index.add(*reversed(self._live_vectors(np.arange(start, min(start + _BUILD_CHUNK, hi)))))
+            with self._lock:
+                # posts que chegaram durante a montagem (o índice antigo já os tinha)
+                ids, vectors = self._live_vectors(np.arange(hi, self._base + len(self._posts)))
+                if len(ids):
+                    index.add(vectors, ids)
+                self._ann = index
+                built = True
+        except Exception as e:  # a busca segue exata sobre os vetores compactos
+            print(f"Falha ao montar o índice {kind} do corpus: {e}")
+        finally:
+            with self._lock:
+                self._ann_building = False
+                if built:  # o corpus pode ter mudado de faixa durante a montagem
+                    self._maybe_build_index()
+
+    # --- Leitura -------------------------------------------------------------
+    def search(
+        self, query: str, limit: int, filters: Optional[PostFilters] = None
+    ) -> Tuple[PostBatch, Optional[Nearest]]:
+        """
+        Posts do corpus que mencionam os termos do tópico (todos os termos; se
+        nenhum post tiver todos, qualquer um deles), já passados pelos `filters`:
+        os `limit` mais recentes vão no lote (cópia, segura fora do lock).
+
+        Retorna (lote, nearest). `nearest(vetor, k)` faz a busca densa sobre
+        todos os posts do tópico na janela, não só os do lote: varredura exata
+        dos vetores compactos para tópicos pequenos, o ANN do corpus para os
+        grandes. Achados fora do lote são acrescentados a ele; devolve
+        [(linha do lote, distância)].
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            sets = [self._postings.get(t, set()) for t in terms]
+            if not sets:
+                return PostBatch(), None
+            ids: Set[int] = set.intersection(*sets) or set.union(*sets)
+            batch_ids: List[int] = []
+            for doc_id in sorted(ids, reverse=True):
+                if filters is None or self._posts.accepts(doc_id - self._base, filters):
+                    batch_ids.append(doc_id)
+                    if len(batch_ids) >= limit:
+                        break
+            batch = self._posts.take([i - self._base for i in batch_ids])
+        if not batch_ids:
+            return batch, None
+        batch_row = {doc_id: row for row, doc_id in enumerate(batch_ids)}
+
+        def nearest(vector, k: int) -> List[Tuple[int, float]]:
+            with self._lock:
+                hits = self._nearest(np.asarray(vector, dtype=np.float32), k, ids, filters)
+                extra = [doc_id for doc_id, _ in hits if doc_id not in batch_row]
+                if extra:
+                    batch.extend(self._posts.take([i - self._base for i in extra]))
+                    for doc_id in extra:
+                        batch_row[doc_id] = len(batch_row)
+            return [(batch_row[doc_id], dist) for doc_id, dist in hits]
+
+        return batch, nearest
+
+    def _nearest(
+        self, query: np.ndarray, k: int, ids: Set[int], filters: Optional[PostFilters]
+    ) -> List[Tuple[int, float]]:
+        """Top-k (id, L2²) entre `ids` vivos e aceitos pelos filtros. Chamado com o lock."""
+        live_start = self._base + self._head
+
+        def accepted(doc_id: int) -> bool:
+            return doc_id >= live_start and (filters is None or self._posts.accepts(doc_id - self._base, filters))
+
+        ann = self._ann
+        if ann is not None and len(ids) > self.index_params.exact_max:
+            hits = self._ann_nearest(ann, query, k, ids, accepted)
+            if len(hits) >= min(k, len(ids)):
+                return hits
+        rows = [i - self._base for i in ids if accepted(i)]
+        return [(self._base + row, dist) for row, dist in self._vectors.search(query, k, rows=rows)]
+
+    def _ann_nearest(self, ann: CorpusIndex, query: np.ndarray, k: int, ids: Set[int], accepted) -> List[Tuple[int, float]]:
+        """
+        Busca no ANN do corpus inteiro e filtra pelo tópico: pede vizinhos na
+        proporção corpus/tópico e dobra até juntar candidatos suficientes.
+        """
+        want = k * max(1, self._vectors.params.rescore_factor) if ann.kind == "ivfpq" else k
+        fetch = min(ann.ntotal, max(4 * want, int(2 * want * ann.ntotal / max(1, len(ids)))))
+        while True:
+            found, dist = ann.search(query, fetch)
+            hits = [(int(i), float(d)) for i, d in zip(found, dist) if i in ids and accepted(int(i))]
+            if len(hits) >= want or fetch >= ann.ntotal:
+                break
+            fetch = min(ann.ntotal, 2 * fetch)
+        if ann.kind == "ivfpq":
+            # distâncias do PQ são aproximadas: re-pontua com os originais
+            rows = [doc_id - self._base for doc_id, _ in hits]
+            return [(self._base + row, dist) for row, dist in self._vectors.rescore(query, rows, k)]
+        return hits[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self._posts)
+            ann = self._ann
+            return {
+                "posts": n - self._head,
+                "terms": len(self._postings),
+                # só as linhas vivas (as expiradas ainda não compactadas não contam)
+                "vector_bytes": (n - self._head) * self._vectors.row_nbytes,
+                "vector_full_bytes": self._vectors.full_nbytes,
+                "vectors_calibrated": self._vectors.calibrated,
+                "vector_fits": self._vectors.fits,
+                "vector_refitting": self._refitting,
+                "index_kind": self.index_kind,
+                "index_vectors": ann.ntotal if ann is not None else 0,
+                "index_building": self._ann_building,
+                "oldest_ts": self._ts[self._head] if self._head < n else None,
+                "newest_ts": self._ts[n - 1] if n else None,
+            }
@@ -0,0 +1,192 @@
+# src/services/deadline.py
+"""
+Prazo da requisição propagado a todas as etapas do pipeline, com cancelamento cooperativo.
+
+- `Deadline(total_s)`: instante limite da análise, contado da chegada da
+  requisição, e um orçamento por etapa em frações cumulativas do prazo
+  (RAG_STAGE_DEADLINES): a busca pode ir até 40% do prazo, o embedding até 65%
+  e o LLM até o fim. Quem estoura o próprio orçamento segue com o que já tem
+  (menos páginas, menos posts embedados); o LLM sem tempo vira resultado
+  parcial (fontes sem resposta).
+- `cancel()`: o cliente desconectou. As etapas checam entre páginas, lotes e
+  chunks do LLM e levantam `Aborted`; não há a quem responder.
+- O prazo vive num ContextVar: o threadpool e as threads com contexto copiado
+  (busca, chamadas com hedge) enxergam o mesmo objeto.
+- `DEADLINE_STATS`: cortes, cancelamentos e a economia estimada (CPU-segundos
+  de embedding e tokens/custo de LLM que deixaram de ser gastos), por processo.
+"""
+from __future__ import annotations
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# fração do prazo até a qual cada etapa pode ir (etapas sem entrada: até o fim)
+STAGE_SHARES: Dict[str, float] = {
+    name.strip(): float(share)
+    for name, share in (
+        item.split("=") for item in os.getenv("RAG_STAGE_DEADLINES", "fetch=0.4,embed=0.65,llm=1.0").split(",") if item
+    )
+}
+# abaixo disso não vale chamar o LLM: devolve as fontes sem resposta
+LLM_MIN_BUDGET_S = float(os.getenv("LLM_MIN_BUDGET_S", "3"))
+
+CLIENT_DISCONNECTED = "client_disconnected"
+DEADLINE = "deadline"
+
+
+class Aborted(Exception):
+    """Trabalho interrompido: cliente desconectou (ou prazo esgotado, em `DeadlineExceeded`)."""
+    def __init__(self, reason: str, stage: Optional[str] = None):
+        super().__init__(f"{reason} ({stage})" if stage else reason)
+        self.reason = reason
+        self.stage = stage
+
+
+class DeadlineExceeded(Aborted):
+    def __init__(self, stage: Optional[str] = None):
+        super().__init__(DEADLINE, stage)
+
+
+class Deadline:
+    def __init__(self, total_s: float = math.inf, shares: Optional[Dict[str, float]] = None):
+        self.total_s = total_s
+        self.shares = STAGE_SHARES if shares is None else shares
+        self.started = time.monotonic()
+        self.expires_at = self.started + total_s
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.aborted_stage: Optional[str] = None
+        self.truncated: List[str] = []   # etapas que pararam no próprio orçamento
+        self.partial = False
+        self.cpu_s_saved = 0.0
+        self.tokens_saved = 0
+        self.cost_usd_saved = 0.0
+
+    # --- tempo ------------------------------------------------------------
+    def stage_end(self, stage: Optional[str] = None) -> float:
+        if stage is None or math.isinf(self.total_s):
+            return self.expires_at
+        return min(self.expires_at, self.started + self.shares.get(stage, 1.0) * self.total_s)
+
+    def remaining(self, stage: Optional[str] = None) -> float:
+        return max(0.0, self.stage_end(stage) - time.monotonic())
+
+    def over_budget(self, stage: str) -> bool:
+        """A etapa já gastou o seu orçamento? (levanta `Aborted` se o cliente desconectou)"""
+        if self._cancelled.is_set():
+            raise Aborted(self.reason or CLIENT_DISCONNECTED, stage)
+        return time.monotonic() >= self.stage_end(stage)
+
+    # --- cancelamento -----------------------------------------------------
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = CLIENT_DISCONNECTED) -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self, stage: Optional[str] = None) -> None:
+        """Ponto de parada cooperativo: cancelado -> `Aborted`; com `stage`, fora do prazo -> `DeadlineExceeded`."""
+        if self._cancelled.is_set():
+            raise Aborted(self.reason or CLIENT_DISCONNECTED, stage)
+        if stage is not None and time.monotonic() >= self.stage_end(stage):
+            raise DeadlineExceeded(stage)
+
+    # --- contabilidade ----------------------------------------------------
+    def truncate(self, stage: str) -> None:
+        with self._lock:
+            if stage not in self.truncated:
+                self.truncated.append(stage)
+
+    def save(self, cpu_s: float = 0.0, tokens: int = 0, cost_usd: float = 0.0) -> None:
+        with self._lock:
+            self.cpu_s_saved += cpu_s
+            self.tokens_saved += tokens
+            self.cost_usd_saved += cost_usd
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """Resumo para a resposta; None quando nada foi cortado."""
+        if not (self.truncated or self.partial or self.reason):
+            return None
+        return {
+            "deadline_s": None if math.isinf(self.total_s) else round(self.total_s, 3),
+            "elapsed_s": round(time.monotonic() - self.started, 3),
+            "truncated": list(self.truncated),
+            "partial": self.partial,
+            "aborted": self.reason,
+            "aborted_stage": self.aborted_stage,
+            "cpu_s_saved": round(self.cpu_s_saved, 3),
+            "tokens_saved": self.tokens_saved,
+            "cost_usd_saved": round(self.cost_usd_saved, 6),
+        }
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Deadline:
+    """Prazo da requisição corrente (um prazo infinito fora de uma requisição, ex.: warmup)."""
+    return _current.get() or Deadline()
+
+
+@contextmanager
+def use_deadline(deadline: Deadline) -> Iterator[Deadline]:
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+class DeadlineStats:
+    """Totais por processo + custo médio de embedding por post (para estimar o que deixou de rodar)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.embed_s_per_post = 0.004  # ~MiniLM em CPU; atualizado pelas análises
+        self.counters: Dict[str, float] = {
+            "requests": 0, "partial": 0, "truncated_fetch": 0, "truncated_embed": 0, "truncated_llm": 0,
+            "aborted_client_disconnected": 0,
+            "cpu_s_saved": 0.0, "tokens_saved": 0, "cost_usd_saved": 0.0,
+        }
+
+    def observe_embed(self, posts: int, seconds: float) -> None:
+        if posts:
+            with self._lock:
+                self.embed_s_per_post = 0.9 * self.embed_s_per_post + 0.1 * (seconds / posts)
+
+    def embed_cost(self, posts: int) -> float:
+        return max(0, posts) * self.embed_s_per_post
+
+    def record(self, deadline: Deadline) -> None:
+        with self._lock:
+            c = self.counters
+            c["requests"] += 1
+            c["partial"] += int(deadline.partial)
+            for stage in deadline.truncated:
+                key = f"truncated_{stage}"
+                c[key] = c.get(key, 0) + 1
+            if deadline.reason:
+                key = f"aborted_{deadline.reason}"
+                c[key] = c.get(key, 0) + 1
+            c["cpu_s_saved"] += deadline.cpu_s_saved
+            c["tokens_saved"] += deadline.tokens_saved
+            c["cost_usd_saved"] += deadline.cost_usd_saved
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self.counters)
+            out["cpu_s_saved"] = round(out["cpu_s_saved"], 3)
+            out["cost_usd_saved"] = round(out["cost_usd_saved"], 6)
+            out["embed_s_per_post"] = round(self.embed_s_per_post, 5)
+        return out
+
+
+DEADLINE_STATS = DeadlineStats()
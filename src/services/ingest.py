@@ -0,0 +1,303 @@
+# src/services/ingest.py
+"""
+Ingestão contínua do Bluesky (Jetstream) para o `RollingCorpus`.
+
+Fontes:
+- `JetstreamSource`: websocket do Jetstream (requer o pacote `websockets`).
+- `ReplaySource`: eventos gravados em JSONL (um evento do Jetstream por linha),
+  para rodar e testar sem rede.
+
+Gravar eventos para replay:
+    python -m src.services.ingest --record eventos.jsonl --seconds 60
+"""
+from __future__ import annotations
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.services.corpus import RollingCorpus
+
+try:
+    from websockets.sync.client import connect as ws_connect  # type: ignore
+except Exception:
+    ws_connect = None  # fallback se não estiver instalado
+
+POST_COLLECTION = "app.bsky.feed.post"
+DEFAULT_JETSTREAM_URL = "wss://jetstream2.us-east.bsky.network/subscribe"
+
+
+def parse_jetstream_event(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Converte um evento do Jetstream em um item do corpus, ou None se não for a
+    criação de um post com texto. O Jetstream só traz o DID do autor, não o handle.
+    """
+    commit = event.get("commit") or {}
+    if event.get("kind") != "commit" or commit.get("operation") != "create":
+        return None
+    if commit.get("collection") != POST_COLLECTION:
+        return None
+    record = commit.get("record") or {}
+    text = record.get("text")
+    if not text:
+        return None
+    did = event.get("did", "")
+    return {
+        "uri": f"at://{did}/{POST_COLLECTION}/{commit.get('rkey', '')}",
+        "handle": did,
+        "display_name": None,
+        "avatar": None,
+        "text": text,
+        "created_at": record.get("createdAt"),
+        "langs": ",".join(record.get("langs") or []) or None,
+        "ts": event.get("time_us", time.time() * 1e6) / 1e6,
+    }
+
+
+class ReplaySource:
+    """Lê eventos gravados (JSONL). `speed` > 0 respeita o intervalo original dividido por `speed`."""
+
+    def __init__(self, path: str, speed: float = 0.0, rebase_time: bool = True):
+        self.path = path
+        self.speed = speed
+        # eventos antigos expirariam na hora; reancora o tempo da gravação em "agora"
+        self.rebase_time = rebase_time
+        self.skipped = 0  # linhas que não são JSON válido
+
+    def events(self, stop: threading.Event) -> Iterator[Dict[str, Any]]:
+        offset = None
+        prev = None
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if stop.is_set():
+                    return
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    self.skipped += 1
+                    continue
+                t_us = event.get("time_us")
+                if t_us is not None:
+                    if self.speed > 0 and prev is not None:
+                        stop.wait(max(0.0, (t_us - prev) / 1e6 / self.speed))
+                    prev = t_us
+                    if self.rebase_time:
+                        if offset is None:
+                            offset = time.time() * 1e6 - t_us
+                        event["time_us"] = t_us + offset
+                yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {"skipped": self.skipped}
+
+
+class JetstreamSource:
+    """
+    Websocket do Jetstream filtrado por posts; reconecta do último `time_us` visto,
+    com backoff exponencial (de `reconnect_delay` até `max_reconnect_delay`).
+    """
+
+    def __init__(self, url: str = DEFAULT_JETSTREAM_URL, reconnect_delay: float = 2.0, max_reconnect_delay: float = 60.0):
+        if ws_connect is None:
+            raise RuntimeError("Instale o pacote 'websockets' para usar o Jetstream.")
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.cursor: Optional[int] = None
+        self.connected = False
+        self.reconnects = 0
+        self.skipped = 0  # mensagens que não são JSON válido
+        self.last_error: Optional[str] = None
+
+    def _subscribe_url(self) -> str:
+        sep = "&" if "?" in self.url else "?"
+        url = f"{self.url}{sep}wantedCollections={POST_COLLECTION}"
+        if self.cursor:
+            url += f"&cursor={self.cursor}"
+        return url
+
+    def events(self, stop: threading.Event) -> Iterator[Dict[str, Any]]:
+        delay = self.reconnect_delay
+        while not stop.is_set():
+            try:
+                with ws_connect(self._subscribe_url(), open_timeout=10) as ws:
+                    self.connected = True
+                    while not stop.is_set():
+                        try:
+                            raw = ws.recv(timeout=1.0)
+                        except TimeoutError:
+                            continue
+                        try:
+                            event = json.loads(raw)
+                        except ValueError:
+                            self.skipped += 1
+                            continue
+                        delay = self.reconnect_delay  # conexão saudável: zera o backoff
+                        self.cursor = event.get("time_us", self.cursor)
+                        yield event
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.reconnects += 1
+                print(f"Jetstream desconectado: {e}; reconectando em {delay:.0f}s")
+                stop.wait(delay)
+                delay = min(self.max_reconnect_delay, 2 * delay)
+            finally:
+                self.connected = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+        }
+
+
+class IngestionService:
+    """
+    Thread que consome uma fonte, embeda em micro-lotes e grava no corpus.
+    Um lote é gravado a cada `batch_size` posts ou `flush_interval` segundos.
+
+    Erros não derrubam a ingestão: um evento inválido é pulado, um lote cujo
+    embedding falhou é descartado e, se a própria fonte levantar, ela é reaberta
+    com backoff exponencial. `status()` expõe o estado e os erros.
+    """
+
+    def __init__(
+        self,
+        source,
+        corpus: RollingCorpus,
+        embeddings,
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+    ):
+        self.source = source
+        self.corpus = corpus
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.ingested = 0
+        self.dropped = 0  # posts perdidos em lotes que falharam
+        self.errors = {"event": 0, "flush": 0, "source": 0}
+        self.state = "idle"  # idle | running | retrying | finished | stopped | failed
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.last_flush_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "IngestionService":
+        self.state = "running"
+        self._thread = threading.Thread(target=self._run, name="bsky-ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _error(self, kind: str, e: BaseException) -> None:
+        self.errors[kind] += 1
+        self.last_error = f"{kind}: {type(e).__name__}: {e}"
+        self.last_error_at = time.time()
+        print(f"Erro na ingestão ({kind}): {e}")
+
+    def _flush(self, buffer: List[Dict[str, Any]]) -> None:
+        if not buffer:
+            return
+        try:
+            vectors = self.embeddings.embed_documents([item["text"] for item in buffer])
+            self.ingested += self.corpus.add(buffer, vectors)
+            self.last_flush_at = time.time()
+        except Exception as e:  # perde o lote, não a ingestão
+            self.dropped += len(buffer)
+            self._error("flush", e)
+        finally:
+            buffer.clear()
+
+    def _consume(self, buffer: List[Dict[str, Any]], last_flush: float) -> float:
+        for event in self.source.events(self._stop):
+            self.state = "running"
+            try:
+                item = parse_jetstream_event(event)
+            except Exception as e:
+                self._error("event", e)
+                continue
+            if item is not None:
+                buffer.append(item)
+            if len(buffer) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush(buffer)
+                last_flush = time.monotonic()
+        return last_flush
+
+    def _run(self) -> None:
+        buffer: List[Dict[str, Any]] = []
+        last_flush = time.monotonic()
+        delay = self.retry_delay
+        try:
+            while not self._stop.is_set():
+                try:
+                    last_flush = self._consume(buffer, last_flush)
+                    break  # fonte esgotada (replay) ou parada pedida
+                except Exception as e:
+                    self._error("source", e)
+                    self._flush(buffer)
+                    self.state = "retrying"
+                    self._stop.wait(delay)
+                    delay = min(self.max_retry_delay, 2 * delay)
+            self._flush(buffer)
+            self.state = "stopped" if self._stop.is_set() else "finished"
+        except BaseException as e:
+            self.state = "failed"
+            self._error("source", e)
+            raise
+        finally:
+            print(f"Ingestão encerrada ({self.ingested} posts, estado: {self.state}).")
+
+    def status(self) -> Dict[str, Any]:
+        """Estado da ingestão para `/corpus/stats`: parada ou sem gravar há muito tempo = corpus velho."""
+        return {
+            "state": self.state,
+            "alive": bool(self._thread and self._thread.is_alive()),
+            "ingested": self.ingested,
+            "dropped": self.dropped,
+            "errors": dict(self.errors),
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "last_flush_at": self.last_flush_at,
+            "seconds_since_flush": None if self.last_flush_at is None else round(time.time() - self.last_flush_at, 1),
+            "source": self.source.stats() if hasattr(self.source, "stats") else {},
+        }
+
+
+def record_events(path: str, seconds: float, url: str = DEFAULT_JETSTREAM_URL) -> int:
+    """Grava eventos do Jetstream em JSONL para uso com `ReplaySource`."""
+    stop = threading.Event()
+    deadline = time.monotonic() + seconds
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for event in JetstreamSource(url).events(stop):
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            count += 1
+            if time.monotonic() >= deadline:
+                stop.set()
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Grava eventos do Jetstream para replay local.")
+    ap.add_argument("--record", required=True, help="arquivo JSONL de saída")
+    ap.add_argument("--seconds", type=float, default=60.0)
+    ap.add_argument("--url", default=DEFAULT_JETSTREAM_URL)
+    args = ap.parse_args()
+    print(f"{record_events(args.record, args.seconds, args.url)} eventos gravados em {args.record}.")
@@ -0,0 +1,92 @@
+# src/services/lexical.py
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence
+
+_TOKEN_RE = re.compile(r"[#@]?\w+", re.UNICODE)
+
+# palavras de pergunta que não discriminam posts ("qual a percepção sobre ...")
+STOPWORDS = frozenset(
+    "qual quais que quem como onde quando porque por para sobre com sem dos das do da de em no na nos nas "
+    "os as um uma uns umas ao aos se ser esta este isso essa esse sao foi tem ha mais muito pessoas "
+    "what which who how where when why about the and for with from are is was does do of in on to".split()
+)
+
+
+def _fold(text: str) -> str:
+    # "Ação" e "acao" caem no mesmo termo
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenização barata (minúsculas, sem acentos, >1 caractere) para índices lexicais."""
+    return [t for t in _TOKEN_RE.findall(_fold(text or "")) if len(t) > 1]
+
+
+def query_terms(*texts: str) -> List[str]:
+    """Termos distintos da consulta, sem stopwords (ordem preservada)."""
+    return list(dict.fromkeys(t for text in texts for t in tokenize(text) if t not in STOPWORDS))
+
+
+class BM25Scorer:
+    """
+    BM25 (Okapi) sobre um lote de posts, montado incrementalmente (página a
+    página, enquanto a próxima ainda baixa) e pontuado com numpy.
+
+    Como a consulta é conhecida antes, cada documento guarda só as frequências
+    dos termos da consulta e o seu comprimento: a pontuação é uma matriz
+    (documentos x termos) em vez de um índice invertido do vocabulário todo.
+    """
+
+    def __init__(self, terms: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.terms = list(terms)
+        self._col: Dict[str, int] = {t: j for j, t in enumerate(self.terms)}
+        self.k1 = k1
+        self.b = b
+        self._rows: List[List[int]] = []
+        self._lengths: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, texts: Sequence[str]) -> None:
+        for text in texts:
+            tokens = tokenize(text)
+            row = [0] * len(self.terms)
+            for term, n in Counter(t for t in tokens if t in self._col).items():
+                row[self._col[term]] = n
+            self._rows.append(row)
+            self._lengths.append(len(tokens))
+
+    def scores(self):
+        """Pontuação BM25 de cada documento (array numpy, na ordem de `add`)."""
+        import numpy as np
+
+        n_docs = len(self._lengths)
+        if not n_docs or not self.terms:
+            return np.zeros(n_docs, dtype=np.float32)
+        tf = np.asarray(self._rows, dtype=np.float32)
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        return ((tf * (self.k1 + 1)) / (tf + norm[:, None])) @ idf
+
+    def top(self, n: int, min_matches: int = 1):
+        """
+        Índices dos `n` melhores documentos (em ordem de pontuação) e quantos
+        tiveram algum termo da consulta. Com menos de `min_matches` casados,
+        retorna None: a pergunta não tem termos que discriminem os posts.
+        """
+        import numpy as np
+
+        scores = self.scores()
+        matched = int((scores > 0).sum())
+        if matched < min_matches:
+            return None, matched
+        n = min(n, len(scores))
+        # estável: empates (inclusive sem termos) mantêm a ordem da busca do Bluesky
+        order = np.argsort(-scores, kind="stable")[:n]
+        return order.tolist(), matched
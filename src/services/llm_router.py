@@ -0,0 +1,280 @@
+# src/services/llm_router.py
+"""
+Contabilidade de uso por modelo, telemetria de latência/erros e roteamento `auto`.
+
+- Uso de tokens vem do `usage_metadata` das respostas (OpenAI e Gemini), com
+  custo calculado pela tabela de preços (USD por 1M tokens, LLM_MODEL_PRICES).
+- `ModelStats` guarda uma janela deslizante (tempo + tamanho) de latências e
+  falhas por modelo, mais totais acumulados de tokens/custo, por processo.
+- `LLMRouter.plan` ordena os candidatos: dentro do teto de custo estimado, o de
+  menor p95 recente primeiro. `LLMRouter.run` chama o primeiro e, se ele falhar
+  ou passar do tempo de hedge, dispara o próximo (outro provedor) em paralelo e
+  fica com a primeira resposta que chegar. As chamadas que perderam recebem o
+  sinal de cancelamento (`threading.Event`) e fecham o stream no próximo chunk.
+"""
+from __future__ import annotations
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from src.services.admission import STAGE_GATES
+from src.services.deadline import Aborted
+
+AUTO = "auto"
+
+# USD por 1M tokens (entrada, saída); sobrescreva com LLM_MODEL_PRICES='{"modelo": [in, out]}'
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-1.5-flash-latest": (0.075, 0.30),
+}
+PRICES: Dict[str, Tuple[float, float]] = {
+    **DEFAULT_PRICES,
+    **{k: tuple(v) for k, v in json.loads(os.getenv("LLM_MODEL_PRICES") or "{}").items()},
+}
+
+AUTO_MODELS = [m.strip() for m in os.getenv("LLM_AUTO_MODELS", "gpt-4o-mini,gemini-1.5-flash-latest").split(",") if m.strip()]
+AUTO_MAX_COST_USD = float(os.getenv("LLM_AUTO_MAX_COST_USD", "0.002"))
+# 0 = adaptativo (1.5 x p95 recente do modelo escolhido, entre 2s e 20s)
+HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))
+STATS_WINDOW_S = float(os.getenv("LLM_STATS_WINDOW_S", "900"))
+PRIOR_P95_S = float(os.getenv("LLM_PRIOR_P95_S", "4.0"))   # modelos ainda sem amostras
+EXPECTED_COMPLETION_TOKENS = 300                             # ~150 palavras em português
+HEDGE_LOST = "hedge_lost"                                    # motivo do `Aborted` da chamada que perdeu
+
+# call(modelo, cancel) -> (resultado, uso); `cancel` setado = parar (levantar `Aborted`)
+LLMCall = Callable[[str, threading.Event], Tuple[Any, Dict[str, int]]]
+
+
+def provider_of(model: str) -> str:
+    if "gpt" in model:
+        return "openai"
+    if "gemini" in model:
+        return "google"
+    return "other"
+
+
+def estimate_prompt_tokens(*texts: str) -> int:
+    """Estimativa barata (~4 caracteres por token) para o teto de custo."""
+    return math.ceil(sum(len(t) for t in texts) / 4)
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1e6
+
+
+def usage_from_result(result) -> Dict[str, int]:
+    """Tokens de um `LLMResult`: `usage_metadata` da mensagem, ou `token_usage` do provedor."""
+    prompt = completion = 0
+    found = False
+    for generations in result.generations:
+        for gen in generations:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                found = True
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+    if not found:
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def usage_callback():
+    """Callback do LangChain que soma o uso de todas as chamadas ao LLM da chain."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCallback(BaseCallbackHandler):
+        def __init__(self):
+            self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+        def on_llm_end(self, response, **kwargs):
+            for key, value in usage_from_result(response).items():
+                self.usage[key] += value
+
+    return UsageCallback()
+
+
+# --- Telemetria -------------------------------------------------------------
+@dataclass
+class _ModelWindow:
+    events: Deque[Tuple[float, float, bool]] = field(default_factory=lambda: deque(maxlen=500))  # (ts, latência, ok)
+    requests: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+
+
+class ModelStats:
+    def __init__(self, window_s: float = STATS_WINDOW_S):
+        self.window_s = window_s
+        self._models: Dict[str, _ModelWindow] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float, ok: bool, usage: Optional[Dict[str, int]] = None) -> None:
+        with self._lock:
+            w = self._models.setdefault(model, _ModelWindow())
+            w.events.append((time.time(), latency, ok))
+            w.requests += 1
+            w.errors += 0 if ok else 1
+            if usage:
+                w.prompt_tokens += usage.get("prompt_tokens", 0)
+                w.completion_tokens += usage.get("completion_tokens", 0)
+                w.cost_usd += cost_usd(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    def _recent(self, model: str) -> List[Tuple[float, float, bool]]:
+        w = self._models.get(model)
+        if w is None:
+            return []
+        cutoff = time.time() - self.window_s
+        return [e for e in w.events if e[0] >= cutoff]
+
+    def p95(self, model: str) -> Optional[float]:
+        with self._lock:
+            lat = sorted(l for _, l, ok in self._recent(model) if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, math.ceil(0.95 * len(lat)) - 1)]
+
+    def error_rate(self, model: str) -> float:
+        with self._lock:
+            recent = self._recent(model)
+        return sum(1 for _, _, ok in recent if not ok) / len(recent) if recent else 0.0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for model in list(self._models):
+            p95 = self.p95(model)
+            with self._lock:
+                w = self._models[model]
+                recent = self._recent(model)
+                out[model] = {
+                    "window_requests": len(recent),
+                    "p95_s": round(p95, 3) if p95 is not None else None,
+                    "error_rate": round(sum(1 for _, _, ok in recent if not ok) / len(recent), 3) if recent else 0.0,
+                    "requests": w.requests,
+                    "errors": w.errors,
+                    "prompt_tokens": w.prompt_tokens,
+                    "completion_tokens": w.completion_tokens,
+                    "cost_usd": round(w.cost_usd, 6),
+                }
+        return out
+
+
+STATS = ModelStats()
+
+
+# --- Roteamento -------------------------------------------------------------
+def default_pool_size() -> int:
+    """
+    Threads das chamadas com hedge: 2x as vagas de LLM do worker (primária +
+    hedge de cada uma), para o hedge nunca esperar atrás das primárias em voo.
+    Sem limite na etapa (0), 2x as análises simultâneas (ADMISSION_MAX_ACTIVE).
+    """
+    limit = STAGE_GATES["llm"].limit or int(os.getenv("ADMISSION_MAX_ACTIVE", "8"))
+    return int(os.getenv("LLM_POOL_SIZE", "0")) or 2 * max(1, limit)
+
+
+class LLMRouter:
+    def __init__(self, stats: ModelStats = STATS, models: Sequence[str] = AUTO_MODELS, max_workers: int = 0):
+        self.stats = stats
+        self.models = list(models)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or default_pool_size(), thread_name_prefix="llm")
+
+    def expected_p95(self, model: str) -> float:
+        p95 = self.stats.p95(model)
+        return PRIOR_P95_S if p95 is None else p95
+
+    def plan(self, prompt_tokens: int, max_cost_usd: Optional[float] = None) -> List[str]:
+        """
+        Candidatos em ordem de preferência: dentro do teto de custo estimado e com
+        menos de 50% de falhas recentes, o menor p95 primeiro; os demais ficam
+        como fallback (do mais barato ao mais caro). Se nenhum couber no teto,
+        o mais barato vai primeiro.
+        """
+        ceiling = AUTO_MAX_COST_USD if max_cost_usd is None else max_cost_usd
+
+        def est_cost(m):
+            return cost_usd(m, prompt_tokens, EXPECTED_COMPLETION_TOKENS)
+
+        eligible = [m for m in self.models if est_cost(m) <= ceiling and self.stats.error_rate(m) < 0.5]
+        eligible.sort(key=self.expected_p95)
+        rest = sorted((m for m in self.models if m not in eligible), key=est_cost)
+        return eligible + rest
+
+    def _timed(self, model: str, call: LLMCall, cancel: threading.Event):
+        t0 = time.perf_counter()
+        try:
+            result, usage = call(model, cancel)
+        except Aborted:  # cancelada por nós (prazo/desconexão): não é falha do modelo
+            raise
+        except Exception:
+            self.stats.record(model, time.perf_counter() - t0, ok=False)
+            raise
+        self.stats.record(model, time.perf_counter() - t0, ok=True, usage=usage)
+        return result, usage
+
+    def call(self, model: str, call: LLMCall):
+        """Chamada direta (modelo escolhido pelo usuário), registrando a telemetria."""
+        return self._timed(model, call, threading.Event())
+
+    def run(self, plan: Sequence[str], call: LLMCall):
+        """
+        Chamada com hedge: começa pelo primeiro do plano; se ele falhar ou não
+        responder em `hedge_after`, dispara o próximo de outro provedor (o
+        primeiro continua valendo se terminar antes). Retorna
+        (modelo, resultado, uso, hedged). Se todos falharem, relança o último erro.
+        Ao sair (resposta, erro ou `Aborted`), as chamadas ainda em voo são
+        canceladas: cada uma tem seu `cancel`, checado por `call` entre chunks.
+        """
+        primary = plan[0]
+        fallbacks = [m for m in plan[1:] if provider_of(m) != provider_of(primary)] or list(plan[1:])
+        hedge_after = HEDGE_AFTER_S or min(20.0, max(2.0, 1.5 * self.expected_p95(primary)))
+
+        cancels: Dict[Any, threading.Event] = {}
+
+        def submit(model):
+            ctx = contextvars.copy_context()  # spans das chamadas continuam no trace da requisição
+            cancel = threading.Event()
+            fut = self._pool.submit(ctx.run, self._timed, model, call, cancel)
+            cancels[fut] = cancel
+            return fut
+
+        running = {submit(primary): primary}
+        hedged = False
+        last_error: Optional[BaseException] = None
+        timeout: Optional[float] = hedge_after
+        try:
+            while running:
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    model = running.pop(fut)
+                    try:
+                        result, usage = fut.result()
+                        return model, result, usage, hedged
+                    except Aborted:
+                        raise  # sem prazo ou sem cliente: não adianta tentar outro provedor
+                    except Exception as e:
+                        last_error = e
+                if fallbacks and (not done or not running):
+                    # tempo de hedge estourou ou o modelo em voo falhou: entra o próximo
+                    model = fallbacks.pop(0)
+                    running[submit(model)] = model
+                    hedged = True
+                timeout = hedge_after if fallbacks else None
+            raise last_error if last_error else RuntimeError("Nenhum modelo disponível.")
+        finally:
+            for fut in running:  # perdedoras: param de gerar (e de cobrar) no próximo chunk
+                fut.cancel()  # ainda na fila do pool: nem começa
+                cancels[fut].set()
+
+
+ROUTER = LLMRouter()
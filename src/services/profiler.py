@@ -0,0 +1,94 @@
+# src/services/profiler.py
+"""
+Profiler por amostragem, por requisição (opt-in, ex.: `POST /analyze?profile=1`).
+
+Uma thread auxiliar lê `sys._current_frames()` a cada `interval` segundos e
+conta as pilhas das threads que entraram na requisição com
+`attach_current_thread()` (a do threadpool que roda o pipeline e as que ele
+iniciou com o contexto copiado). A thread que abre o profiler não entra: no
+servidor ela é a do event loop, e as pilhas dela seriam das outras requisições.
+A saída é o formato "collapsed" (uma pilha por linha, `a;b;c N`), aceito por
+flamegraph.pl, speedscope e inferno.
+"""
+from __future__ import annotations
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+_active: contextvars.ContextVar[Optional["SamplingProfiler"]] = contextvars.ContextVar("active_profiler", default=None)
+
+
+def attach_current_thread() -> None:
+    """Inclui a thread atual no profiler da requisição corrente (no-op sem profiler)."""
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.add_thread()
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace(os.sep, "/")
+    short = "/".join(path.rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_duration: float = 300.0):
+        self.interval = interval
+        self.max_duration = max_duration
+        self._threads: Dict[int, str] = {}
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._token = None
+        self._t0 = self._t1 = 0.0
+
+    def add_thread(self, thread: Optional[threading.Thread] = None) -> None:
+        thread = thread or threading.current_thread()
+        self._threads[thread.ident] = thread.name
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._token = _active.set(self)
+        self._t0 = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self._t1 = time.perf_counter()
+        _active.reset(self._token)
+
+    def _run(self) -> None:
+        deadline = time.perf_counter() + self.max_duration
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            for ident, name in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name)
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format": "collapsed",
+            "interval_ms": self.interval * 1e3,
+            "samples": self._samples,
+            "duration_s": round(self._t1 - self._t0, 3),
+            "threads": sorted(set(self._threads.values())),
+            "collapsed": self.collapsed(),
+        }
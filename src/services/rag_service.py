@@ -1,18 +1,420 @@
 # src/services/rag_service.py
+import contextvars
+import math
 import os
+import queue
+import threading
+from functools import lru_cache
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional
 from src.clients.bluesky_client import BlueskyClient
 from src.core.config import settings
+from src.core.post_batch import PostBatch, PostFilters
 
-# Imports do LangChain
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain.callbacks import get_openai_callback  # <-- for token accounting
+# LangChain, FAISS, torch and the provider SDKs are imported lazily inside the
+# functions that need them (or up front via warmup()), so importing this module
+# -- and src.main -- stays cheap for startup, autoscaling and --reload.
 
 from src.services.timing import stage  # <-- our helper
+from src.services.admission import stage_slot
+from src.services.deadline import (
+    DEADLINE_STATS,
+    LLM_MIN_BUDGET_S,
+    Aborted,
+    DeadlineExceeded,
+    current_deadline,
+    use_deadline,
+)
+from src.services.profiler import attach_current_thread
+from src.services.tracing import end_span, span, start_span
+from src.services.lexical import BM25Scorer, query_terms
+from src.services.llm_router import (
+    AUTO,
+    EXPECTED_COMPLETION_TOKENS,
+    HEDGE_LOST,
+    ROUTER,
+    cost_usd,
+    estimate_prompt_tokens,
+    usage_callback,
+    usage_from_result,
+)
+from src.services.vector_index import IndexBuilder
+
+if TYPE_CHECKING:
+    from src.services.corpus import RollingCorpus
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+# Pages buffered between the fetch thread and the embedder (backpressure)
+PAGE_QUEUE_SIZE = int(os.getenv("RAG_PAGE_QUEUE_SIZE", "2"))
+# Lexical cascade: BM25 ranks every fetched post, only the top N get embedded
+CASCADE_DEFAULT = os.getenv("RAG_CASCADE", "false").lower() in ("1", "true", "yes")
+CASCADE_MIN_CANDIDATES = int(os.getenv("RAG_CASCADE_MIN_CANDIDATES", "100"))
+CASCADE_PER_K = int(os.getenv("RAG_CASCADE_PER_K", "25"))
+EMBED_CHUNK = 100
+PARTIAL_ANSWER = (
+    "A análise não terminou dentro do prazo: seguem as fontes encontradas até aqui, sem a resposta do modelo."
+)
+
+_DONE = object()
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Process-wide embedding model, shared by requests and the ingestion thread."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+def _build_llm(llm_model: str, timeout: Optional[float] = None):
+    # keep your current model switch :contentReference[oaicite:9]{index=9}
+    # with a deadline, the provider call is bounded by what is left of it (no retries past it)
+    limits = {"timeout": timeout, "max_retries": 0} if timeout is not None else {}
+    if "gpt" in llm_model:
+        from langchain_openai import ChatOpenAI
+
+        os.environ["OPENAI_API_KEY"] = settings.OPENAI_API_KEY
+        # stream_usage: token counts also arrive when the answer is streamed
+        return ChatOpenAI(model=llm_model, temperature=0.3, stream_usage=True, **limits)
+    if "gemini" in llm_model:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        os.environ["GOOGLE_API_KEY"] = settings.GOOGLE_API_KEY
+        return ChatGoogleGenerativeAI(model=llm_model, temperature=0.3, **limits)
+    raise ValueError("Modelo de LLM inválido ou não suportado.")
+
+
+def warmup(exercise: bool = True) -> None:
+    """
+    Explicit preload: imports the ML/LLM stacks and loads + exercises the
+    embedding model so the first request does not pay for it.
+
+    `exercise=False` only loads the weights: used in the gunicorn master before
+    fork (workers share the pages copy-on-write), where running inference would
+    start torch's thread pools in a process that is about to fork.
+    """
+    # only what the request path imports (`PROMPT | llm`, the FAISS index, callbacks)
+    import langchain.prompts  # noqa: F401
+    import langchain_community.docstore.in_memory  # noqa: F401
+    import langchain_community.vectorstores  # noqa: F401
+    import langchain_core.callbacks  # noqa: F401
+    import langchain_google_genai  # noqa: F401
+    import langchain_openai  # noqa: F401
+
+    embeddings = get_embeddings()
+    if exercise:
+        embeddings.embed_query("warmup")
+
+
+def _produce_pages(pages_iter, pages: queue.Queue, stop: threading.Event, timings: dict):
+    """Fetch thread: pulls pages from the client into a bounded queue."""
+    attach_current_thread()
+    deadline = current_deadline()
+    item = _DONE
+    n_page = 0
+    try:
+        while not stop.is_set():
+            if deadline.over_budget("fetch"):
+                deadline.truncate("fetch")  # carry on with the pages we already have
+                break
+            try:
+                with stage_slot("fetch", timings), stage(timings, "fetch_posts", page=n_page) as s:
+                    page = next(pages_iter, _DONE)
+                    s.set_attribute("posts", 0 if page is _DONE else len(page))
+            except DeadlineExceeded:  # the budget ran out while queued for a slot
+                deadline.truncate("fetch")
+                break
+            if page is _DONE:
+                break
+            n_page += 1
+            # blocks while the embedder is behind, but wakes up to honour `stop`
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    except Exception as e:  # surfaced to the consumer
+        item = e
+    finally:
+        while True:
+            try:
+                pages.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if stop.is_set():  # consumer already gone
+                    break
+
+
+def _embed(builder: IndexBuilder, texts, metadatas, stats: dict) -> None:
+    with span("encode", texts=len(texts)):
+        t0 = perf_counter()
+        vectors = builder.embeddings.embed_documents(texts)
+        DEADLINE_STATS.observe_embed(len(texts), perf_counter() - t0)
+    with span("index_add", index_kind=builder.kind):
+        builder.add(texts, vectors, metadatas)
+    stats["embedded_posts"] = stats.get("embedded_posts", 0) + len(texts)
+
+
+def _stream_index(pages: queue.Queue, builder: IndexBuilder, batch: PostBatch, timings: dict, stats: dict):
+    """Embeds each page as it arrives and appends it to the FAISS index."""
+    deadline = current_deadline()
+    n_page = 0
+    while True:
+        page = pages.get()
+        if page is _DONE:
+            break
+        if isinstance(page, BaseException):
+            raise page
+        if deadline.over_budget("embed"):
+            # out of embedding budget: keep the post for the response, index what is done
+            deadline.truncate("embed")
+            batch.extend(page)
+            break
+        # the slot is per page, so concurrent requests interleave instead of piling onto the CPU
+        offset = len(batch)
+        batch.extend(page)
+        try:
+            with stage_slot("embed", timings), stage(timings, "embed_index", page=n_page, posts=len(page)):
+                # metadata carries the batch row so retrieval maps back without text lookups
+                _embed(builder, page.texts, [{"i": offset + j} for j in range(len(page))], stats)
+        except DeadlineExceeded:  # the budget ran out while queued for a slot
+            deadline.truncate("embed")
+            break
+        n_page += 1
+    with stage(timings, "embed_index", step="finish", index_kind=builder.kind):
+        return builder.finish()
+
+
+def cascade_size(top_k: int) -> int:
+    """Candidates kept by the lexical stage: grows with top_k so recall holds for larger k."""
+    return max(CASCADE_MIN_CANDIDATES, CASCADE_PER_K * top_k)
+
+
+def _cascade_index(
+    pages: queue.Queue, builder: IndexBuilder, batch: PostBatch, timings: dict, stats: dict, question: str, top_k: int
+):
+    """
+    Two-stage variant of `_stream_index`: pages are only tokenized as they
+    arrive (cheap, still overlapped with the download); once the last page is
+    in, BM25 picks the top `cascade_size(top_k)` posts and only those are
+    embedded for the dense re-ranking. Questions with (almost) no lexical
+    overlap with the posts fall back to embedding everything.
+    """
+    deadline = current_deadline()
+    scorer = BM25Scorer(query_terms(question))
+    while True:
+        page = pages.get()
+        if page is _DONE:
+            break
+        if isinstance(page, BaseException):
+            raise page
+        deadline.check()
+        with stage(timings, "lexical", step="tokenize", posts=len(page)):
+            batch.extend(page)
+            scorer.add(page.texts)
+
+    n_candidates = cascade_size(top_k)
+    with stage(timings, "lexical", step="rank", terms=len(scorer.terms)) as s:
+        rows, matched = scorer.top(n_candidates, min_matches=top_k) if len(batch) > n_candidates else (None, 0)
+        s.set_attribute("matched", matched)
+    if rows is None:
+        rows = list(range(len(batch)))
+    stats["cascade_candidates"] = len(rows)
+    stats["cascade_matched"] = matched
+
+    for start in range(0, len(rows), EMBED_CHUNK):
+        if deadline.over_budget("embed"):
+            deadline.truncate("embed")
+            break
+        chunk = rows[start:start + EMBED_CHUNK]
+        try:
+            with stage_slot("embed", timings), stage(timings, "embed_index", posts=len(chunk), step="cascade"):
+                _embed(builder, [batch.texts[i] for i in chunk], [{"i": i} for i in chunk], stats)
+        except DeadlineExceeded:  # the budget ran out while queued for a slot
+            deadline.truncate("embed")
+            break
+    with stage(timings, "embed_index", step="finish", index_kind=builder.kind):
+        return builder.finish()
+
+
+def fetch_and_index(
+    bsky_client: BlueskyClient,
+    topic: str,
+    post_limit: int,
+    timings: dict,
+    filters: Optional[PostFilters] = None,
+    question: Optional[str] = None,
+    top_k: int = 6,
+    stats: Optional[dict] = None,
+):
+    """
+    Overlaps Bluesky paging with embedding: page N+1 downloads while page N is
+    encoded. Returns (batch, vector_store); vector_store is None when no posts.
+    With `question`, runs the lexical cascade instead (see `_cascade_index`).
+    `timings` gets per-stage seconds; counts and ratios go to `stats`.
+    """
+    deadline = current_deadline()
+    stats = {} if stats is None else stats
+    batch = PostBatch()
+    pages: queue.Queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    stop = threading.Event()
+    t0 = perf_counter()
+    # the fetch thread runs in a copy of this context, so its spans nest under the request trace
+    producer = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_produce_pages, bsky_client.search_posts(query=topic, limit=post_limit, filters=filters), pages, stop, timings),
+        name="bsky-fetch",
+        daemon=True,
+    )
+    n_expected = min(post_limit, cascade_size(top_k)) if question else post_limit
+    producer.start()
+    try:
+        # model load also overlaps with the first page download
+        with stage(timings, "embed_index", step="model_load"):
+            with span("model_load", cached=get_embeddings.cache_info().currsize > 0):
+                embeddings = get_embeddings()
+            builder = IndexBuilder(embeddings, EMBEDDING_DIM, n_expected=n_expected)
+        if question:
+            vector_store = _cascade_index(pages, builder, batch, timings, stats, question, top_k)
+        else:
+            vector_store = _stream_index(pages, builder, batch, timings, stats)
+    finally:
+        stop.set()
+        producer.join()
+        if deadline.cancelled or deadline.truncated:
+            # embeddings that never ran: the rest of the fetch (estimated by post_limit) or of the fetched posts
+            fetch_cut = deadline.cancelled or "fetch" in deadline.truncated
+            expected = n_expected if fetch_cut else stats.get("cascade_candidates", len(batch))
+            skipped = max(0, expected - stats.get("embedded_posts", 0))
+            deadline.save(cpu_s=DEADLINE_STATS.embed_cost(skipped))
+
+    wall = perf_counter() - t0
+    fetch, embed = timings.get("fetch_posts", 0.0), timings.get("embed_index", 0.0)
+    timings["fetch_embed_wall"] = round(wall, 3)
+    # time saved vs. running both stages back to back; 1.0 means fully hidden
+    timings["overlap"] = round(max(0.0, fetch + embed - wall), 3)
+    shorter = min(fetch, embed)
+    stats["overlap_ratio"] = round(min(1.0, timings["overlap"] / shorter), 3) if shorter else 0.0
+    return batch, vector_store
+
+
+def _faiss_search(vector_store):
+    """Adapts a FAISS store to the pipeline's `search(question, k) -> [(row, score)]`."""
+    def search(question: str, k: int):
+        hits = vector_store.similarity_search_with_score(question, k=k)
+        return [(doc.metadata["i"], score) for doc, score in hits]
+    return search
+
+
+def index_from_corpus(
+    corpus: "RollingCorpus",
+    topic: str,
+    post_limit: int,
+    timings: dict,
+    filters: Optional[PostFilters] = None,
+):
+    """
+    Answers from the ingested rolling corpus: keyword lookup + prebuilt compact
+    embeddings, no Bluesky search calls and no re-encoding of the whole topic.
+    Dense retrieval covers every topic post in the window, not just the
+    `post_limit` most recent: small topics are scanned over the compact vectors,
+    large ones go through the corpus ANN index (HNSW/IVF-PQ). Approximate
+    candidates are re-scored against the stored full-precision originals.
+    """
+    with stage(timings, "corpus_lookup"):
+        batch, nearest = corpus.search(topic, post_limit, filters)
+    if nearest is None:
+        return batch, None
+    embeddings = get_embeddings()
+
+    def search(question: str, k: int):
+        query = embeddings.embed_query(question)
+        with span("corpus_search", index_kind=corpus.index_kind):
+            return nearest(query, k)
+
+    return batch, search
+
+
+def _llm_span_callback(llm_model: str):
+    """
+    LangChain callback that opens an `llm.request` span around the provider call
+    itself, so the `llm` stage splits into chain/prompt overhead vs. the request.
+    With streaming providers it also records time to first token (queueing)
+    separately from generation.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMSpanCallback(BaseCallbackHandler):
+        def __init__(self):
+            self.parent = None
+            self.request = None
+            self.first_token_at = None
+
+        def _start(self):
+            # callbacks may fire on another thread: parent is captured up front
+            self.request = start_span("llm.request", parent=self.parent, model=llm_model)
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self._start()
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self._start()
+
+        def on_llm_new_token(self, token, **kwargs):
+            if self.request is not None and self.first_token_at is None:
+                self.first_token_at = perf_counter()
+                self.request.set_attribute("time_to_first_token_s", round(self.request.duration_s, 3))
+
+        def on_llm_end(self, response, **kwargs):
+            if self.request is None:
+                return
+            attrs = usage_from_result(response)
+            if self.first_token_at is not None:
+                attrs["generation_s"] = round(perf_counter() - self.first_token_at, 3)
+            end_span(self.request, **attrs)
+            self.request = None
+
+        def on_llm_error(self, error, **kwargs):
+            if self.request is not None:
+                self.request.status = "ERROR"
+                end_span(self.request, error=f"{type(error).__name__}: {error}")
+                self.request = None
+
+    return LLMSpanCallback()
+
+
+def _chunk_text(chunk) -> str:
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # some providers stream a list of content parts
+    return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+
+
+def _partial_result(batch: PostBatch, sources: list, timings: dict, stats: dict, t_start: float) -> dict:
+    """Out of time before the answer: the sources found so far, without the LLM."""
+    current_deadline().partial = True
+    timings["total"] = round(perf_counter() - t_start, 3)
+    return {
+        "answer": PARTIAL_ANSWER,
+        "source_posts": batch.texts,
+        "raw_posts": batch.raw_posts(),
+        "sources": sources,
+        "timings": timings,
+        "stats": stats,
+        "tokens": {},
+        "partial": True,
+    }
+
+
+def _save_llm_call(model: str, prompt_tokens: int, completion_tokens: int = EXPECTED_COMPLETION_TOKENS) -> None:
+    """Books an LLM call (or the rest of one) that did not happen as saved."""
+    current_deadline().save(
+        tokens=prompt_tokens + completion_tokens, cost_usd=cost_usd(model, prompt_tokens, completion_tokens)
+    )
+
 
 def perform_rag_analysis(
     topic: str,
@@ -22,82 +424,97 @@ def perform_rag_analysis(
     bsky_client: BlueskyClient,
     top_k: int = 6,
     economy_mode: bool = False,
+    corpus: Optional["RollingCorpus"] = None,
+    filters: Optional[PostFilters] = None,
+    max_cost_usd: Optional[float] = None,
+    cascade: Optional[bool] = None,
+) -> dict:
+    attach_current_thread()
+    cascade = CASCADE_DEFAULT if cascade is None else cascade
+    # one Deadline object for the whole run (the request's, or an unbounded one)
+    deadline = current_deadline()
+    with use_deadline(deadline), span(
+        "rag_analysis",
+        topic=topic,
+        llm_model=llm_model,
+        post_limit=post_limit,
+        top_k=top_k,
+        source="corpus" if corpus is not None else "search",
+        cascade=cascade,
+        deadline_s=None if math.isinf(deadline.total_s) else round(deadline.total_s, 3),
+    ) as s:
+        try:
+            return _perform_rag_analysis(
+                topic, question, post_limit, llm_model, bsky_client, top_k, economy_mode, corpus, filters,
+                max_cost_usd, cascade,
+            )
+        except Aborted as e:
+            deadline.aborted_stage = deadline.aborted_stage or e.stage
+            s.set_attribute("aborted", e.reason)
+            raise
+        finally:
+            if deadline.truncated:
+                s.set_attribute("truncated", ",".join(deadline.truncated))
+            DEADLINE_STATS.record(deadline)
+
+
+def _perform_rag_analysis(
+    topic: str,
+    question: str,
+    post_limit: int,
+    llm_model: str,
+    bsky_client: BlueskyClient,
+    top_k: int,
+    economy_mode: bool,
+    corpus: Optional["RollingCorpus"],
+    filters: Optional[PostFilters],
+    max_cost_usd: Optional[float],
+    cascade: bool,
 ) -> dict:
-    timings = {}
+    timings = {}  # per-stage seconds
+    stats = {}    # counts and ratios (kept out of `timings`, which is summed/shown as seconds)
+    t_start = perf_counter()
+    deadline = current_deadline()
+    estimate_model = ROUTER.models[0] if llm_model == AUTO and ROUTER.models else llm_model
 
-    # 1) Fetch posts ---------------------------------------------------------
-    with stage(timings, "fetch_posts"):
-        posts = bsky_client.search_posts(query=topic, limit=post_limit)  # :contentReference[oaicite:5]{index=5}
-        post_texts = [getattr(getattr(p, "record", None), "text", "") for p in posts]
-        post_texts = [t for t in post_texts if t]
+    # 1+2) Fetch posts -> Embeddings + FAISS (streamed, page by page) --------
+    try:
+        if corpus is not None:
+            batch, search = index_from_corpus(corpus, topic, post_limit, timings, filters)
+        else:
+            batch, vector_store = fetch_and_index(
+                bsky_client, topic, post_limit, timings, filters,
+                question=question if cascade else None, top_k=top_k, stats=stats,
+            )
+            search = _faiss_search(vector_store) if vector_store is not None else None
+    except Aborted:
+        # the LLM call never happens either: ~top_k posts of ~70 tokens in the prompt
+        _save_llm_call(estimate_model, estimate_prompt_tokens(question) + 70 * top_k)
+        raise
 
-    if not post_texts:
+    if search is None and len(batch) and deadline.truncated:
+        # posts arrived, but the budget ran out before any was embedded
+        return _partial_result(batch, [], timings, stats, t_start)
+    if search is None:
         return {
             "answer": "Não foram encontrados posts suficientes sobre este tópico para realizar a análise.",
             "source_posts": [],
             "raw_posts": [],
             "sources": [],
             "timings": timings,
+            "stats": stats,
             "tokens": {},
         }
 
-    # Build rich metadata for UI cards (uri/author/avatar/…)
-    raw_posts = []
-    for post in posts:
-        author = getattr(post, "author", None)
-        record = getattr(post, "record", None)
-        raw_posts.append({
-            "uri": getattr(post, "uri", ""),
-            "author": {
-                "handle": getattr(author, "handle", "N/A"),
-                "display_name": getattr(author, "display_name", "N/A"),
-                "avatar": getattr(author, "avatar", None)
-            },
-            "record": {"text": getattr(record, "text", "")},
-            "like_count": getattr(post, "like_count", 0),
-            "repost_count": getattr(post, "repost_count", 0),
-        })  # mirrors your current structure :contentReference[oaicite:6]{index=6}
-
-    # 2) Embeddings + FAISS --------------------------------------------------
-    with stage(timings, "embed_index"):
-        model_name = "sentence-transformers/all-MiniLM-L6-v2"  # same as today :contentReference[oaicite:7]{index=7}
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-        vector_store = FAISS.from_texts(texts=post_texts, embedding=embeddings)  # :contentReference[oaicite:8]{index=8}
-
     # 3) Retrieve top-k with scores -----------------------------------------
+    deadline.check()
     with stage(timings, "retrieve"):
-        # Use the vector store directly to get scores
-        retrieved = vector_store.similarity_search_with_score(question, k=top_k)
-        # retrieved -> list[(Document, score)]
-        sources = []
-        for doc, score in retrieved:
-            # find original post meta by matching text
-            txt = doc.page_content
-            # naïve map: first index match (ok for demo; can improve with hash map)
-            try:
-                i = post_texts.index(txt)
-                meta = raw_posts[i]
-            except ValueError:
-                meta = {"uri": None, "author": {}, "record": {"text": txt}}
-            sources.append({
-                "uri": meta.get("uri"),
-                "author": meta.get("author", {}).get("handle"),
-                "avatar": meta.get("author", {}).get("avatar"),
-                "text": txt,
-                "score": float(score),
-                "created_at": None  # add if you later capture timestamps
-            })
-
-    # 4) Choose LLM and build RAG chain -------------------------------------
-    # keep your current model switch :contentReference[oaicite:9]{index=9}
-    if "gpt" in llm_model:
-        os.environ["OPENAI_API_KEY"] = settings.OPENAI_API_KEY
-        llm = ChatOpenAI(model=llm_model, temperature=0.3)
-    elif "gemini" in llm_model:
-        os.environ["GOOGLE_API_KEY"] = settings.GOOGLE_API_KEY
-        llm = ChatGoogleGenerativeAI(model=llm_model, temperature=0.3)
-    else:
-        raise ValueError("Modelo de LLM inválido ou não suportado.")
+        retrieved = search(question, top_k)
+        # retrieved -> list[(batch row, score)]
+        sources = [batch.source(i, score) for i, score in retrieved]
+
+    # 4) Build the RAG chain (per model, so "auto" can route/hedge) ----------
+    from langchain.prompts import PromptTemplate
 
     prompt_template = """
     Sua tarefa é atuar como um analista.
@@ -109,32 +526,102 @@ def perform_rag_analysis(
     """
     PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
 
-    # Use the same vector store as retriever (k can differ from top_k above) :contentReference[oaicite:10]{index=10}
-    retriever = vector_store.as_retriever(search_kwargs={"k": top_k})
-    rag_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever,
-                                            chain_type_kwargs={"prompt": PROMPT})
+    # "stuff" the already retrieved top-k into the prompt: the context is exactly
+    # the returned sources, and retrieval is not repeated by a chain retriever
+    # (same layout as create_stuff_documents_chain: one post per paragraph)
+    context = [batch.texts[i] for i, _ in retrieved]
+    chain_input = {"context": "\n\n".join(context), "question": question}
 
     # 5) Generate answer + tokens -------------------------------------------
-    token_info = {}
-    with stage(timings, "llm"):
-        if "gpt" in llm_model:
-            with get_openai_callback() as cb:
-                response = rag_chain.invoke(question)
-                token_info = {
-                    "prompt_tokens": cb.prompt_tokens,
-                    "completion_tokens": cb.completion_tokens,
-                    "total_tokens": cb.total_tokens,
-                    "cost_usd": round(cb.total_cost, 6),
-                }
+    prompt_tokens = estimate_prompt_tokens(prompt_template, question, *context)
+    if deadline.remaining("llm") < LLM_MIN_BUDGET_S:
+        # not enough time left for an answer: skip the call instead of paying for a timeout
+        deadline.truncate("llm")
+        _save_llm_call(estimate_model, prompt_tokens)
+        return _partial_result(batch, sources, timings, stats, t_start)
+
+    started = []  # models whose request actually went out
+    with stage(timings, "llm", model=llm_model, context_docs=len(context)) as llm_span:
+
+        def call(model: str, cancel: threading.Event):
+            attach_current_thread()  # hedged calls run on the router's pool
+            span_cb = _llm_span_callback(model)
+            span_cb.parent = llm_span
+            usage_cb = usage_callback()
+            with stage_slot("llm", timings):
+                deadline.check("llm")  # the slot wait may have used up the budget
+                if cancel.is_set():  # another hedged call already answered
+                    raise Aborted(HEDGE_LOST, "llm")
+                remaining = deadline.remaining("llm")
+                llm = _build_llm(model, timeout=None if math.isinf(remaining) else remaining)
+                # streamed so the deadline/disconnect is checked between chunks;
+                # closing the stream stops the generation (and its billing). No
+                # output parser: its transform drains the rest of the stream on close
+                chain = PROMPT | llm
+                started.append(model)
+                parts = []
+                stream = chain.stream(chain_input, config={"callbacks": [span_cb, usage_cb]})
+                try:
+                    for chunk in stream:
+                        parts.append(_chunk_text(chunk))
+                        deadline.check("llm")
+                        if cancel.is_set():  # lost the hedge: stop generating (and paying)
+                            raise Aborted(HEDGE_LOST, "llm")
+                except Aborted:
+                    left = max(0, EXPECTED_COMPLETION_TOKENS - estimate_prompt_tokens(*parts))
+                    _save_llm_call(model, 0, left)
+                    raise
+                finally:
+                    stream.close()
+            return "".join(parts), usage_cb.usage
+
+        hedged = False
+        try:
+            if llm_model == AUTO:
+                plan = ROUTER.plan(prompt_tokens, max_cost_usd)
+                llm_span.set_attribute("plan", ",".join(plan))
+                model, answer, usage, hedged = ROUTER.run(plan, call)
+            else:
+                model = llm_model
+                answer, usage = ROUTER.call(model, call)
+        except Exception as e:
+            cancelled = isinstance(e, Aborted) and not isinstance(e, DeadlineExceeded)
+            timed_out = isinstance(e, DeadlineExceeded) or (
+                not isinstance(e, Aborted) and deadline.remaining("llm") < 0.5  # provider timeout from the deadline
+            )
+            if not (cancelled or timed_out):
+                raise
+            if not started:
+                _save_llm_call(estimate_model, prompt_tokens)
+            if cancelled:
+                raise
+            llm_span.set_attribute("deadline_exceeded", True)
+            answer = None
+        if answer is None:
+            deadline.truncate("llm")
         else:
-            # Gemini: no built-in callback; return empty token_info
-            response = rag_chain.invoke(question)
+            llm_span.set_attribute("model", model)
+            llm_span.set_attribute("hedged", hedged)
+    if answer is None:
+        return _partial_result(batch, sources, timings, stats, t_start)
+
+    token_info = {
+        "model": model,
+        **usage,
+        "cost_usd": round(cost_usd(model, usage["prompt_tokens"], usage["completion_tokens"]), 6),
+    }
+    if llm_model == AUTO:
+        token_info["routed"] = True
+        token_info["hedged"] = hedged
 
+    timings["total"] = round(perf_counter() - t_start, 3)
     return {
-        "answer": response.get("result", "Não foi possível gerar uma resposta."),
-        "source_posts": post_texts,  # keeps your current fields for wordcloud :contentReference[oaicite:11]{index=11}
-        "raw_posts": raw_posts,
+        "answer": answer or "Não foi possível gerar uma resposta.",
+        "partial": False,
+        "source_posts": batch.texts,  # keeps your current fields for wordcloud :contentReference[oaicite:11]{index=11}
+        "raw_posts": batch.raw_posts(),  # dicts only materialized for the response
         "sources": sources,          # NEW: top-k with meta+score
         "timings": timings,          # NEW: per-stage seconds
-        "tokens": token_info,        # NEW: only filled on OpenAI
+        "stats": stats,              # counts/ratios of the pipeline stages
+        "tokens": token_info,        # NEW: usage + cost for every provider
     }
\ No newline at end of file
@@ -1,5 +1,7 @@
 # src/services/rate_limit.py
 from __future__ import annotations
+import sqlite3
+import threading
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
@@ -19,18 +21,44 @@ def _seconds_until_midnight_utc(now: Optional[datetime] = None) -> Tuple[int, in
 class RateLimiter:
     """
     - Contador diário por usuário (reseta no UTC midnight).
-    - Redis em produção; fallback em memória para dev.
+    - Redis em produção; sem Redis, um arquivo SQLite (`db_path`) compartilhado
+      pelos workers do mesmo host; fallback em memória (por processo) para dev.
+    - Com `redis_url` o Redis é obrigatório: sem o pacote, falha na criação em
+      vez de virar contador por processo (N workers = N x a cota).
     """
-    def __init__(self, redis_url: Optional[str] = None):
+    def __init__(self, redis_url: Optional[str] = None, db_path: Optional[str] = None):
         self.client = None
-        if redis_url and redis is not None:
+        if redis_url and redis is None:
+            # sem isso cada worker cairia num armazenamento próprio, sem avisar
+            raise RuntimeError("REDIS_URL definido, mas o pacote 'redis' não está instalado.")
+        if redis_url:
             self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.db_path = db_path if self.client is None else None
+        self._local = threading.local()
+        if self.db_path:
+            with self._conn() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_counters"
+                    " (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+                )
         self._mem = {}  # key -> (count, exp_ts)
 
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"rate:{user_id}:{datetime.now(timezone.utc):%Y%m%d}"
+
     def hit(self, user_id: str, limit: int) -> Tuple[int, int]:
         """Incrementa a cota; lança 429 se passar. Retorna (remaining, reset_ts)."""
         ttl, reset_ts = _seconds_until_midnight_utc()
-        key = f"rate:{user_id}:{datetime.now(timezone.utc):%Y%m%d}"
+        key = self._key(user_id)
 
         if self.client:
             new_val = self.client.incr(key)
@@ -46,6 +74,20 @@ class RateLimiter:
             remaining = max(0, limit - new_val)
             return remaining, reset_ts
 
+        if self.db_path:
+            # incremento atômico entre processos; o rollback desfaz o excedente
+            with self._conn() as conn:
+                (count,) = conn.execute(
+                    "INSERT INTO rate_counters (key, count, expires_at) VALUES (?, 1, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET count = count + 1 RETURNING count",
+                    (key, reset_ts),
+                ).fetchone()
+                if count > limit:
+                    raise HTTPException(status_code=429, detail="Limite diário atingido. Tente novamente após o reset.")
+                if count == 1:  # primeiro hit do dia: limpa contadores vencidos
+                    conn.execute("DELETE FROM rate_counters WHERE expires_at < ?", (time.time(),))
+            return max(0, limit - count), reset_ts
+
         # Fallback em memória (dev)
         now = time.time()
         count, exp = self._mem.get(key, (0, now + ttl))
@@ -59,3 +101,15 @@ class RateLimiter:
         self._mem[key] = (count, exp)
         remaining = limit - count
         return remaining, int(exp)
+
+    def refund(self, user_id: str) -> None:
+        """Devolve 1 da cota de hoje (requisição recusada antes de rodar, ex.: 503 por carga)."""
+        key = self._key(user_id)
+        if self.client:
+            self.client.decr(key)
+        elif self.db_path:
+            with self._conn() as conn:
+                conn.execute("UPDATE rate_counters SET count = MAX(0, count - 1) WHERE key = ?", (key,))
+        elif key in self._mem:
+            count, exp = self._mem[key]
+            self._mem[key] = (max(0, count - 1), exp)
@@ -0,0 +1,133 @@
+# src/services/snapshots.py
+"""
+Snapshots imutáveis das análises concluídas.
+
+Cada resposta do /analyze é gravada uma vez, já serializada (JSON comprimido),
+sob um id aleatório não adivinhável. Revisitar ou compartilhar a análise custa
+uma busca pela chave primária, sem Bluesky, embeddings ou LLM. O ETag é o hash
+do corpo: como o snapshot nunca muda, clientes podem guardar para sempre e
+revalidar com `If-None-Match`.
+
+- SQLite local (padrão, SNAPSHOT_DB);
+- Redis (SNAPSHOT_STORE=redis + REDIS_URL), compartilhado entre réplicas e
+  com expiração opcional (SNAPSHOT_TTL_DAYS).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+try:
+    import redis  # type: ignore
+except Exception:
+    redis = None  # fallback se não estiver instalado
+
+
+@dataclass
+class Snapshot:
+    id: str
+    etag: str
+    created_at: float
+    body: bytes  # JSON (UTF-8) pronto para a resposta
+
+    @classmethod
+    def from_row(cls, snapshot_id: str, etag: str, created_at: float, blob: bytes) -> "Snapshot":
+        return cls(snapshot_id, etag, float(created_at), zlib.decompress(blob))
+
+
+class SnapshotStore:
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        path: str = "snapshots.db",
+        use_redis: bool = False,
+        ttl_days: float = 0,
+        key_prefix: str = "snapshot:",
+    ):
+        self.client = None
+        if use_redis and redis_url and redis is None:
+            raise RuntimeError("SNAPSHOT_STORE=redis com REDIS_URL, mas o pacote 'redis' não está instalado.")
+        if use_redis and redis_url:
+            self.client = redis.Redis.from_url(redis_url)
+        self.path = path
+        self.ttl_s = int(ttl_days * 86400)
+        self.key_prefix = key_prefix
+        self._local = threading.local()
+        if self.client is None:
+            with self._conn() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS snapshots ("
+                    " id TEXT PRIMARY KEY, etag TEXT NOT NULL, created_at REAL NOT NULL,"
+                    " owner TEXT, body BLOB NOT NULL)"
+                )
+
+    def _conn(self) -> sqlite3.Connection:
+        # uma conexão por thread (handlers síncronos rodam no threadpool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self.client else "sqlite"
+
+    def save(self, payload: Dict[str, Any], owner: Optional[str] = None) -> Snapshot:
+        """Grava `payload` (já com o `snapshot_id`) e retorna o snapshot."""
+        snapshot_id = payload.get("snapshot_id") or new_snapshot_id()
+        body = json.dumps({**payload, "snapshot_id": snapshot_id}, ensure_ascii=False, separators=(",", ":")).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        created_at = time.time()
+        blob = zlib.compress(body, 6)
+        if self.client:
+            key = self.key_prefix + snapshot_id
+            pipe = self.client.pipeline()
+            pipe.hset(key, mapping={"etag": etag, "created_at": created_at, "owner": owner or "", "body": blob})
+            if self.ttl_s:
+                pipe.expire(key, self.ttl_s)
+            pipe.execute()
+        else:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO snapshots (id, etag, created_at, owner, body) VALUES (?, ?, ?, ?, ?)",
+                    (snapshot_id, etag, created_at, owner, blob),
+                )
+        return Snapshot(snapshot_id, etag, created_at, body)
+
+    def get(self, snapshot_id: str) -> Optional[Snapshot]:
+        if self.client:
+            row = self.client.hmget(self.key_prefix + snapshot_id, "etag", "created_at", "body")
+            if row[0] is None:
+                return None
+            return Snapshot.from_row(snapshot_id, row[0].decode(), row[1].decode(), row[2])
+        row = self._conn().execute(
+            "SELECT etag, created_at, body FROM snapshots WHERE id = ?", (snapshot_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl_s and time.time() - row[1] > self.ttl_s:
+            return None
+        return Snapshot.from_row(snapshot_id, *row)
+
+    def etag(self, snapshot_id: str) -> Optional[str]:
+        """Só o ETag (para responder 304 sem ler/descomprimir o corpo)."""
+        if self.client:
+            value = self.client.hget(self.key_prefix + snapshot_id, "etag")
+            return value.decode() if value is not None else None
+        row = self._conn().execute("SELECT etag, created_at FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+        if row is None or (self.ttl_s and time.time() - row[1] > self.ttl_s):
+            return None
+        return row[0]
+
+
+def new_snapshot_id() -> str:
+    return secrets.token_urlsafe(16)
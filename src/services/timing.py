@@ -2,10 +2,14 @@
 from contextlib import contextmanager
 from time import perf_counter
 
+from src.services.tracing import span
+
 @contextmanager
-def stage(timings: dict, name: str):
+def stage(timings: dict, name: str, **attributes):
+    """Soma a duração em `timings[name]` e abre um span `name` (aninhado no corrente)."""
     t0 = perf_counter()
     try:
-        yield
+        with span(name, **attributes) as s:
+            yield s
     finally:
         timings[name] = round(timings.get(name, 0.0) + (perf_counter() - t0), 3)
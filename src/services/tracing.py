@@ -0,0 +1,225 @@
+# src/services/tracing.py
+"""
+Tracing leve do pipeline: spans aninhados com atributos, propagados por
+contextvars (inclusive para threads iniciadas com `contextvars.copy_context()`).
+
+Cada trace (span raiz + filhos) é entregue aos exporters quando a raiz termina:
+- `console`: árvore indentada no stdout;
+- `file`   : uma linha JSON por trace, no formato OTLP/JSON (`resourceSpans`),
+             legível por ferramentas OpenTelemetry e útil offline;
+- `otlp`   : reenvia os spans para o SDK do OpenTelemetry, se instalado
+             (configurado pelas variáveis OTEL_* padrão).
+
+Configuração: TRACE_EXPORTERS=console,file,otlp  TRACE_FILE=traces.jsonl
+"""
+from __future__ import annotations
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "_trace")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self._trace: "_Trace" = parent._trace if parent else _Trace()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_s(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_s": round(self.duration_s, 6),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class _Trace:
+    """Spans finalizados de um trace (podem terminar em threads diferentes)."""
+    __slots__ = ("spans", "lock")
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Atributo no span corrente (no-op fora de um trace)."""
+    span = _current.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+# --- Exporters ---------------------------------------------------------------
+class ConsoleExporter:
+    def export(self, spans: List[Span]) -> None:
+        children: Dict[Optional[str], List[Span]] = {}
+        for s in sorted(spans, key=lambda s: s.start_ns):
+            children.setdefault(s.parent_id, []).append(s)
+
+        def walk(parent_id: Optional[str], depth: int) -> None:
+            for s in children.get(parent_id, []):
+                attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+                print(f"{'  ' * depth}{s.name} {s.duration_s * 1e3:.1f}ms {attrs}".rstrip())
+                walk(s.span_id, depth + 1)
+
+        walk(None, 0)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileExporter:
+    """Uma linha OTLP/JSON (`{"resourceSpans": [...]}`) por trace."""
+
+    def __init__(self, path: str, service_name: str = "askthesky-api"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "src.services.tracing"},
+                "spans": [{
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2 if s.status == "ERROR" else 1},
+                } for s in spans],
+            }],
+        }]}
+        line = json.dumps(payload, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class OTelExporter:
+    """Recria os spans no SDK do OpenTelemetry (mantendo horários e hierarquia)."""
+
+    def __init__(self):
+        from opentelemetry import trace  # type: ignore
+
+        self._trace = trace
+        self._tracer = trace.get_tracer("askthesky")
+
+    def export(self, spans: List[Span]) -> None:
+        created: Dict[str, Any] = {}
+        for s in sorted(spans, key=lambda s: s.start_ns):
+            parent = created.get(s.parent_id)
+            ctx = self._trace.set_span_in_context(parent) if parent is not None else None
+            otel_span = self._tracer.start_span(s.name, context=ctx, start_time=s.start_ns, attributes={
+                k: v if isinstance(v, (bool, int, float, str)) else str(v) for k, v in s.attributes.items()
+            })
+            if s.status == "ERROR":
+                otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+            created[s.span_id] = otel_span
+        for s in spans:
+            created[s.span_id].end(end_time=s.end_ns)
+
+
+def _exporters_from_env() -> list:
+    exporters = []
+    for name in filter(None, (n.strip() for n in os.getenv("TRACE_EXPORTERS", "").lower().split(","))):
+        if name == "console":
+            exporters.append(ConsoleExporter())
+        elif name == "file":
+            exporters.append(FileExporter(os.getenv("TRACE_FILE", "traces.jsonl")))
+        elif name == "otlp":
+            try:
+                exporters.append(OTelExporter())
+            except Exception as e:
+                print(f"Exporter OTLP indisponível (instale opentelemetry-sdk): {e}")
+        else:
+            raise ValueError(f"TRACE_EXPORTERS: exporter desconhecido '{name}'")
+    return exporters
+
+
+EXPORTERS = _exporters_from_env()
+
+
+# --- API ---------------------------------------------------------------------
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Abre um span filho do corrente (ou a raiz de um novo trace)."""
+    parent = _current.get()
+    s = Span(name, parent, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "ERROR"
+        s.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+        with s._trace.lock:
+            s._trace.spans.append(s)
+        if parent is None:
+            for exporter in EXPORTERS:
+                try:
+                    exporter.export(s._trace.spans)
+                except Exception as e:
+                    print(f"Falha ao exportar trace: {e}")
+
+
+def trace_spans(root: Span) -> List[Dict[str, Any]]:
+    """Spans já finalizados do trace de `root`, em ordem de início."""
+    with root._trace.lock:
+        return [s.to_dict() for s in sorted(root._trace.spans, key=lambda s: s.start_ns)]
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+    """Span manual (para callbacks que abrem/fecham em pontos distintos); finalize com `end_span`."""
+    return Span(name, parent or _current.get(), attributes)
+
+
+def end_span(s: Span, **attributes: Any) -> None:
+    s.attributes.update(attributes)
+    s.end_ns = time.time_ns()
+    with s._trace.lock:
+        s._trace.spans.append(s)
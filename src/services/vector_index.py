@@ -0,0 +1,199 @@
+# src/services/vector_index.py
+"""
+Tipos de índice FAISS para o RAG: exato (flat), HNSW e IVF-PQ.
+
+`FAISS.from_texts` sempre cria um `IndexFlatL2` (busca exata, custo linear).
+Aqui o tipo é configurável (RAG_INDEX_KIND) ou escolhido pelo tamanho do corpus
+(`IndexBuilder` para os posts de uma busca; `CorpusIndex` para o corpus rolante
+da ingestão contínua, o único que chega às centenas de milhares de vetores):
+- flat  : exato; ótimo até dezenas de milhares de vetores.
+- hnsw  : grafo navegável; busca sublinear com recall alto, memória ~ flat + grafo.
+- ivfpq : listas invertidas + product quantization; memória ~m bytes/vetor,
+          precisa de treino (buffer até ter pontos suficientes).
+"""
+from __future__ import annotations
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+INDEX_KINDS = ("flat", "hnsw", "ivfpq")
+
+
+@dataclass
+class IndexParams:
+    kind: str = "auto"
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 80
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 0          # 0 = automático (~4·√n)
+    ivf_nprobe: int = 16
+    pq_m: int = 48              # sub-quantizadores; precisa dividir a dimensão
+    pq_nbits: int = 8
+    # limites da seleção automática
+    auto_hnsw_min: int = 50_000
+    auto_ivfpq_min: int = 1_000_000
+    # corpus: tópicos com até tantos posts são varridos exatamente (vetores compactos), sem o ANN
+    exact_max: int = 20_000
+
+    @classmethod
+    def from_env(cls) -> "IndexParams":
+        env = os.getenv
+        return cls(
+            kind=env("RAG_INDEX_KIND", "auto").lower(),
+            hnsw_m=int(env("RAG_HNSW_M", "32")),
+            hnsw_ef_construction=int(env("RAG_HNSW_EF_CONSTRUCTION", "80")),
+            hnsw_ef_search=int(env("RAG_HNSW_EF_SEARCH", "64")),
+            ivf_nlist=int(env("RAG_IVF_NLIST", "0")),
+            ivf_nprobe=int(env("RAG_IVF_NPROBE", "16")),
+            pq_m=int(env("RAG_PQ_M", "48")),
+            pq_nbits=int(env("RAG_PQ_NBITS", "8")),
+            auto_hnsw_min=int(env("RAG_INDEX_AUTO_HNSW_MIN", "50000")),
+            auto_ivfpq_min=int(env("RAG_INDEX_AUTO_IVFPQ_MIN", "1000000")),
+            exact_max=int(env("RAG_INDEX_EXACT_MAX", "20000")),
+        )
+
+
+def choose_index_kind(n_vectors: int, params: IndexParams) -> str:
+    """Resolve `auto` pelo tamanho esperado do corpus."""
+    if params.kind != "auto":
+        if params.kind not in INDEX_KINDS:
+            raise ValueError(f"RAG_INDEX_KIND inválido: {params.kind}")
+        return params.kind
+    if n_vectors >= params.auto_ivfpq_min:
+        return "ivfpq"
+    if n_vectors >= params.auto_hnsw_min:
+        return "hnsw"
+    return "flat"
+
+
+def ivf_nlist(n_vectors: int, params: IndexParams) -> int:
+    return params.ivf_nlist or max(1, min(65_536, int(4 * math.sqrt(max(n_vectors, 1)))))
+
+
+def min_train_size(n_vectors: int, params: IndexParams) -> int:
+    """Pontos mínimos para treinar o IVF-PQ (k-means das listas e dos códigos PQ)."""
+    return max(ivf_nlist(n_vectors, params) * 39, 2 ** params.pq_nbits * 39)
+
+
+def make_faiss_index(kind: str, dim: int, n_vectors: int, params: IndexParams):
+    import faiss
+
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params.hnsw_m)
+        index.hnsw.efConstruction = params.hnsw_ef_construction
+        index.hnsw.efSearch = params.hnsw_ef_search
+        return index
+    if kind == "ivfpq":
+        if dim % params.pq_m:
+            raise ValueError(f"RAG_PQ_M={params.pq_m} precisa dividir a dimensão {dim}")
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, ivf_nlist(n_vectors, params), params.pq_m, params.pq_nbits)
+        index.nprobe = params.ivf_nprobe
+        return index
+    raise ValueError(f"Tipo de índice desconhecido: {kind}")
+
+
+@dataclass
+class IndexBuilder:
+    """
+    Monta um vector store do LangChain sobre o índice FAISS escolhido, aceitando
+    vetores em lotes (ex.: uma página por vez no pipeline em streaming).
+
+    IVF-PQ só recebe vetores depois de treinado: os lotes ficam em buffer até
+    haver pontos suficientes; se o corpus terminar antes disso, cai para flat.
+    """
+    embeddings: Any
+    dim: int
+    n_expected: int
+    params: IndexParams = field(default_factory=IndexParams.from_env)
+    kind: str = ""
+    _store: Any = None
+    _pending: List[tuple] = field(default_factory=list)
+    _pending_rows: int = 0
+
+    def __post_init__(self):
+        self.kind = self.kind or choose_index_kind(self.n_expected, self.params)
+
+    def _new_store(self, kind: str, n_vectors: int):
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=make_faiss_index(kind, self.dim, n_vectors, self.params),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+
+    def add(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], metadatas: List[Dict[str, Any]]) -> None:
+        if self._store is None and self.kind == "ivfpq":
+            self._pending.append((list(texts), list(vectors), metadatas))
+            self._pending_rows += len(texts)
+            if self._pending_rows >= min_train_size(max(self.n_expected, self._pending_rows), self.params):
+                self._flush_pending(self.kind)
+            return
+        if self._store is None:
+            self._store = self._new_store(self.kind, self.n_expected)
+        self._store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+
+    def _flush_pending(self, kind: str) -> None:
+        import numpy as np
+
+        self.kind = kind
+        self._store = self._new_store(kind, self._pending_rows)
+        if kind == "ivfpq":
+            train = np.asarray([v for _, vecs, _ in self._pending for v in vecs], dtype=np.float32)
+            self._store.index.train(train)
+        for texts, vectors, metadatas in self._pending:
+            self._store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        self._pending, self._pending_rows = [], 0
+
+    def finish(self):
+        """Retorna o vector store pronto (ou None se nada foi adicionado)."""
+        if self._pending:
+            # poucos pontos para treinar IVF-PQ com qualidade: busca exata é melhor (e barata) aqui
+            self._flush_pending("flat")
+        return self._store
+
+
+class CorpusIndex:
+    """
+    Índice ANN (HNSW ou IVF-PQ) do corpus rolante, endereçado pelo id do post
+    (`IndexIDMap`). Nenhum dos dois remove vetores de forma barata: ids expirados
+    são filtrados por quem busca e somem quando o corpus reconstrói o índice.
+    """
+
+    def __init__(self, kind: str, dim: int, n_vectors: int, params: IndexParams):
+        import faiss
+
+        self.kind = kind
+        self.index = faiss.IndexIDMap(make_faiss_index(kind, dim, n_vectors, params))
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def is_trained(self) -> bool:
+        return self.index.is_trained
+
+    def train(self, sample) -> None:
+        import numpy as np
+
+        self.index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+    def add(self, vectors, ids) -> None:
+        import numpy as np
+
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+    def search(self, query, k: int):
+        """(ids, distâncias L2²) dos `k` vizinhos aproximados; HNSW já devolve a distância exata."""
+        import numpy as np
+
+        dist, ids = self.index.search(np.asarray(query, dtype=np.float32).reshape(1, -1), k)
+        keep = ids[0] >= 0
+        return ids[0][keep], dist[0][keep]